@@ -0,0 +1,306 @@
+import asyncio
+import json
+import logging
+import os
+import tempfile
+import time
+from collections import deque
+from typing import Deque, Dict, Optional
+
+logger = logging.getLogger(__name__)
+
+# Outcomes an upstream attempt reports when it gives its slot back
+SUCCESS = "success"
+RATE_LIMITED = "rate_limited"
+TIMEOUT = "timeout"
+ERROR = "error"
+
+
+class LimitState:
+    """Learned limits and live concurrency of one provider key"""
+
+    __slots__ = ("api_type", "concurrency_limit", "calls_per_minute", "in_flight", "waiters",
+                 "last_decrease_at", "increases", "decreases", "updated_at")
+
+    def __init__(self, api_type: str, concurrency_limit: float, calls_per_minute: float):
+        self.api_type = api_type
+        self.concurrency_limit = concurrency_limit
+        self.calls_per_minute = calls_per_minute
+        self.in_flight = 0
+        self.waiters: Deque[asyncio.Future] = deque()
+        # Monotonic time of the last cut; answers to attempts sent before it don't cut again
+        self.last_decrease_at = 0.0
+        self.increases = 0
+        self.decreases = 0
+        self.updated_at = time.time()
+
+    def slots(self) -> int:
+        return max(1, int(self.concurrency_limit))
+
+
+class LimitSlot:
+    """One attempt's hold on a concurrency slot"""
+
+    __slots__ = ("state", "acquired_at")
+
+    def __init__(self, state: LimitState, acquired_at: float):
+        self.state = state
+        self.acquired_at = acquired_at
+
+
+class AdaptiveLimiter:
+    """
+    AIMD (additive increase, multiplicative decrease) limits per provider key.
+
+    Each key has a concurrency limit and a calls-per-minute rate, seeded from the static
+    ``api_limits`` guesses. Every successful attempt made while a limit was actually binding
+    (at least half used) grows it by about ``additive_increase`` per limit's worth of successes;
+    a 429 cuts both limits by ``decrease_factor`` (the rate never below the calls the provider
+    accepted in the current minute), and a timeout cuts the concurrency limit.
+    Only the first overload signal of a burst counts: attempts sent before the last cut were
+    sent under the old limit and say nothing about the new one.
+
+    Learned limits are saved to ``state_path`` and restored on start, so a restart neither
+    forgets a provider's real quota nor rediscovers it through a burst of 429s.
+    """
+
+    def __init__(self,
+                 enabled: bool = True,
+                 initial_concurrency: float = 8.0,
+                 min_concurrency: float = 1.0,
+                 max_concurrency: float = 64.0,
+                 min_calls_per_minute: float = 5.0,
+                 max_rate_multiplier: float = 4.0,
+                 additive_increase: float = 1.0,
+                 rate_increase: float = 5.0,
+                 decrease_factor: float = 0.7,
+                 state_path: Optional[str] = None):
+        self.enabled = enabled
+        self.initial_concurrency = initial_concurrency
+        self.min_concurrency = min_concurrency
+        self.max_concurrency = max_concurrency
+        self.min_calls_per_minute = min_calls_per_minute
+        # Learned rates may grow up to this multiple of the static guess
+        self.max_rate_multiplier = max_rate_multiplier
+        self.additive_increase = additive_increase
+        self.rate_increase = rate_increase
+        self.decrease_factor = decrease_factor
+        self.state_path = state_path
+
+        # key identifier -> state
+        self.limits: Dict[str, LimitState] = {}
+        # Static calls_per_minute per api_type, the starting point and growth cap
+        self.static_rates: Dict[str, float] = {}
+        # Limits restored from disk, applied when their key is first used
+        self._restored: Dict[str, Dict] = {}
+        self.dirty = False
+
+        # Metrics
+        self.stats = {
+            "slot_waits": 0,
+            "slot_wait_timeouts": 0,
+            "increases": 0,
+            "decreases": 0,
+            "ignored_overloads": 0,
+            "saves": 0,
+        }
+
+    def _state(self, api_type: str, key_identifier: str, static_rate: float) -> LimitState:
+        state = self.limits.get(key_identifier)
+        if state is None:
+            self.static_rates[api_type] = static_rate
+            state = LimitState(api_type, self.initial_concurrency, static_rate)
+            restored = self._restored.pop(key_identifier, None)
+            if restored:
+                self._apply(state, restored)
+            self.limits[key_identifier] = state
+        return state
+
+    def _apply(self, state: LimitState, saved: Dict):
+        state.concurrency_limit = self._clamp_concurrency(saved.get("concurrency_limit", state.concurrency_limit))
+        state.calls_per_minute = self._clamp_rate(state.api_type, saved.get("calls_per_minute", state.calls_per_minute))
+        state.updated_at = saved.get("updated_at", state.updated_at)
+
+    def _clamp_concurrency(self, value: float) -> float:
+        return min(self.max_concurrency, max(self.min_concurrency, float(value)))
+
+    def _clamp_rate(self, api_type: str, value: float) -> float:
+        ceiling = self.static_rates.get(api_type, value) * self.max_rate_multiplier
+        return min(ceiling, max(self.min_calls_per_minute, float(value)))
+
+    def calls_per_minute(self, api_type: str, key_identifier: str, static_rate: float) -> float:
+        """Per-minute budget for this key: the learned rate, or ``static_rate`` when adaptation is off"""
+        if not self.enabled:
+            return static_rate
+        return self._state(api_type, key_identifier, static_rate).calls_per_minute
+
+    async def acquire(self, api_type: str, key_identifier: str, static_rate: float,
+                      timeout: Optional[float] = None) -> Optional[LimitSlot]:
+        """
+        Wait for a concurrency slot on this key, first come first served; ``None`` if none
+        frees up within ``timeout`` seconds. Every slot must be given back with ``release``.
+        """
+        state = self._state(api_type, key_identifier, static_rate)
+        if not self.enabled or (state.in_flight < state.slots() and not state.waiters):
+            state.in_flight += 1
+            return LimitSlot(state, time.monotonic())
+
+        self.stats["slot_waits"] += 1
+        future = asyncio.get_running_loop().create_future()
+        state.waiters.append(future)
+        try:
+            await asyncio.wait_for(future, timeout)
+        except (asyncio.TimeoutError, asyncio.CancelledError) as e:
+            if future.done() and not future.cancelled():
+                # Handed a slot just as we gave up: pass it on
+                self._release_slot(state)
+            else:
+                try:
+                    state.waiters.remove(future)
+                except ValueError:
+                    pass
+            if isinstance(e, asyncio.CancelledError):
+                raise
+            self.stats["slot_wait_timeouts"] += 1
+            return None
+        return LimitSlot(state, time.monotonic())
+
+    def _release_slot(self, state: LimitState):
+        state.in_flight -= 1
+        self._wake(state)
+
+    def _wake(self, state: LimitState):
+        # Hand freed slots straight to waiters, so newcomers can't jump the queue
+        while state.waiters and state.in_flight < state.slots():
+            future = state.waiters.popleft()
+            if not future.done():
+                state.in_flight += 1
+                future.set_result(None)
+
+    def release(self, slot: LimitSlot, outcome: str = ERROR, window_calls: int = 0):
+        """
+        Give the slot back and learn from how the attempt went. ``window_calls`` is how many
+        calls the key made in the current minute, so rates only grow while they are binding.
+        """
+        state = slot.state
+        if self.enabled:
+            if outcome == SUCCESS:
+                self._increase(state, window_calls)
+            elif outcome in (RATE_LIMITED, TIMEOUT):
+                self._decrease(state, slot, window_calls if outcome == RATE_LIMITED else None)
+        self._release_slot(state)
+
+    def _increase(self, state: LimitState, window_calls: int):
+        grew = False
+        # in_flight still counts this attempt
+        if state.in_flight * 2 >= state.concurrency_limit and state.concurrency_limit < self.max_concurrency:
+            state.concurrency_limit = self._clamp_concurrency(
+                state.concurrency_limit + self.additive_increase / state.concurrency_limit
+            )
+            grew = True
+        if window_calls * 2 >= state.calls_per_minute:
+            rate = self._clamp_rate(state.api_type, state.calls_per_minute + self.rate_increase / state.calls_per_minute)
+            if rate > state.calls_per_minute:
+                state.calls_per_minute = rate
+                grew = True
+        if grew:
+            state.increases += 1
+            state.updated_at = time.time()
+            self.stats["increases"] += 1
+            self.dirty = True
+            self._wake(state)
+
+    def _decrease(self, state: LimitState, slot: LimitSlot, window_calls: Optional[int]):
+        if slot.acquired_at < state.last_decrease_at:
+            self.stats["ignored_overloads"] += 1
+            return
+        state.last_decrease_at = time.monotonic()
+        state.concurrency_limit = self._clamp_concurrency(state.concurrency_limit * self.decrease_factor)
+        if window_calls is not None:
+            # The provider did accept the calls already in this window: never cut below them.
+            # A 429 for too many concurrent requests then barely touches a binding rate.
+            state.calls_per_minute = self._clamp_rate(
+                state.api_type, max(state.calls_per_minute * self.decrease_factor, window_calls)
+            )
+        state.decreases += 1
+        state.updated_at = time.time()
+        self.stats["decreases"] += 1
+        self.dirty = True
+        logger.info(f"Cut {state.api_type} limits to {state.slots()} concurrent, "
+                    f"{state.calls_per_minute:.1f}/min")
+
+    def load(self):
+        """Restore limits saved by a previous run"""
+        if not self.state_path or not os.path.exists(self.state_path):
+            return
+        try:
+            with open(self.state_path) as f:
+                saved = json.load(f)
+        except (OSError, ValueError) as e:
+            logger.warning(f"Ignoring unreadable adaptive limits at {self.state_path}: {e}")
+            return
+        limits = saved.get("limits", {})
+        for key_identifier, saved_limits in limits.items():
+            if key_identifier in self.limits:
+                self._apply(self.limits[key_identifier], saved_limits)
+            else:
+                self._restored[key_identifier] = saved_limits
+        logger.info(f"Restored adaptive limits for {len(limits)} API keys")
+
+    def save(self):
+        """Write the learned limits atomically (temp file, then rename); safe to run in a thread"""
+        if not self.state_path:
+            return
+        # Keys not used since the restore keep their saved limits
+        limits = dict(self._restored)
+        for key_identifier, state in list(self.limits.items()):
+            limits[key_identifier] = {
+                "api_type": state.api_type,
+                "concurrency_limit": round(state.concurrency_limit, 3),
+                "calls_per_minute": round(state.calls_per_minute, 3),
+                "updated_at": state.updated_at,
+            }
+        self.dirty = False
+        directory = os.path.dirname(os.path.abspath(self.state_path))
+        fd, temp_path = tempfile.mkstemp(dir=directory, prefix=".adaptive_limits.")
+        try:
+            with os.fdopen(fd, "w") as f:
+                json.dump({"version": 1, "limits": limits}, f, indent=2)
+            os.replace(temp_path, self.state_path)
+        except OSError:
+            self.dirty = True
+            os.unlink(temp_path)
+            raise
+        self.stats["saves"] += 1
+
+    def get_stats(self) -> Dict:
+        return {
+            "enabled": self.enabled,
+            "limits": {
+                key_identifier: {
+                    "api_type": state.api_type,
+                    "concurrency_limit": state.slots(),
+                    "calls_per_minute": round(state.calls_per_minute, 1),
+                    "static_calls_per_minute": self.static_rates.get(state.api_type),
+                    "in_flight": state.in_flight,
+                    "waiting": len(state.waiters),
+                    "increases": state.increases,
+                    "decreases": state.decreases,
+                }
+                for key_identifier, state in self.limits.items()
+            },
+            **self.stats,
+        }
+
+
+def adaptive_limiter_from_env() -> AdaptiveLimiter:
+    return AdaptiveLimiter(
+        enabled=os.getenv("ADAPTIVE_LIMITS_ENABLED", "true").lower() == "true",
+        initial_concurrency=float(os.getenv("ADAPTIVE_INITIAL_CONCURRENCY", "8")),
+        max_concurrency=float(os.getenv("ADAPTIVE_MAX_CONCURRENCY", "64")),
+        min_calls_per_minute=float(os.getenv("ADAPTIVE_MIN_CALLS_PER_MINUTE", "5")),
+        max_rate_multiplier=float(os.getenv("ADAPTIVE_MAX_RATE_MULTIPLIER", "4")),
+        rate_increase=float(os.getenv("ADAPTIVE_RATE_INCREASE", "5")),
+        decrease_factor=float(os.getenv("ADAPTIVE_DECREASE_FACTOR", "0.7")),
+        state_path=os.getenv("ADAPTIVE_LIMITS_PATH", "adaptive_limits.json") or None
+    )
@@ -0,0 +1,163 @@
+import logging
+import os
+import time
+from typing import Awaitable, Callable, Dict, Tuple
+
+from api_protection import protection_manager
+from ai_service_manager import ai_service_manager
+
+logger = logging.getLogger(__name__)
+
+
+class AdmissionController:
+    """
+    SLO-driven admission control: turns that would miss their latency target are shed
+    to the local fallback tier instead of queueing behind exhausted upstream quotas
+    """
+
+    def __init__(self, service_manager, rate_limiter):
+        self.service_manager = service_manager
+        self.rate_limiter = rate_limiter
+
+        # Latency objective for one AI turn, and how much longer premium users may wait
+        self.slo_seconds = float(os.getenv("AI_TURN_SLO_SECONDS", "8"))
+        self.premium_slo_multiplier = float(os.getenv("PREMIUM_SLO_MULTIPLIER", "2"))
+
+        # Share of the remaining upstream capacity held back for premium users
+        self.premium_reserve = float(os.getenv("PREMIUM_CAPACITY_RESERVE", "0.2"))
+
+        # Moving average of how long an admitted upstream generation takes
+        self.expected_call_seconds = float(os.getenv("EXPECTED_UPSTREAM_SECONDS", "3"))
+        self.ewma_alpha = 0.2
+
+        self.in_flight = 0
+
+        # Metrics
+        self.stats = {
+            "admitted_standard": 0,
+            "admitted_premium": 0,
+            "shed_standard": 0,
+            "shed_premium": 0,
+        }
+
+    def _capacity(self) -> Dict:
+        """Aggregate remaining upstream slots and the soonest slot over all usable keys"""
+        remaining = 0
+        calls_per_minute = 0
+        soonest_slot = None
+
+        for service in self.service_manager.service_priority:
+            if service in self.service_manager.failed_services:
+                continue
+            for api_key in self.service_manager.api_keys.get(service, []):
+                headroom = self.rate_limiter.get_rate_limit_headroom(service, api_key)
+                remaining += headroom["remaining_calls"]
+                calls_per_minute += headroom["calls_per_minute"]
+                if soonest_slot is None or headroom["seconds_until_slot"] < soonest_slot:
+                    soonest_slot = headroom["seconds_until_slot"]
+
+        return {
+            "remaining_calls": remaining,
+            "calls_per_minute": calls_per_minute,
+            "seconds_until_slot": soonest_slot,
+        }
+
+    def estimate_wait(self, capacity: Dict = None) -> float:
+        """Estimated seconds until a new turn gets its upstream answer"""
+        capacity = capacity or self._capacity()
+        if capacity["seconds_until_slot"] is None:
+            # No usable provider at all: waiting can never help
+            return float("inf")
+
+        wait = capacity["seconds_until_slot"] + self.expected_call_seconds
+
+        # Turns already in flight consume the remaining slots first; the backlog
+        # beyond that drains at the aggregate per-minute rate
+        backlog = self.in_flight - capacity["remaining_calls"]
+        if backlog >= 0:
+            rate_per_second = capacity["calls_per_minute"] / 60.0
+            wait += (backlog + 1) / rate_per_second if rate_per_second else float("inf")
+
+        return wait
+
+    def has_provider(self) -> bool:
+        """Whether any provider has an API key configured at all"""
+        return any(self.service_manager.api_keys.get(service) for service in self.service_manager.service_priority)
+
+    def _standard_share(self, capacity: Dict) -> Dict:
+        """The capacity standard turns may queue for, with the premium reserve held back"""
+        share = 1.0 - self.premium_reserve
+        return {
+            **capacity,
+            "remaining_calls": capacity["remaining_calls"] * share,
+            "calls_per_minute": capacity["calls_per_minute"] * share,
+        }
+
+    def turn_budget(self, premium: bool = False) -> float:
+        """Latency budget in seconds for one turn of this tier"""
+        return self.slo_seconds * (self.premium_slo_multiplier if premium else 1.0)
+
+    def should_admit(self, premium: bool = False) -> bool:
+        """Decide whether a turn can be served upstream within its SLO"""
+        capacity = self._capacity()
+        if not premium:
+            # Standard turns wait as if the premium reserve were not there, so they are
+            # shed first as the quotas run down but still admitted once a window refills
+            capacity = self._standard_share(capacity)
+        return self.estimate_wait(capacity) <= self.turn_budget(premium)
+
+    async def run(self,
+                  generate: Callable[[], Awaitable[Tuple[str, bool]]],
+                  fallback: Callable[[], Awaitable[str]],
+                  premium: bool = False) -> Tuple[str, bool]:
+        """
+        Run ``generate`` if the turn is admitted, otherwise answer from ``fallback`` right away.
+        ``generate`` returns the reply and whether a provider produced it, and so does this.
+        """
+        if not self.has_provider():
+            # Nothing to admit the turn to: the offline tier is the normal path, not shedding
+            return await fallback(), False
+
+        tier = "premium" if premium else "standard"
+        if not self.should_admit(premium):
+            self.stats[f"shed_{tier}"] += 1
+            logger.warning(f"Shedding {tier} AI turn: estimated wait exceeds {self.slo_seconds}s SLO")
+            return await fallback(), False
+
+        self.stats[f"admitted_{tier}"] += 1
+        self.in_flight += 1
+        started = time.monotonic()
+        try:
+            response, upstream = await generate()
+        finally:
+            self.in_flight -= 1
+
+        # Only provider answers say how long an upstream call takes: instant all-failed
+        # fallbacks, deadline fallbacks and cancelled turns would skew the estimate
+        if upstream:
+            elapsed = time.monotonic() - started
+            self.expected_call_seconds += self.ewma_alpha * (elapsed - self.expected_call_seconds)
+        return response, upstream
+
+    def get_stats(self) -> Dict:
+        """Get admission control statistics"""
+        capacity = self._capacity()
+        estimated_wait = self.estimate_wait(capacity)
+        shed = self.stats["shed_standard"] + self.stats["shed_premium"]
+        total = shed + self.stats["admitted_standard"] + self.stats["admitted_premium"]
+        return {
+            **self.stats,
+            "shed_total": shed,
+            "shed_rate": round(shed / total, 4) if total else 0.0,
+            "in_flight": self.in_flight,
+            "slo_seconds": self.slo_seconds,
+            "expected_call_seconds": round(self.expected_call_seconds, 3),
+            "estimated_wait_seconds": round(estimated_wait, 3) if estimated_wait != float("inf") else None,
+            "remaining_upstream_calls": capacity["remaining_calls"],
+            "fallback_responses": self.service_manager.fallback_responses,
+            "deadline_fallbacks": self.service_manager.deadline_fallbacks,
+        }
+
+
+# Global admission controller instance
+admission_controller = AdmissionController(ai_service_manager, protection_manager)
@@ -1,10 +1,14 @@
 import os
 import asyncio
 import logging
-from typing import List, Dict, Optional, Any
-import random
+from typing import List, Dict, Optional, Any, Tuple
 import json
 from api_protection import make_protected_api_call, protection_manager
+from request_coalescer import request_coalescer
+from micro_batcher import MicroBatcher
+from mock_provider import MockProvider
+from persona_responder import persona_responder
+from deadlines import Deadline
 
 logger = logging.getLogger(__name__)
 
@@ -38,8 +42,40 @@ class AIServiceManager:
         
         # Failed services tracking
         self.failed_services = set()
+        
         self.service_retry_times = {}
         
+        # Responses served by the offline fallback, and the subset caused by an expired deadline
+        self.fallback_responses = 0
+        self.deadline_fallbacks = 0
+        
+        # Single-flight coalescing of identical concurrent generations
+        self.coalescer = request_coalescer
+        self.coalescing_enabled = os.getenv("ENABLE_REQUEST_COALESCING", "true").lower() == "true"
+        self.coalescing_variation = os.getenv("COALESCED_RESPONSE_VARIATION", "false").lower() == "true"
+        
+        # Upstream transport; the local mock provider stands in for real APIs in benchmarks
+        if os.getenv("AI_MOCK_PROVIDER", "false").lower() == "true":
+            self.transport = MockProvider()
+        else:
+            self.transport = make_protected_api_call
+        
+        # Optional micro-batching for providers whose endpoints accept multiple inputs
+        self.batchers: Dict[str, MicroBatcher] = {}
+        if os.getenv("ENABLE_MICRO_BATCHING", "false").lower() == "true":
+            self.enable_micro_batching(
+                max_batch_size=int(os.getenv("MICRO_BATCH_MAX_SIZE", "8")),
+                max_wait_ms=float(os.getenv("MICRO_BATCH_MAX_WAIT_MS", "15"))
+            )
+        
+    def enable_micro_batching(self, max_batch_size: int = 8, max_wait_ms: float = 15.0):
+        """Batch concurrent Hugging Face and DeepInfra prompts into shared requests"""
+        self.batchers = {
+            'huggingface': MicroBatcher('huggingface', self._send_huggingface_batch, max_batch_size, max_wait_ms),
+            'deepinfra': MicroBatcher('deepinfra', self._send_deepinfra_batch, max_batch_size, max_wait_ms)
+        }
+        logger.info(f"Micro-batching enabled (max {max_batch_size} prompts, {max_wait_ms}ms wait)")
+    
     def _load_api_keys(self, env_var_base: str) -> List[str]:
         """Load multiple API keys from environment variables"""
         keys = []
@@ -71,7 +107,8 @@ class AIServiceManager:
         
         return key
     
-    async def _make_gemini_request(self, prompt: str, context: List[Dict] = None) -> Optional[str]:
+    async def _make_gemini_request(self, prompt: str, context: List[Dict] = None,
+                                   deadline: Optional[Deadline] = None) -> Optional[str]:
         """Make request to Gemini Pro API with protection"""
         api_key = self._get_next_api_key('gemini')
         if not api_key:
@@ -118,9 +155,9 @@ class AIServiceManager:
         }
         
         try:
-            response = await make_protected_api_call(
+            response = await self.transport(
                 "POST", url, "gemini", api_key,
-                json=payload, headers=headers
+                json=payload, headers=headers, deadline=deadline
             )
             
             if response and "candidates" in response:
@@ -137,18 +174,9 @@ class AIServiceManager:
             logger.error(f"Gemini API error: {str(e)}")
             return None
     
-    async def _make_deepinfra_request(self, prompt: str, context: List[Dict] = None) -> Optional[str]:
+    async def _make_deepinfra_request(self, prompt: str, context: List[Dict] = None,
+                                      deadline: Optional[Deadline] = None) -> Optional[str]:
         """Make request to DeepInfra API with protection"""
-        api_key = self._get_next_api_key('deepinfra')
-        if not api_key:
-            logger.error("No DeepInfra API keys available")
-            return None
-        
-        headers = {
-            "Content-Type": "application/json",
-            "Authorization": f"Bearer {api_key}"
-        }
-        
         # Prepare conversation context
         input_text = ""
         if context:
@@ -158,42 +186,53 @@ class AIServiceManager:
         
         input_text += f"Human: {prompt}\nAssistant:"
         
+        batcher = self.batchers.get('deepinfra')
+        if batcher:
+            return await batcher.submit(input_text, deadline)
+        
+        results = await self._send_deepinfra_batch([input_text], deadline)
+        return results[0] if results else None
+    
+    async def _send_deepinfra_batch(self, inputs: List[str],
+                                    deadline: Optional[Deadline] = None) -> List[Optional[str]]:
+        """Send one or more prepared inputs to DeepInfra in a single request"""
+        api_key = self._get_next_api_key('deepinfra')
+        if not api_key:
+            logger.error("No DeepInfra API keys available")
+            return []
+        
+        headers = {
+            "Content-Type": "application/json",
+            "Authorization": f"Bearer {api_key}"
+        }
+        
         payload = {
-            "input": input_text,
+            "input": inputs[0] if len(inputs) == 1 else inputs,
             "max_tokens": 256,
             "temperature": 0.7,
             "top_p": 0.9
         }
         
         try:
-            response = await make_protected_api_call(
+            response = await self.transport(
                 "POST", self.endpoints['deepinfra'], "deepinfra", api_key,
-                json=payload, headers=headers
+                json=payload, headers=headers, deadline=deadline
             )
             
             if response and "results" in response:
                 if len(response["results"]) > 0:
-                    return response["results"][0].get("generated_text", "").strip()
+                    return [result.get("generated_text", "").strip() for result in response["results"]]
             
             logger.warning("DeepInfra API returned unexpected response format")
-            return None
+            return []
             
         except Exception as e:
             logger.error(f"DeepInfra API error: {str(e)}")
-            return None
+            return []
     
-    async def _make_huggingface_request(self, prompt: str, context: List[Dict] = None) -> Optional[str]:
+    async def _make_huggingface_request(self, prompt: str, context: List[Dict] = None,
+                                        deadline: Optional[Deadline] = None) -> Optional[str]:
         """Make request to Hugging Face API with protection"""
-        api_key = self._get_next_api_key('huggingface')
-        if not api_key:
-            logger.error("No Hugging Face API keys available")
-            return None
-        
-        headers = {
-            "Authorization": f"Bearer {api_key}",
-            "Content-Type": "application/json"
-        }
-        
         # Prepare conversation for Zephyr format
         conversation = ""
         if context:
@@ -203,8 +242,28 @@ class AIServiceManager:
         
         conversation += f"<|user|>\n{prompt}\n<|assistant|>\n"
         
+        batcher = self.batchers.get('huggingface')
+        if batcher:
+            return await batcher.submit(conversation, deadline)
+        
+        results = await self._send_huggingface_batch([conversation], deadline)
+        return results[0] if results else None
+    
+    async def _send_huggingface_batch(self, conversations: List[str],
+                                      deadline: Optional[Deadline] = None) -> List[Optional[str]]:
+        """Send one or more prepared conversations to Hugging Face in a single request"""
+        api_key = self._get_next_api_key('huggingface')
+        if not api_key:
+            logger.error("No Hugging Face API keys available")
+            return []
+        
+        headers = {
+            "Authorization": f"Bearer {api_key}",
+            "Content-Type": "application/json"
+        }
+        
         payload = {
-            "inputs": conversation,
+            "inputs": conversations[0] if len(conversations) == 1 else conversations,
             "parameters": {
                 "max_new_tokens": 256,
                 "temperature": 0.7,
@@ -214,26 +273,38 @@ class AIServiceManager:
         }
         
         try:
-            response = await make_protected_api_call(
+            response = await self.transport(
                 "POST", self.endpoints['huggingface'], "huggingface", api_key,
-                json=payload, headers=headers
+                json=payload, headers=headers, deadline=deadline
             )
             
             if response and isinstance(response, list) and len(response) > 0:
-                generated_text = response[0].get("generated_text", "")
-                # Extract only the assistant's response
-                if "<|assistant|>" in generated_text:
-                    assistant_response = generated_text.split("<|assistant|>")[-1].strip()
-                    return assistant_response
+                # Batched calls return one list of generations per input
+                outputs = response if len(conversations) > 1 else [response]
+                return [self._extract_zephyr_reply(output) for output in outputs]
             
             logger.warning("Hugging Face API returned unexpected response format")
-            return None
+            return []
             
         except Exception as e:
             logger.error(f"Hugging Face API error: {str(e)}")
-            return None
+            return []
+    
+    @staticmethod
+    def _extract_zephyr_reply(output: Any) -> Optional[str]:
+        """Extract only the assistant's response from a Zephyr generation"""
+        if isinstance(output, list):
+            output = output[0] if output else {}
+        
+        generated_text = output.get("generated_text", "") if isinstance(output, dict) else ""
+        if "<|assistant|>" in generated_text:
+            return generated_text.split("<|assistant|>")[-1].strip()
+        
+        logger.warning("Hugging Face API returned a generation without an assistant turn")
+        return None
     
-    async def _make_openai_request(self, prompt: str, context: List[Dict] = None) -> Optional[str]:
+    async def _make_openai_request(self, prompt: str, context: List[Dict] = None,
+                                   deadline: Optional[Deadline] = None) -> Optional[str]:
         """Make request to OpenAI API with protection"""
         api_key = self._get_next_api_key('openai')
         if not api_key:
@@ -264,9 +335,9 @@ class AIServiceManager:
         }
         
         try:
-            response = await make_protected_api_call(
+            response = await self.transport(
                 "POST", self.endpoints['openai'], "openai", api_key,
-                json=payload, headers=headers
+                json=payload, headers=headers, deadline=deadline
             )
             
             if response and "choices" in response:
@@ -281,9 +352,58 @@ class AIServiceManager:
             logger.error(f"OpenAI API error: {str(e)}")
             return None
     
-    async def generate_response(self, prompt: str, bot_profile: Dict, context: List[Dict] = None) -> str:
+    async def generate_response(self, prompt: str, bot_profile: Dict, context: List[Dict] = None,
+                                vary: Optional[bool] = None, deadline: Optional[Deadline] = None) -> str:
         """
-        Generate AI response with failover system and IP protection
+        Generate AI response, sharing one upstream call between identical concurrent requests.
+        
+        With a ``deadline`` the upstream work is abandoned when the turn's budget runs out
+        and the offline persona reply is returned instead. The fallback is taken per caller,
+        so every subscriber of a shared generation that failed counts as a fallback.
+        """
+        response, _ = await self.generate_reply(prompt, bot_profile, context, vary, deadline)
+        return response
+    
+    async def generate_reply(self, prompt: str, bot_profile: Dict, context: List[Dict] = None,
+                             vary: Optional[bool] = None,
+                             deadline: Optional[Deadline] = None) -> Tuple[str, bool]:
+        """Like ``generate_response``, plus whether the reply came from a provider rather than the fallback"""
+        response = None
+        if deadline is None:
+            response = await self._generate_shared(prompt, bot_profile, context, vary, None)
+        else:
+            try:
+                response = await asyncio.wait_for(
+                    self._generate_shared(prompt, bot_profile, context, vary, deadline),
+                    timeout=deadline.remaining()
+                )
+            except asyncio.TimeoutError:
+                self.deadline_fallbacks += 1
+                logger.warning("Turn deadline reached before any provider answered, using fallback response")
+        
+        if response is None:
+            return await self._generate_fallback_response(prompt, bot_profile, context), False
+        return response, True
+    
+    async def _generate_shared(self, prompt: str, bot_profile: Dict, context: Optional[List[Dict]],
+                               vary: Optional[bool], deadline: Optional[Deadline]) -> Optional[str]:
+        if not self.coalescing_enabled:
+            return await self._generate_response(prompt, bot_profile, context, deadline)
+        
+        if vary is None:
+            vary = self.coalescing_variation
+        
+        key = self.coalescer.make_key(prompt, bot_profile, context)
+        return await self.coalescer.run(
+            key,
+            lambda: self._generate_response(prompt, bot_profile, context, deadline),
+            vary=vary
+        )
+    
+    async def _generate_response(self, prompt: str, bot_profile: Dict, context: List[Dict] = None,
+                                 deadline: Optional[Deadline] = None) -> Optional[str]:
+        """
+        Generate AI response with failover system and IP protection; ``None`` if no service answered
         """
         
         # Add personality context to prompt
@@ -310,17 +430,20 @@ class AIServiceManager:
                 logger.warning(f"No API keys configured for {service}")
                 continue
             
+            if deadline and deadline.expired:
+                break
+            
             logger.info(f"Attempting to generate response using {service}")
             
             try:
                 if service == 'gemini':
-                    response = await self._make_gemini_request(personality_prompt, context)
+                    response = await self._make_gemini_request(personality_prompt, context, deadline)
                 elif service == 'deepinfra':
-                    response = await self._make_deepinfra_request(personality_prompt, context)
+                    response = await self._make_deepinfra_request(personality_prompt, context, deadline)
                 elif service == 'huggingface':
-                    response = await self._make_huggingface_request(personality_prompt, context)
+                    response = await self._make_huggingface_request(personality_prompt, context, deadline)
                 elif service == 'openai':
-                    response = await self._make_openai_request(personality_prompt, context)
+                    response = await self._make_openai_request(personality_prompt, context, deadline)
                 else:
                     continue
                 
@@ -334,53 +457,12 @@ class AIServiceManager:
                 continue
         
         logger.warning("All AI services failed, using fallback response")
-        return await self._generate_fallback_response(prompt, bot_profile, context)
+        return None
     
     async def _generate_fallback_response(self, prompt: str, bot_profile: Dict, context: List[Dict] = None) -> str:
         """Generate fallback response when all APIs fail"""
-        style = bot_profile.get("conversation_style", "friendly")
-        name = bot_profile.get("name", "Assistant")
-        
-        fallback_responses = {
-            "enthusiastic": [
-                f"That's so interesting! I'd love to hear more about that! ✨",
-                f"Wow, that's amazing! Tell me more! 🌟",
-                f"That sounds incredible! I'm really curious about your thoughts on this! 💫"
-            ],
-            "thoughtful": [
-                f"That's a fascinating perspective. I've been thinking about something similar...",
-                f"Hmm, that's really thought-provoking. It makes me reflect on...",
-                f"Interesting point. That connects to something I've been pondering..."
-            ],
-            "motivational": [
-                f"You've got this! That's exactly the kind of thinking that leads to success! 💪",
-                f"I love your energy! Keep that momentum going! 🔥",
-                f"That's the spirit! You're on the right track! ⚡"
-            ],
-            "logical": [
-                f"That's a logical approach. Have you considered the broader implications?",
-                f"Interesting analysis. Let's think through this systematically...",
-                f"Good reasoning. That follows a clear logical pattern..."
-            ],
-            "poetic": [
-                f"Your words paint such a beautiful picture... 🎵",
-                f"There's something lyrical about what you're saying... ✨",
-                f"That touches something deep... like a melody in my mind... 🎶"
-            ],
-            "knowledgeable": [
-                f"That's a great topic! Based on my experience...",
-                f"Ah, that reminds me of something I learned recently...",
-                f"Interesting! That connects to several concepts I'm familiar with..."
-            ],
-            "trendy": [
-                f"OMG yes! That's totally having a moment right now! ✨",
-                f"So chic! You're definitely onto something trendy there! 💫",
-                f"Love that vibe! You've got such great taste! 👑"
-            ]
-        }
-        
-        responses = fallback_responses.get(style, fallback_responses["enthusiastic"])
-        return random.choice(responses)
+        self.fallback_responses += 1
+        return persona_responder.respond(prompt, bot_profile, context)
     
     def get_service_status(self) -> Dict:
         """Get current status of all AI services"""
@@ -393,6 +475,34 @@ class AIServiceManager:
             }
         return status
     
+    def get_coalescing_stats(self) -> Dict:
+        """Get single-flight coalescing statistics"""
+        return {
+            "enabled": self.coalescing_enabled,
+            "variation": self.coalescing_variation,
+            **self.coalescer.get_stats()
+        }
+    
+    def get_batching_stats(self) -> Dict:
+        """Get micro-batching statistics per provider"""
+        return {
+            "enabled": bool(self.batchers),
+            "providers": {service: batcher.get_stats() for service, batcher in self.batchers.items()}
+        }
+    
+    def get_cancellation_stats(self) -> Dict:
+        """Upstream work abandoned because the turn that wanted it was cancelled"""
+        transport = self.transport if isinstance(self.transport, MockProvider) else protection_manager
+        cancelled_calls = transport.stats["cancelled_calls"]
+        skipped_batches = sum(batcher.stats["skipped_batches"] for batcher in self.batchers.values())
+        return {
+            "cancelled_calls": cancelled_calls,
+            "cancelled_generations": self.coalescer.stats["cancelled_generations"],
+            "cancelled_batch_items": sum(batcher.stats["cancelled_items"] for batcher in self.batchers.values()),
+            "skipped_batches": skipped_batches,
+            "upstream_calls_saved": cancelled_calls + skipped_batches,
+        }
+    
     def reset_failed_services(self):
         """Reset failed services (useful for recovery)"""
         self.failed_services.clear()
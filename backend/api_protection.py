@@ -1,16 +1,43 @@
 import random
 import time
 import asyncio
-import aiohttp
-import requests
 from typing import List, Dict, Optional
 import json
 import logging
 from datetime import datetime, timedelta
 import os
 
+from email.utils import parsedate_to_datetime
+
+from deadlines import Deadline, clip_to
+from adaptive_limits import adaptive_limiter_from_env, SUCCESS, RATE_LIMITED, TIMEOUT, ERROR
+
 logger = logging.getLogger(__name__)
 
+def parse_retry_after(value: Optional[str]) -> Optional[float]:
+    """Seconds to wait from a Retry-After header (delta-seconds or HTTP-date)"""
+    if not value:
+        return None
+    value = value.strip()
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        retry_at = parsedate_to_datetime(value)
+    except (TypeError, ValueError):
+        return None
+    now = datetime.now(retry_at.tzinfo) if retry_at.tzinfo else datetime.utcnow()
+    return max(0.0, (retry_at - now).total_seconds())
+
+def is_connect_timeout(error: Exception) -> bool:
+    """Whether an aiohttp ServerTimeoutError came from sock_connect rather than sock_read"""
+    import aiohttp
+    connection_timeout = getattr(aiohttp, "ConnectionTimeoutError", None)  # aiohttp >= 3.10
+    if connection_timeout is not None:
+        return isinstance(error, connection_timeout)
+    return str(error).startswith("Connection timeout")
+
 class APIProtectionManager:
     """
     Advanced API protection system with IP rotation, rate limiting, and ban prevention
@@ -39,6 +66,12 @@ class APIProtectionManager:
             'huggingface': {'calls_per_minute': 45, 'calls_per_hour': 600, 'delay_between_calls': 1.8},
             'openai': {'calls_per_minute': 40, 'calls_per_hour': 500, 'delay_between_calls': 2.0}
         }
+        # The "minute" calls_per_minute counts over; replays that compress time shrink it
+        self.rate_window = timedelta(minutes=1)
+        
+        # calls_per_minute above is only the starting point: per key, the adaptive limiter
+        # learns the real rate and concurrency from 429s and timeouts
+        self.adaptive_limits = adaptive_limiter_from_env()
         
         # Proxy rotation settings
         self.current_proxy_index = 0
@@ -56,6 +89,25 @@ class APIProtectionManager:
         self.max_retries = 3
         self.backoff_multiplier = 2.0
         
+        # Per-attempt timeouts: TCP/TLS connect, first response byte, whole attempt
+        self.connect_timeout = float(os.getenv("UPSTREAM_CONNECT_TIMEOUT", "3"))
+        self.first_byte_timeout = float(os.getenv("UPSTREAM_FIRST_BYTE_TIMEOUT", "10"))
+        self.total_timeout = float(os.getenv("UPSTREAM_TOTAL_TIMEOUT", "30"))
+        
+        # An attempt with less time than this left cannot realistically succeed
+        self.min_attempt_seconds = float(os.getenv("UPSTREAM_MIN_ATTEMPT_SECONDS", "0.5"))
+        
+        # Metrics
+        self.stats = {
+            "deadline_aborts": 0,
+            "retry_after_honoured": 0,
+            "timeouts": 0,
+            # Timeouts of limits clipped to the turn deadline: the turn's budget ran out, not the provider
+            "deadline_timeouts": 0,
+            # Calls abandoned because the turn that wanted them was cancelled
+            "cancelled_calls": 0,
+        }
+        
     async def initialize_proxy_rotation(self, enable_rotation: bool = True):
         """Initialize proxy rotation system"""
         self.proxy_rotation_enabled = enable_rotation
@@ -122,10 +174,10 @@ class APIProtectionManager:
         calls[:] = [call_time for call_time in calls if now - call_time < timedelta(hours=1)]
         
         # Remove calls older than 1 minute for minute-based limiting
-        recent_calls = [call_time for call_time in calls if now - call_time < timedelta(minutes=1)]
+        recent_calls = [call_time for call_time in calls if now - call_time < self.rate_window]
         
         limits = self.api_limits.get(api_type, {})
-        calls_per_minute = limits.get('calls_per_minute', 50)
+        calls_per_minute = int(self._calls_per_minute(api_type, key_identifier))
         calls_per_hour = limits.get('calls_per_hour', 1000)
         
         # Check limits
@@ -139,6 +191,43 @@ class APIProtectionManager:
         
         return True
     
+    def get_rate_limit_headroom(self, api_type: str, api_key: str) -> Dict:
+        """Remaining calls in the current window and seconds until the next free slot"""
+        now = datetime.now()
+        key_identifier = f"{api_type}_{api_key[:8]}"
+        calls = self.api_calls.get(key_identifier, [])
+        
+        limits = self.api_limits.get(api_type, {})
+        calls_per_minute = int(self._calls_per_minute(api_type, key_identifier))
+        calls_per_hour = limits.get('calls_per_hour', 1000)
+        delay = limits.get('delay_between_calls', 1.0)
+        
+        recent_calls = [call_time for call_time in calls if now - call_time < self.rate_window]
+        hour_calls = [call_time for call_time in calls if now - call_time < timedelta(hours=1)]
+        remaining = max(0, min(calls_per_minute - len(recent_calls), calls_per_hour - len(hour_calls)))
+        
+        if remaining > 0:
+            wait = delay
+        elif len(hour_calls) >= calls_per_hour:
+            wait = (hour_calls[0] + timedelta(hours=1) - now).total_seconds() + delay
+        else:
+            wait = (recent_calls[0] + self.rate_window - now).total_seconds() + delay
+        
+        return {
+            "remaining_calls": remaining,
+            "calls_per_minute": calls_per_minute,
+            "seconds_until_slot": max(0.0, wait)
+        }
+    
+    def _calls_per_minute(self, api_type: str, key_identifier: str) -> float:
+        """Learned per-minute budget of a key, starting from the static guess for its service"""
+        static_rate = self.api_limits.get(api_type, {}).get('calls_per_minute', 50)
+        return self.adaptive_limits.calls_per_minute(api_type, key_identifier, static_rate)
+    
+    def _window_calls(self, key_identifier: str) -> int:
+        now = datetime.now()
+        return sum(1 for call_time in self.api_calls.get(key_identifier, ()) if now - call_time < self.rate_window)
+    
     async def add_api_call(self, api_type: str, api_key: str):
         """Record an API call for rate limiting"""
         key_identifier = f"{api_type}_{api_key[:8]}"
@@ -156,25 +245,57 @@ class APIProtectionManager:
         jitter = random.uniform(0.1, 0.5)
         return base_delay + jitter
     
-    async def make_protected_request(self, 
+    async def make_protected_request(self,
+                                   method: str,
+                                   url: str,
+                                   api_type: str,
+                                   api_key: str,
+                                   deadline: Optional[Deadline] = None,
+                                   **kwargs) -> Optional[Dict]:
+        """
+        Make a protected API request (see _make_protected_request).
+        
+        Cancelling the caller, e.g. because the client disconnected, aborts the call
+        wherever it is: waiting for a slot, backing off, or mid-request, in which case
+        leaving the aiohttp session closes the upstream connection.
+        """
+        try:
+            return await self._make_protected_request(method, url, api_type, api_key, deadline, **kwargs)
+        except asyncio.CancelledError:
+            self.stats["cancelled_calls"] += 1
+            logger.info(f"Cancelled {api_type} API call")
+            raise
+    
+    async def _make_protected_request(self, 
                                    method: str,
                                    url: str, 
                                    api_type: str,
                                    api_key: str,
+                                   deadline: Optional[Deadline] = None,
                                    **kwargs) -> Optional[Dict]:
         """
-        Make a protected API request with IP rotation and rate limiting
+        Make a protected API request with IP rotation and rate limiting.
+        
+        With a ``deadline``, every wait (rate-limit slot, pacing delay, Retry-After, back-off)
+        and every attempt's timeouts are clipped to the remaining budget, and the call gives up
+        as soon as a wait would not leave time for another attempt.
         """
         
-        # Check rate limits
+        # Check rate limits; wait for the next slot only if it opens within the budget
         if not await self.check_rate_limit(api_type, api_key):
-            logger.warning(f"Rate limit hit for {api_type}, waiting...")
-            await asyncio.sleep(60)  # Wait 1 minute if rate limited
-            return None
+            wait = self.get_rate_limit_headroom(api_type, api_key)["seconds_until_slot"]
+            if deadline and not deadline.allows(wait + self.min_attempt_seconds):
+                logger.warning(f"Rate limit hit for {api_type}, no slot within the turn deadline")
+                self.stats["deadline_aborts"] += 1
+                return None
+            logger.warning(f"Rate limit hit for {api_type}, waiting {wait:.1f}s for a slot...")
+            await asyncio.sleep(wait)
+            if not await self.check_rate_limit(api_type, api_key):
+                return None
         
         # Get recommended delay
         delay = await self.get_recommended_delay(api_type)
-        await asyncio.sleep(delay)
+        await asyncio.sleep(clip_to(deadline, delay))
         
         # Prepare headers
         headers = self.get_random_headers()
@@ -187,37 +308,95 @@ class APIProtectionManager:
         if proxy:
             kwargs['proxy'] = proxy['http']
         
-        # Add timeout
-        kwargs['timeout'] = kwargs.get('timeout', 30)
+        # Separate budgets for connecting, waiting for the first byte and the whole attempt
+        total_timeout = kwargs.pop('timeout', self.total_timeout)
+        
+        # aiohttp is only needed once we actually talk to a provider
+        import aiohttp
+        
+        key_identifier = f"{api_type}_{api_key[:8]}"
+        static_rate = self.api_limits.get(api_type, {}).get('calls_per_minute', 50)
         
         for attempt in range(self.max_retries):
+            if deadline and not deadline.allows(self.min_attempt_seconds):
+                logger.warning(f"Turn deadline reached before {api_type} attempt {attempt + 1}")
+                self.stats["deadline_aborts"] += 1
+                return None
+            
+            # Wait for one of the key's concurrency slots, leaving time for the attempt itself
+            slot_timeout = deadline.remaining() - self.min_attempt_seconds if deadline else None
+            slot = await self.adaptive_limits.acquire(api_type, key_identifier, static_rate, slot_timeout)
+            if slot is None:
+                logger.warning(f"No {api_type} concurrency slot within the turn deadline")
+                self.stats["deadline_aborts"] += 1
+                return None
+            outcome = ERROR
+            
+            attempt_timeout = clip_to(deadline, total_timeout)
+            timeout = aiohttp.ClientTimeout(
+                total=attempt_timeout,
+                sock_connect=min(self.connect_timeout, attempt_timeout),
+                sock_read=min(self.first_byte_timeout, attempt_timeout)
+            )
+            
+            wait_time = self.base_delay * (self.backoff_multiplier ** attempt)
             try:
-                async with aiohttp.ClientSession() as session:
+                async with aiohttp.ClientSession(timeout=timeout) as session:
                     async with session.request(method, url, **kwargs) as response:
                         if response.status == 200:
                             await self.add_api_call(api_type, api_key)
                             result = await response.json()
+                            outcome = SUCCESS
                             logger.info(f"Successful {api_type} API call (attempt {attempt + 1})")
                             return result
-                        elif response.status == 429:  # Rate limited
-                            logger.warning(f"Rate limited by {api_type} API, waiting...")
-                            await asyncio.sleep(60 * (attempt + 1))
+                        
+                        retry_after = parse_retry_after(response.headers.get("Retry-After"))
+                        if retry_after is not None:
+                            self.stats["retry_after_honoured"] += 1
+                        
+                        if response.status == 429:  # Rate limited
+                            outcome = RATE_LIMITED
+                            wait_time = retry_after if retry_after is not None else 60 * (attempt + 1)
+                            logger.warning(f"Rate limited by {api_type} API, retry in {wait_time:.1f}s")
                         elif response.status == 403:  # Forbidden/banned
                             logger.error(f"IP potentially banned by {api_type}, rotating...")
                             if proxy:
                                 # Remove bad proxy
                                 if proxy in self.proxy_list:
                                     self.proxy_list.remove(proxy)
-                            await asyncio.sleep(30)
+                            wait_time = retry_after if retry_after is not None else 30
                         else:
                             logger.warning(f"API call failed with status {response.status}")
+                            if retry_after is not None:
+                                wait_time = retry_after
                             
+            except asyncio.TimeoutError as e:
+                self.stats["timeouts"] += 1
+                # aiohttp raises ServerTimeoutError for sock_connect/sock_read and a plain
+                # TimeoutError for the total. Only a limit of the provider's own says it is
+                # overloaded; one clipped to a short turn deadline must not cut its concurrency
+                if isinstance(e, aiohttp.ServerTimeoutError):
+                    limit = self.connect_timeout if is_connect_timeout(e) else self.first_byte_timeout
+                else:
+                    limit = total_timeout
+                clipped = min(limit, attempt_timeout) < limit
+                if clipped:
+                    self.stats["deadline_timeouts"] += 1
+                else:
+                    outcome = TIMEOUT
+                logger.error(f"Request attempt {attempt + 1} to {api_type} timed out after {attempt_timeout:.1f}s")
             except Exception as e:
                 logger.error(f"Request attempt {attempt + 1} failed: {str(e)}")
-                
-                if attempt < self.max_retries - 1:
-                    wait_time = self.base_delay * (self.backoff_multiplier ** attempt)
-                    await asyncio.sleep(wait_time)
+            finally:
+                self.adaptive_limits.release(slot, outcome, self._window_calls(key_identifier))
+            
+            if attempt < self.max_retries - 1:
+                # A wait that would eat the rest of the budget is pointless; fail over instead
+                if deadline and not deadline.allows(wait_time + self.min_attempt_seconds):
+                    logger.warning(f"Not retrying {api_type}: {wait_time:.1f}s back-off exceeds the turn deadline")
+                    self.stats["deadline_aborts"] += 1
+                    return None
+                await asyncio.sleep(wait_time)
         
         logger.error(f"All {self.max_retries} attempts failed for {api_type} API")
         return None
@@ -234,7 +413,9 @@ class APIProtectionManager:
             "proxies_available": len(self.proxy_list),
             "proxy_rotation_enabled": self.proxy_rotation_enabled,
             "tracked_apis": len(self.api_calls),
-            "current_proxy_index": self.current_proxy_index
+            "current_proxy_index": self.current_proxy_index,
+            "adaptive_limits": self.adaptive_limits.get_stats(),
+            **self.stats
         }
 
 # Global protection manager instance
@@ -249,6 +430,9 @@ async def initialize_protection(enable_proxy_rotation: bool = True, premium_prox
     """Initialize the protection system"""
     await protection_manager.initialize_proxy_rotation(enable_proxy_rotation)
     
+    # Start from the limits learned before the last restart
+    await asyncio.to_thread(protection_manager.adaptive_limits.load)
+    
     if premium_proxies:
         protection_manager.add_premium_proxies(premium_proxies)
     
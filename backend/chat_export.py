@@ -0,0 +1,198 @@
+import base64
+import json
+import logging
+import time
+import zlib
+from datetime import datetime
+from typing import AsyncIterator, Dict, List, Optional, Tuple
+
+from bson import ObjectId
+
+from serialization import dumps_bytes
+from session_lifecycle import iter_archived_messages
+
+logger = logging.getLogger(__name__)
+
+
+def encode_export_cursor(session_object_id: ObjectId, message_index: int) -> str:
+    """Opaque checkpoint: the export resumes right after this message"""
+    raw = json.dumps([str(session_object_id), message_index])
+    return base64.urlsafe_b64encode(raw.encode("utf-8")).decode("ascii")
+
+
+def decode_export_cursor(cursor: str) -> Tuple[ObjectId, int]:
+    """Decode a checkpoint produced by encode_export_cursor"""
+    try:
+        session_object_id, message_index = json.loads(base64.urlsafe_b64decode(cursor.encode("ascii")))
+        return ObjectId(session_object_id), int(message_index)
+    except Exception as e:
+        raise ValueError(f"Invalid export cursor: {e}")
+
+
+def build_export_pipeline(user_id: Optional[str] = None,
+                          bot_id: Optional[str] = None,
+                          since: Optional[datetime] = None,
+                          until: Optional[datetime] = None,
+                          resume_after: Optional[Tuple[ObjectId, int]] = None) -> List[Dict]:
+    """
+    Aggregation that unwinds sessions into one document per hot message, in a stable order.
+
+    Sessions are walked in ``_id`` order and messages in history order, so (session ``_id``,
+    message index) is a total order that a checkpoint can resume from. The first document of
+    a session with archived history is always kept, so the exporter can stream the archive
+    ahead of it; exact time-range and resume filtering happen in the exporter.
+    """
+    session_match: Dict = {}
+    if user_id:
+        session_match["user_id"] = user_id
+    if bot_id:
+        session_match["bot_id"] = bot_id
+    # Prune whole sessions that cannot hold a message in the time range
+    if since:
+        session_match["last_active_at"] = {"$gte": since}
+    if until:
+        session_match["started_at"] = {"$lte": until}
+    if resume_after:
+        session_match["_id"] = {"$gte": resume_after[0]}
+
+    pipeline = [
+        {"$match": session_match},
+        {"$sort": {"_id": 1}},
+        {"$project": {"session_id": 1, "user_id": 1, "bot_id": 1, "messages": 1, "archived_message_count": 1}},
+        {"$unwind": {"path": "$messages", "includeArrayIndex": "message_index", "preserveNullAndEmptyArrays": True}},
+    ]
+    if since or until:
+        pipeline.append({"$match": {"$or": [
+            {"messages.timestamp": {
+                **({"$gte": since} if since else {}),
+                **({"$lte": until} if until else {}),
+            }},
+            {"archived_message_count": {"$gt": 0}, "message_index": {"$in": [0, None]}},
+        ]}})
+    return pipeline
+
+
+class ChatExporter:
+    """
+    Streams chat history as NDJSON straight off a database cursor, in constant memory
+    """
+
+    def __init__(self, batch_size: int = 500, flush_bytes: int = 64 * 1024, checkpoint_every: int = 1000):
+        # Documents fetched per cursor round trip, and bytes buffered per response chunk
+        self.batch_size = batch_size
+        self.flush_bytes = flush_bytes
+        self.checkpoint_every = checkpoint_every
+
+        # Metrics
+        self.stats = {
+            "exports_started": 0,
+            "exports_completed": 0,
+            "messages_exported": 0,
+            "bytes_sent": 0,
+        }
+
+    async def stream(self,
+                     sessions,
+                     archives=None,
+                     user_id: Optional[str] = None,
+                     bot_id: Optional[str] = None,
+                     since: Optional[datetime] = None,
+                     until: Optional[datetime] = None,
+                     resume_after: Optional[Tuple[ObjectId, int]] = None,
+                     compress: bool = False) -> AsyncIterator[bytes]:
+        """
+        Yield NDJSON chunks: one ``{"type": "message", ...}`` line per message, with a
+        ``{"type": "checkpoint", "cursor": ...}`` line every ``checkpoint_every`` messages
+        and at the end. Passing the last checkpoint back as ``resume_after`` resumes after it.
+
+        Archived history (see session_lifecycle) is rehydrated chunk by chunk from ``archives``.
+        """
+        self.stats["exports_started"] += 1
+        started = time.perf_counter()
+        compressor = zlib.compressobj(6, zlib.DEFLATED, 31) if compress else None
+
+        buffer = bytearray()
+        exported = 0
+        last_position = None
+
+        def selected(session_object_id: ObjectId, index: int, message: Dict) -> bool:
+            if resume_after and session_object_id == resume_after[0] and index <= resume_after[1]:
+                return False
+            timestamp = message.get("timestamp")
+            if since and (timestamp is None or timestamp < since):
+                return False
+            if until and (timestamp is None or timestamp > until):
+                return False
+            return True
+
+        def checkpoint_line() -> bytes:
+            return dumps_bytes({"type": "checkpoint", "cursor": encode_export_cursor(*last_position)}) + b"\n"
+
+        def drain() -> bytes:
+            chunk = bytes(buffer)
+            buffer.clear()
+            if compressor:
+                chunk = compressor.compress(chunk) + compressor.flush(zlib.Z_SYNC_FLUSH)
+            self.stats["bytes_sent"] += len(chunk)
+            return chunk
+
+        def append(document: Dict, index: int, message: Dict):
+            nonlocal exported, last_position
+            buffer.extend(dumps_bytes({
+                "type": "message",
+                "session_id": document.get("session_id"),
+                "user_id": document.get("user_id"),
+                "bot_id": document.get("bot_id"),
+                "message_index": index,
+                "timestamp": message.get("timestamp"),
+                "user_message": message.get("user_message"),
+                "bot_response": message.get("bot_response"),
+            }))
+            buffer.extend(b"\n")
+            exported += 1
+            last_position = (document["_id"], index)
+            if exported % self.checkpoint_every == 0:
+                buffer.extend(checkpoint_line())
+
+        pipeline = build_export_pipeline(user_id, bot_id, since, until, resume_after)
+        cursor = sessions.aggregate(pipeline, batchSize=self.batch_size, allowDiskUse=True)
+        async for document in cursor:
+            archived = document.get("archived_message_count") or 0
+            array_index = document.get("message_index")
+
+            # Archived messages precede the hot ones; stream them in when the session starts
+            if archived and archives is not None and array_index in (0, None):
+                async for index, message in iter_archived_messages(archives, document["session_id"]):
+                    if selected(document["_id"], index, message):
+                        append(document, index, message)
+                    if len(buffer) >= self.flush_bytes:
+                        yield drain()
+
+            message = document.get("messages")
+            if isinstance(message, dict) and selected(document["_id"], archived + array_index, message):
+                append(document, archived + array_index, message)
+            if len(buffer) >= self.flush_bytes:
+                yield drain()
+
+        if last_position and exported % self.checkpoint_every:
+            buffer.extend(checkpoint_line())
+
+        chunk = drain()
+        if compressor:
+            tail = compressor.flush(zlib.Z_FINISH)
+            self.stats["bytes_sent"] += len(tail)
+            chunk += tail
+        if chunk:
+            yield chunk
+
+        self.stats["exports_completed"] += 1
+        self.stats["messages_exported"] += exported
+        logger.info(f"Exported {exported} messages in {time.perf_counter() - started:.2f}s")
+
+    def get_stats(self) -> Dict:
+        """Get export statistics"""
+        return dict(self.stats)
+
+
+# Global chat exporter instance
+chat_exporter = ChatExporter()
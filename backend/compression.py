@@ -0,0 +1,148 @@
+import logging
+import zlib
+from typing import Optional
+
+from starlette.datastructures import Headers, MutableHeaders
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+logger = logging.getLogger(__name__)
+
+try:
+    import brotli
+    BROTLI_AVAILABLE = True
+except ImportError:
+    BROTLI_AVAILABLE = False
+
+# Streams that are already compressed or must reach the client chunk by chunk
+UNCOMPRESSED_MEDIA_TYPES = ("text/event-stream", "image/", "application/gzip", "application/zip")
+
+
+class _Encoder:
+    """Incremental gzip or brotli encoder with a uniform interface"""
+
+    def __init__(self, encoding: str, gzip_level: int, brotli_quality: int):
+        self.encoding = encoding
+        if encoding == "br":
+            self.compressor = brotli.Compressor(quality=brotli_quality)
+        else:
+            self.compressor = zlib.compressobj(gzip_level, zlib.DEFLATED, 31)
+
+    def compress(self, data: bytes) -> bytes:
+        if self.encoding == "br":
+            return self.compressor.process(data)
+        return self.compressor.compress(data)
+
+    def flush(self) -> bytes:
+        if self.encoding == "br":
+            return self.compressor.flush()
+        return self.compressor.flush(zlib.Z_SYNC_FLUSH)
+
+    def finish(self) -> bytes:
+        if self.encoding == "br":
+            return self.compressor.finish()
+        return self.compressor.flush(zlib.Z_FINISH)
+
+
+class CompressionMiddleware:
+    """
+    Negotiated brotli/gzip compression for REST responses above a size threshold
+    """
+
+    def __init__(self, app: ASGIApp, minimum_size: int = 500, gzip_level: int = 6, brotli_quality: int = 4):
+        self.app = app
+        self.minimum_size = minimum_size
+        self.gzip_level = gzip_level
+        self.brotli_quality = brotli_quality
+
+    def _negotiate(self, accept_encoding: str) -> Optional[str]:
+        accepted = {part.split(";")[0].strip().lower() for part in accept_encoding.split(",")}
+        if BROTLI_AVAILABLE and "br" in accepted:
+            return "br"
+        if "gzip" in accepted:
+            return "gzip"
+        return None
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        encoding = self._negotiate(Headers(scope=scope).get("Accept-Encoding", ""))
+        if encoding is None:
+            await self.app(scope, receive, send)
+            return
+
+        responder = _CompressionResponder(self, encoding, send)
+        await self.app(scope, receive, responder.send)
+
+
+class _CompressionResponder:
+    def __init__(self, middleware: CompressionMiddleware, encoding: str, send: Send):
+        self.middleware = middleware
+        self.encoding = encoding
+        self.downstream = send
+        self.initial_message: Message = {}
+        self.passthrough = False
+        self.started = False
+        self.encoder: Optional[_Encoder] = None
+
+    def _start_encoding(self):
+        headers = MutableHeaders(raw=self.initial_message["headers"])
+        headers["Content-Encoding"] = self.encoding
+        headers.add_vary_header("Accept-Encoding")
+        if "content-length" in headers:
+            del headers["Content-Length"]
+        self.encoder = _Encoder(self.encoding, self.middleware.gzip_level, self.middleware.brotli_quality)
+
+    async def send(self, message: Message) -> None:
+        message_type = message["type"]
+
+        if message_type == "http.response.start":
+            # Hold the headers back until we know whether the body gets compressed
+            self.initial_message = message
+            headers = Headers(raw=message["headers"])
+            media_type = headers.get("content-type", "")
+            self.passthrough = (
+                "content-encoding" in headers
+                or any(media_type.startswith(skip) for skip in UNCOMPRESSED_MEDIA_TYPES)
+            )
+            return
+
+        if message_type != "http.response.body":
+            await self.downstream(message)
+            return
+
+        body = message.get("body", b"")
+        more_body = message.get("more_body", False)
+
+        if self.passthrough:
+            if not self.started:
+                self.started = True
+                await self.downstream(self.initial_message)
+            await self.downstream(message)
+            return
+
+        if not self.started:
+            self.started = True
+
+            if not more_body and len(body) < self.middleware.minimum_size:
+                # Small responses cost more to compress than they save
+                self.passthrough = True
+                await self.downstream(self.initial_message)
+                await self.downstream(message)
+                return
+
+            self._start_encoding()
+            if not more_body:
+                compressed = self.encoder.compress(body) + self.encoder.finish()
+                MutableHeaders(raw=self.initial_message["headers"])["Content-Length"] = str(len(compressed))
+                await self.downstream(self.initial_message)
+                await self.downstream({"type": "http.response.body", "body": compressed, "more_body": False})
+                return
+
+            await self.downstream(self.initial_message)
+
+        # Streaming body: flush each chunk so the client sees data as it is produced
+        chunk = self.encoder.compress(body)
+        chunk += self.encoder.flush() if more_body else self.encoder.finish()
+        await self.downstream({"type": "http.response.body", "body": chunk, "more_body": more_body})
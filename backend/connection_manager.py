@@ -0,0 +1,357 @@
+import asyncio
+import logging
+import os
+import time
+from typing import Dict, Iterable, List, Optional, Set
+
+from fastapi import WebSocket, WebSocketDisconnect
+
+from serialization import negotiate_frame_protocol, encode_frame, decode_frame
+
+logger = logging.getLogger(__name__)
+
+PING_FRAME = {"type": "ping"}
+PONG_FRAME = {"type": "pong"}
+
+
+def current_rss_bytes() -> Optional[int]:
+    """Resident set size of this process, where /proc is available"""
+    try:
+        with open("/proc/self/statm") as statm:
+            return int(statm.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, IndexError):
+        return None
+
+
+class Inbox:
+    """
+    Bounded single-reader, single-writer frame queue for one connection.
+
+    Holds the same few frames an ``asyncio.Queue`` would, at a fraction of its ~1.5 KB
+    per instance (no deques, Events or waiter lists, just a list and two futures).
+    """
+
+    __slots__ = ("frames", "maxsize", "_getter", "_putter")
+
+    def __init__(self, maxsize: int = 16):
+        self.frames: List = []
+        self.maxsize = maxsize
+        self._getter: Optional[asyncio.Future] = None
+        self._putter: Optional[asyncio.Future] = None
+
+    def __len__(self) -> int:
+        return len(self.frames)
+
+    def full(self) -> bool:
+        return len(self.frames) >= self.maxsize
+
+    @staticmethod
+    def _wake(future: Optional[asyncio.Future]):
+        if future is not None and not future.done():
+            future.set_result(None)
+
+    def put_nowait(self, frame):
+        """Append regardless of the bound (used for the end-of-stream marker)"""
+        self.frames.append(frame)
+        self._wake(self._getter)
+
+    async def put(self, frame):
+        while self.full():
+            self._putter = asyncio.get_running_loop().create_future()
+            await self._putter
+        self.put_nowait(frame)
+
+    def get_nowait(self):
+        frame = self.frames.pop(0)
+        self._wake(self._putter)
+        return frame
+
+    async def get(self):
+        while not self.frames:
+            self._getter = asyncio.get_running_loop().create_future()
+            await self._getter
+        return self.get_nowait()
+
+
+class Connection:
+    """One accepted WebSocket and the user and session it belongs to"""
+
+    # Slotted: one of these lives for every open socket
+    __slots__ = (
+        "websocket", "user_id", "session_id", "protocol",
+        "last_seen", "last_active", "ping_sent_at", "reader",
+    )
+
+    def __init__(self, websocket: WebSocket, user_id: str, session_id: str, protocol: Optional[str]):
+        self.websocket = websocket
+        self.user_id = user_id
+        self.session_id = session_id
+        # Negotiated frame format (None for JSON text frames)
+        self.protocol = protocol
+
+        # Any frame from the client proves the socket alive; only chat frames count as activity
+        now = time.monotonic()
+        self.last_seen = now
+        self.last_active = now
+        self.ping_sent_at: Optional[float] = None
+        self.reader: Optional[asyncio.Task] = None
+
+    def __repr__(self) -> str:
+        return f"Connection(user_id={self.user_id!r}, session_id={self.session_id!r})"
+
+
+class ConnectionManager:
+    """
+    Live WebSockets indexed by session and by user, so a session open in several tabs
+    and every device a user owns can be reached with one concurrent fan-out.
+
+    The manager's own bookkeeping is about 1 KB per connection; the socket itself (uvicorn
+    and websockets) is ~35 KB of RSS, or ~125 KB with permessage-deflate. See the
+    connection_memory benchmark.
+    """
+
+    def __init__(self,
+                 fanout_batch_size: int = 500,
+                 heartbeat_interval: float = 25.0,
+                 pong_timeout: float = 10.0,
+                 idle_timeout: float = 1800.0):
+        # Sends in flight at once during a fan-out
+        self.fanout_batch_size = max(1, fanout_batch_size)
+
+        # A socket silent for ``heartbeat_interval`` is pinged and reaped as dead if it doesn't
+        # answer within ``pong_timeout``; one without a chat frame for ``idle_timeout`` is closed
+        self.heartbeat_interval = heartbeat_interval
+        self.pong_timeout = pong_timeout
+        self.idle_timeout = idle_timeout
+        self.last_reap: Dict = {}
+
+        self.session_connections: Dict[str, Set[Connection]] = {}
+        self.user_connections: Dict[str, Set[Connection]] = {}
+
+        # Metrics
+        self.stats = {
+            "connections_opened": 0,
+            "connections_closed": 0,
+            "fanouts": 0,
+            "frames_sent": 0,
+            "send_failures": 0,
+            "pings_sent": 0,
+            "pongs_received": 0,
+            "reaped_dead": 0,
+            "reaped_idle": 0,
+        }
+
+    async def connect(self, websocket: WebSocket, user_id: str, session_id: str) -> Connection:
+        # Clients opt in to binary MessagePack frames via the WebSocket subprotocol
+        protocol = negotiate_frame_protocol(websocket.scope.get("subprotocols", []))
+        await websocket.accept(subprotocol=protocol)
+        return self.register(websocket, user_id, session_id, protocol)
+
+    def register(self, websocket: WebSocket, user_id: str, session_id: str,
+                 protocol: Optional[str] = None) -> Connection:
+        """Track an already accepted socket"""
+        connection = Connection(websocket, user_id, session_id, protocol)
+        self.session_connections.setdefault(session_id, set()).add(connection)
+        self.user_connections.setdefault(user_id, set()).add(connection)
+        self.stats["connections_opened"] += 1
+        return connection
+
+    def disconnect(self, connection: Connection):
+        """Forget a connection; safe to call more than once"""
+        removed = False
+        for index, key in ((self.session_connections, connection.session_id),
+                           (self.user_connections, connection.user_id)):
+            connections = index.get(key)
+            if connections and connection in connections:
+                connections.discard(connection)
+                removed = True
+                if not connections:
+                    del index[key]
+        if removed:
+            self.stats["connections_closed"] += 1
+
+    def connections_for_session(self, session_id: str) -> Set[Connection]:
+        return self.session_connections.get(session_id, set())
+
+    def connections_for_user(self, user_id: str) -> Set[Connection]:
+        return self.user_connections.get(user_id, set())
+
+    async def receive_message(self, connection: Connection) -> dict:
+        message = await connection.websocket.receive()
+        if message["type"] == "websocket.disconnect":
+            raise WebSocketDisconnect(message.get("code", 1000))
+        data = message.get("bytes") if message.get("bytes") is not None else message.get("text")
+        return decode_frame(data, connection.protocol)
+
+    def start_reader(self, connection: Connection, inbox: Inbox) -> asyncio.Task:
+        """Read the connection's frames in the background; the reaper cancels it on eviction"""
+        connection.reader = asyncio.create_task(self.read_frames(connection, inbox))
+        return connection.reader
+
+    async def read_frames(self, connection: Connection, inbox: Inbox):
+        """
+        Feed decoded chat frames into ``inbox`` until the client goes away, then put ``None``.
+        Heartbeat frames are answered here and never reach the chat loop.
+        """
+        try:
+            while True:
+                frame = await self.receive_message(connection)
+                connection.last_seen = time.monotonic()
+                connection.ping_sent_at = None
+
+                frame_type = frame.get("type") if isinstance(frame, dict) else None
+                if frame_type == "pong":
+                    self.stats["pongs_received"] += 1
+                    continue
+                if frame_type == "ping":
+                    await self.send(connection, PONG_FRAME)
+                    continue
+
+                connection.last_active = connection.last_seen
+                await inbox.put(frame)
+        except WebSocketDisconnect:
+            pass
+        except Exception as e:
+            logger.warning(f"Closing WebSocket for session {connection.session_id}: {str(e)}")
+        finally:
+            inbox.put_nowait(None)
+
+    async def send(self, connection: Connection, message: dict):
+        """Send to a single connection"""
+        await self._send_frame(connection, encode_frame(message, connection.protocol))
+        self.stats["frames_sent"] += 1
+
+    @staticmethod
+    async def _send_frame(connection: Connection, frame):
+        if isinstance(frame, bytes):
+            await connection.websocket.send_bytes(frame)
+        else:
+            await connection.websocket.send_text(frame)
+
+    async def fanout(self, connections: Iterable[Connection], message: dict) -> int:
+        """
+        Send ``message`` to every connection, ``fanout_batch_size`` sends at a time.
+
+        The frame is encoded once per negotiated protocol, and a socket whose send fails
+        is dropped rather than failing the whole fan-out. Returns the number delivered.
+        """
+        targets: List[Connection] = list(connections)
+        if not targets:
+            return 0
+
+        frames: Dict[Optional[str], object] = {}
+        for connection in targets:
+            if connection.protocol not in frames:
+                frames[connection.protocol] = encode_frame(message, connection.protocol)
+
+        delivered = 0
+        for start in range(0, len(targets), self.fanout_batch_size):
+            batch = targets[start:start + self.fanout_batch_size]
+            results = await asyncio.gather(
+                *[self._send_frame(connection, frames[connection.protocol]) for connection in batch],
+                return_exceptions=True
+            )
+            for connection, result in zip(batch, results):
+                if isinstance(result, BaseException):
+                    self.stats["send_failures"] += 1
+                    logger.info(f"Dropping connection for session {connection.session_id}: {result!r}")
+                    self.disconnect(connection)
+                else:
+                    delivered += 1
+
+        self.stats["fanouts"] += 1
+        self.stats["frames_sent"] += delivered
+        return delivered
+
+    async def send_personal_message(self, message: dict, session_id: str) -> int:
+        """Send to every tab that has the session open"""
+        return await self.fanout(self.connections_for_session(session_id), message)
+
+    async def send_to_user(self, message: dict, user_id: str) -> int:
+        """Send to every connection a user has, across sessions and devices"""
+        return await self.fanout(self.connections_for_user(user_id), message)
+
+    async def close_user(self, user_id: str, code: int = 1000):
+        """Close and forget every connection of a user"""
+        for connection in list(self.connections_for_user(user_id)):
+            self.disconnect(connection)
+            try:
+                await connection.websocket.close(code=code)
+            except Exception:
+                pass
+
+    async def evict(self, connection: Connection, code: int = 1001):
+        """Forget a connection, stop its reader and close the socket without waiting on a dead peer"""
+        self.disconnect(connection)
+        if connection.reader:
+            connection.reader.cancel()
+        try:
+            await asyncio.wait_for(connection.websocket.close(code=code), timeout=1.0)
+        except Exception:
+            pass
+
+    async def reap(self) -> Dict:
+        """
+        One heartbeat pass: evict sockets that missed a pong or have been idle too long,
+        and ping the ones that have been quiet for a heartbeat interval
+        """
+        started = time.perf_counter()
+        rss_before = current_rss_bytes()
+        now = time.monotonic()
+
+        dead: List[Connection] = []
+        idle: List[Connection] = []
+        quiet: List[Connection] = []
+        for connections in self.session_connections.values():
+            for connection in connections:
+                if connection.ping_sent_at is not None and now - connection.ping_sent_at > self.pong_timeout:
+                    dead.append(connection)
+                elif self.idle_timeout and now - connection.last_active > self.idle_timeout:
+                    idle.append(connection)
+                elif connection.ping_sent_at is None and now - connection.last_seen >= self.heartbeat_interval:
+                    quiet.append(connection)
+
+        evictions = [self.evict(connection) for connection in dead + idle]
+        for start in range(0, len(evictions), self.fanout_batch_size):
+            await asyncio.gather(*evictions[start:start + self.fanout_batch_size])
+        self.stats["reaped_dead"] += len(dead)
+        self.stats["reaped_idle"] += len(idle)
+
+        for connection in quiet:
+            connection.ping_sent_at = now
+        self.stats["pings_sent"] += await self.fanout(quiet, PING_FRAME)
+
+        rss_after = current_rss_bytes()
+        self.last_reap = {
+            "dead": len(dead),
+            "idle": len(idle),
+            "pinged": len(quiet),
+            "rss_bytes_before": rss_before,
+            "rss_bytes_after": rss_after,
+            "duration_ms": round((time.perf_counter() - started) * 1000, 3),
+        }
+        if dead or idle:
+            logger.info(f"Reaped {len(dead)} dead and {len(idle)} idle WebSocket connections")
+        return self.last_reap
+
+    def get_stats(self) -> Dict:
+        """Get connection statistics"""
+        return {
+            **self.stats,
+            "reaped_total": self.stats["reaped_dead"] + self.stats["reaped_idle"],
+            "rss_bytes": current_rss_bytes(),
+            "last_reap": self.last_reap,
+            "active_connections": sum(len(connections) for connections in self.session_connections.values()),
+            "active_sessions": len(self.session_connections),
+            "active_users": len(self.user_connections),
+            "fanout_batch_size": self.fanout_batch_size,
+        }
+
+
+# Global connection manager instance
+manager = ConnectionManager(
+    fanout_batch_size=int(os.getenv("WS_FANOUT_BATCH_SIZE", "500")),
+    heartbeat_interval=float(os.getenv("WS_HEARTBEAT_INTERVAL_SECONDS", "25")),
+    pong_timeout=float(os.getenv("WS_PONG_TIMEOUT_SECONDS", "10")),
+    idle_timeout=float(os.getenv("WS_IDLE_TIMEOUT_SECONDS", "1800"))
+)
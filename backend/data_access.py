@@ -0,0 +1,164 @@
+import logging
+import os
+import time
+from collections import OrderedDict
+from contextlib import asynccontextmanager
+from typing import Any, Dict, Optional, Tuple
+
+from pymongo.read_preferences import Nearest, Primary, PrimaryPreferred, Secondary, SecondaryPreferred
+
+logger = logging.getLogger(__name__)
+
+READ_PREFERENCE_MODES = {
+    "primary": Primary,
+    "primaryPreferred": PrimaryPreferred,
+    "secondary": Secondary,
+    "secondaryPreferred": SecondaryPreferred,
+    "nearest": Nearest,
+}
+
+
+def make_read_preference(mode: str, max_staleness_seconds: int = -1):
+    """pymongo read preference for a mode name; ``max_staleness_seconds`` is -1 (off) or at least 90"""
+    if mode not in READ_PREFERENCE_MODES:
+        raise ValueError(f"Unknown read preference {mode!r}, expected one of {sorted(READ_PREFERENCE_MODES)}")
+    if mode == "primary":
+        return Primary()
+    return READ_PREFERENCE_MODES[mode](max_staleness=max_staleness_seconds)
+
+
+class DataAccess:
+    """
+    Read and write handles on the chat database.
+
+    Writes go to the primary through ``writer``. Reads say what kind of query they are
+    (``reader("history")``) and get a handle with that kind's read preference, so history
+    browsing can be served by secondaries instead of competing with turn writes.
+
+    Read-your-writes: a write made inside ``causal_write(key, ...)`` remembers its session's
+    cluster and operation time under each key (a chat session or user id). A later
+    ``causal_read(key)`` carries that time to the secondary (afterClusterTime), which waits
+    until it has replicated the write rather than answering with stale history. The times are
+    kept per process for ``causal_window_seconds``, by which point any healthy secondary has caught up.
+    """
+
+    def __init__(self,
+                 client,
+                 database_name: str = "chatapp",
+                 read_preferences: Optional[Dict[str, str]] = None,
+                 max_staleness_seconds: int = -1,
+                 causal_consistency: bool = True,
+                 causal_window_seconds: float = 300.0,
+                 max_tracked_keys: int = 100000):
+        self.client = client
+        self.database_name = database_name
+        self.writer = client.get_database(database_name, read_preference=Primary())
+
+        # Query kind -> read preference mode; unlisted kinds read from the primary
+        self.read_preferences = dict(read_preferences or {})
+        self.max_staleness_seconds = max_staleness_seconds
+        self._readers: Dict[str, Any] = {"primary": self.writer}
+        for mode in self.read_preferences.values():
+            self._handle(mode)
+
+        self.causal_consistency = causal_consistency
+        self.causal_window_seconds = causal_window_seconds
+        self.max_tracked_keys = max_tracked_keys
+        # key -> (recorded_at, cluster_time, operation_time), oldest first
+        self._operation_times: "OrderedDict[str, Tuple[float, Any, Any]]" = OrderedDict()
+
+        self.stats = {
+            "reads": {},
+            "causal_writes": 0,
+            "causal_reads": 0,
+            "tracked_keys_evicted": 0,
+        }
+
+    def _handle(self, mode: str):
+        handle = self._readers.get(mode)
+        if handle is None:
+            handle = self.client.get_database(
+                self.database_name, read_preference=make_read_preference(mode, self.max_staleness_seconds)
+            )
+            self._readers[mode] = handle
+        return handle
+
+    def reader(self, query: str):
+        """Database handle with the read preference configured for this kind of query"""
+        self.stats["reads"][query] = self.stats["reads"].get(query, 0) + 1
+        return self._handle(self.read_preferences.get(query, "primary"))
+
+    def _remember(self, keys, session):
+        cluster_time, operation_time = session.cluster_time, session.operation_time
+        # Standalone servers report no cluster time: there is nothing to wait for
+        if cluster_time is None or operation_time is None:
+            return
+        recorded_at = time.monotonic()
+        for key in keys:
+            self._operation_times[key] = (recorded_at, cluster_time, operation_time)
+            self._operation_times.move_to_end(key)
+        while len(self._operation_times) > self.max_tracked_keys:
+            self._operation_times.popitem(last=False)
+            self.stats["tracked_keys_evicted"] += 1
+
+    def _latest_write(self, keys) -> Optional[Tuple[Any, Any]]:
+        oldest_useful = time.monotonic() - self.causal_window_seconds
+        latest = None
+        for key in keys:
+            entry = self._operation_times.get(key)
+            if entry is None:
+                continue
+            if entry[0] < oldest_useful:
+                del self._operation_times[key]
+                continue
+            if latest is None or entry[2] > latest[1]:
+                latest = (entry[1], entry[2])
+        return latest
+
+    @asynccontextmanager
+    async def causal_write(self, *keys: str):
+        """Session for writes whose effects reads of ``keys`` must observe; ``None`` when disabled"""
+        if not self.causal_consistency:
+            yield None
+            return
+        async with await self.client.start_session(causal_consistency=True) as session:
+            yield session
+            self._remember(keys, session)
+            self.stats["causal_writes"] += 1
+
+    @asynccontextmanager
+    async def causal_read(self, *keys: str):
+        """
+        Session that makes reads wait for this process's latest recent write to any of ``keys``.
+        ``None`` (a plain read) when nothing was written to them lately.
+        """
+        latest = self._latest_write(keys) if self.causal_consistency else None
+        if latest is None:
+            yield None
+            return
+        async with await self.client.start_session(causal_consistency=True) as session:
+            session.advance_cluster_time(latest[0])
+            session.advance_operation_time(latest[1])
+            self.stats["causal_reads"] += 1
+            yield session
+
+    def get_stats(self) -> Dict:
+        return {
+            "read_preferences": dict(self.read_preferences),
+            "max_staleness_seconds": self.max_staleness_seconds,
+            "causal_consistency": self.causal_consistency,
+            "causal_window_seconds": self.causal_window_seconds,
+            "tracked_keys": len(self._operation_times),
+            **self.stats,
+            "reads": dict(self.stats["reads"]),
+        }
+
+
+def read_preferences_from_env() -> Dict[str, str]:
+    """Read preference per query kind, from *_READ_PREFERENCE variables"""
+    return {
+        "history": os.getenv("HISTORY_READ_PREFERENCE", "secondaryPreferred"),
+        # The user cache loader enforces bans and mutes, which must not be read stale
+        "users": os.getenv("USER_READ_PREFERENCE", "primary"),
+        "export": os.getenv("EXPORT_READ_PREFERENCE", "secondaryPreferred"),
+    }
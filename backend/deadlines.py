@@ -0,0 +1,55 @@
+import time
+from typing import Optional
+
+
+class Deadline:
+    """
+    Absolute point in time by which a chat turn must have its answer.
+
+    Created once per turn and passed down to every provider call, so retries, back-offs
+    and timeouts can be clipped to whatever is left of the turn's latency budget.
+    """
+
+    __slots__ = ("expires_at",)
+
+    def __init__(self, expires_at: float):
+        self.expires_at = expires_at
+
+    @classmethod
+    def after(cls, seconds: float) -> "Deadline":
+        return cls(time.monotonic() + seconds)
+
+    def remaining(self) -> float:
+        """Seconds left, never negative"""
+        return max(0.0, self.expires_at - time.monotonic())
+
+    @property
+    def expired(self) -> bool:
+        return self.remaining() <= 0.0
+
+    def clip(self, seconds: float) -> float:
+        """``seconds`` shortened to the remaining budget"""
+        return min(seconds, self.remaining())
+
+    def allows(self, seconds: float) -> bool:
+        """Whether waiting ``seconds`` still leaves time to do something useful afterwards"""
+        return self.remaining() > seconds
+
+    def __repr__(self) -> str:
+        return f"Deadline(remaining={self.remaining():.3f}s)"
+
+
+def clip_to(deadline: Optional[Deadline], seconds: float) -> float:
+    """``seconds`` clipped to ``deadline`` when there is one"""
+    return deadline.clip(seconds) if deadline else seconds
+
+
+def latest(deadlines) -> Optional[Deadline]:
+    """The latest of several deadlines; ``None`` (unbounded) if any of them is unbounded"""
+    result = None
+    for deadline in deadlines:
+        if deadline is None:
+            return None
+        if result is None or deadline.expires_at > result.expires_at:
+            result = deadline
+    return result
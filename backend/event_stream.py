@@ -0,0 +1,58 @@
+import asyncio
+import logging
+from typing import Any, AsyncIterator, Awaitable, Callable, Dict, Optional
+
+from serialization import dumps
+
+logger = logging.getLogger(__name__)
+
+# Comment line: ignored by SSE parsers, but keeps proxies from timing out a quiet stream
+SSE_KEEPALIVE = b": keep-alive\n\n"
+
+SSE_HEADERS = {
+    "Cache-Control": "no-cache",
+    # Stop nginx-style proxies from buffering the stream until it ends
+    "X-Accel-Buffering": "no",
+}
+
+
+def format_sse(event: str, data: Any, event_id: Optional[str] = None) -> bytes:
+    """One Server-Sent Event with a JSON payload"""
+    lines = []
+    if event_id is not None:
+        lines.append(f"id: {event_id}")
+    lines.append(f"event: {event}")
+    lines.append(f"data: {dumps(data)}")
+    return ("\n".join(lines) + "\n\n").encode("utf-8")
+
+
+async def stream_turn_events(turn: asyncio.Task, keepalive_seconds: float = 15.0,
+                             on_reply: Optional[Callable[[Dict], Awaitable[None]]] = None) -> AsyncIterator[bytes]:
+    """
+    Keep-alive comments while ``turn`` runs, then its reply frame as a single event named
+    after the frame type, after which ``on_reply`` gets the frame. A turn that produced
+    nothing or failed yields an ``error`` event.
+
+    Cancelling the turn when the client goes away is left to the caller.
+    """
+    while True:
+        done, _ = await asyncio.wait({turn}, timeout=keepalive_seconds)
+        if done:
+            break
+        yield SSE_KEEPALIVE
+
+    try:
+        reply = turn.result()
+    except asyncio.CancelledError:
+        raise
+    except Exception as e:
+        logger.exception(f"Chat turn failed: {e}")
+        yield format_sse("error", {"type": "error", "message": "Something went wrong, please try again"})
+        return
+
+    if not reply:
+        yield format_sse("error", {"type": "error", "message": "Chat session not found"})
+        return
+    yield format_sse(reply.get("type", "message"), reply)
+    if on_reply is not None:
+        await on_reply(reply)
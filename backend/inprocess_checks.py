@@ -0,0 +1,410 @@
+"""Checks that exercise the backend in-process, without a live server or network.
+
+Each check is a coroutine returning a JSON-serialisable report. backend_inprocess_test.py runs
+every check in a fresh interpreter (so environment settings read at import time apply and the
+module-level singletons start clean) and judges the report there.
+"""
+import asyncio
+import json
+import os
+import socket
+import tempfile
+from datetime import datetime, timedelta
+from typing import Dict
+
+
+async def admission_control() -> Dict:
+    from admission_control import AdmissionController
+    from ai_service_manager import AIServiceManager
+    from api_protection import APIProtectionManager
+    from mock_provider import MockProvider
+
+    manager = AIServiceManager()
+    manager.api_keys = {"openai": ["mock-key"]}
+    manager.service_priority = ["openai"]
+    manager.coalescing_enabled = False
+    manager.transport = MockProvider(request_latency=0.05, quotas={})
+    limiter = APIProtectionManager()
+    controller = AdmissionController(manager, limiter)
+    controller.slo_seconds, controller.premium_reserve, controller.expected_call_seconds = 8.0, 0.2, 3.0
+    controller.premium_slo_multiplier = 1.0  # same SLO for both tiers: only the reserve tells them apart
+    calls = limiter.api_calls.setdefault("openai_mock-key", [])
+    bot_profile = {"bot_id": "bot", "name": "Bot"}
+
+    # 10 of 40 calls left and 9 turns in flight: standard turns, queueing without the
+    # premium reserve's share, would miss the SLO
+    calls.extend([datetime.now()] * 30)
+    controller.in_flight = 9
+    reserve = {"standard": controller.should_admit(False), "premium": controller.should_admit(True)}
+
+    # Quota spent: the next slot is a minute away, past either tier's SLO
+    controller.in_flight = 0
+    calls.extend([datetime.now()] * 10)
+    exhausted = {"standard": controller.should_admit(False), "premium": controller.should_admit(True)}
+    shed_reply, _ = await controller.run(lambda: manager.generate_reply("hi", bot_profile),
+                                         lambda: asyncio.sleep(0, result="offline"))
+
+    # Quota spent but the window refills in half a second: no need to shed either tier
+    calls[:] = [datetime.now() - timedelta(seconds=59.5)] * 40
+    refilling = {"standard": controller.should_admit(False), "premium": controller.should_admit(True)}
+    calls.clear()
+
+    # Only provider answers feed the expected call time
+    estimates = [controller.expected_call_seconds]
+    await controller.run(lambda: manager.generate_reply("hi", bot_profile), lambda: asyncio.sleep(0, result="offline"))
+    estimates.append(controller.expected_call_seconds)
+    manager.transport.quotas["openai"] = 0  # every provider call is refused: instant fallback
+    fallback, fallback_upstream = await controller.run(lambda: manager.generate_reply("hi", bot_profile),
+                                                       lambda: asyncio.sleep(0, result="offline"))
+    estimates.append(controller.expected_call_seconds)
+    turn = asyncio.ensure_future(controller.run(lambda: asyncio.sleep(10, result=("late", True)),
+                                                lambda: asyncio.sleep(0, result="offline")))
+    await asyncio.sleep(0.05)
+    turn.cancel()
+    await asyncio.gather(turn, return_exceptions=True)
+    estimates.append(controller.expected_call_seconds)
+    stats = controller.get_stats()
+
+    # No provider configured: the offline tier answers without counting as admitted or shed
+    manager.api_keys = {}
+    counted = dict(controller.stats)
+    unconfigured, _ = await controller.run(lambda: manager.generate_reply("hi", bot_profile),
+                                           lambda: asyncio.sleep(0, result="offline"))
+
+    return {"reserve": reserve, "exhausted": exhausted, "shed_reply": shed_reply, "refilling": refilling,
+            "fallback_is_offline": bool(fallback) and not fallback_upstream and manager.fallback_responses == 1,
+            "estimates": estimates, "in_flight": controller.in_flight, "stats": stats,
+            "unconfigured_reply": unconfigured, "unconfigured_counted": controller.stats != counted}
+
+
+async def cold_start() -> Dict:
+    import server
+
+    async with server.lifespan(server.app):
+        return server.startup_metrics
+
+
+async def turn_pipeline() -> Dict:
+    import server
+
+    async with server.lifespan(server.app):
+        server.ai_service_manager.api_keys["gemini"] = ["mock-key"]
+        server.ai_service_manager.transport.request_latency = 0.1
+        moderate_content = server.moderate_content
+
+        async def slow_moderation(content, user_id):
+            # As slow as a moderation read from a remote database
+            await asyncio.sleep(0.1)
+            return await moderate_content(content, user_id)
+        server.moderate_content = slow_moderation
+
+        user_id = (await server.create_user(server.UserCreate(username="tp", age=30, interests=["travel"])))["user_id"]
+        session_id = (await server.start_chat_session(user_id, "alex_traveler"))["session_id"]
+        reply = await server.run_chat_turn(session_id, user_id, "What do you like to do on weekends?")
+        rejected = await server.run_chat_turn(session_id, user_id, "I hate this")
+        await asyncio.sleep(0.15)  # let the cancelled speculative call wind down
+        return {
+            "reply": reply["type"],
+            "rejected": rejected["type"],
+            "stored_messages": len(await server.storage.get_messages(session_id)),
+            "metrics": server.turn_metrics.get_stats(),
+            "cancelled_calls": server.ai_service_manager.transport.stats["cancelled_calls"],
+        }
+
+
+async def user_cache() -> Dict:
+    import server
+
+    async with server.lifespan(server.app):
+        server.ai_service_manager.api_keys["gemini"] = ["mock-key"]
+        user_id = (await server.create_user(server.UserCreate(username="uc", age=30, interests=["travel"])))["user_id"]
+        session_id = (await server.start_chat_session(user_id, "alex_traveler"))["session_id"]
+
+        # Three violations mute; the mute is written through, so the next turn needs no database read
+        flagged = await server.run_chat_turn(session_id, user_id, "I hate this, kill the bomb")
+        misses = server.user_cache.stats["misses"]
+        muted = await server.run_chat_turn(session_id, user_id, "Sorry, where are you from?")
+        mute_misses = server.user_cache.stats["misses"] - misses
+
+        # A ban written elsewhere (an admin, another worker) is enforced once the entry expires
+        server.user_cache.ttl_seconds = 0.05
+        banned_id = (await server.create_user(server.UserCreate(username="ban", age=30, interests=["travel"])))["user_id"]
+        banned_session = (await server.start_chat_session(banned_id, "alex_traveler"))["session_id"]
+        server.storage.users[banned_id]["is_banned"] = True
+        await asyncio.sleep(0.1)
+        banned = await server.run_chat_turn(banned_session, banned_id, "hello again")
+        return {"flagged": flagged["type"], "muted": muted["message"], "mute_misses": mute_misses,
+                "banned": banned["type"], "stats": server.user_cache.get_stats()}
+
+
+async def read_routing() -> Dict:
+    import server
+    from data_access import DataAccess, read_preferences_from_env
+    from mock_replica_set import MockReplicaSet
+    from storage import make_storage
+
+    async with server.lifespan(server.app):
+        # Secondaries lag well behind a turn, so only a causal read can see it
+        replica_set = MockReplicaSet(secondaries=2, replication_lag=0.5)
+        server.data_access = DataAccess(replica_set, "chatapp", read_preferences=read_preferences_from_env())
+        server.db = server.data_access.writer
+        server.storage = make_storage("mongodb", server.data_access)
+        server.ai_service_manager.api_keys["gemini"] = ["mock-key"]
+
+        user_id = (await server.create_user(server.UserCreate(username="rw", age=30, interests=["travel"])))["user_id"]
+        session_id = (await server.start_chat_session(user_id, "alex_traveler"))["session_id"]
+        await server.run_chat_turn(session_id, user_id, "Hi! Where did you travel last?")
+        messages = json.loads((await server.get_chat_messages(session_id)).body)["messages"]
+        sessions = json.loads((await server.get_user_sessions(user_id)).body)["sessions"]
+
+        await replica_set.wait_until_replicated()
+        replica_set.close()
+        return {"messages": len(messages), "listed_message_count": sessions[0]["message_count"],
+                "replica_set": replica_set.get_stats()}
+
+
+async def storage_conformance() -> Dict:
+    from data_access import DataAccess
+    from mock_replica_set import MockReplicaSet
+    from sqlite_storage import SQLiteStorage
+    from storage import MemoryStorage, MotorStorage
+    from storage_conformance import check_conformance
+
+    replica_set = MockReplicaSet(secondaries=2, replication_lag=0.01)
+    motor = MotorStorage(DataAccess(replica_set, "chatapp",
+                                    read_preferences={"history": "secondaryPreferred", "users": "secondaryPreferred"}))
+    with tempfile.TemporaryDirectory() as directory:
+        results = {}
+        for storage in (MemoryStorage(), SQLiteStorage(os.path.join(directory, "chat.sqlite3")), motor):
+            results[storage.name] = await check_conformance(storage)
+            await storage.close()
+    replica_set.close()
+    return results
+
+
+async def _timeout_decreases() -> Dict:
+    from aiohttp import web
+    from adaptive_limits import AdaptiveLimiter
+    from api_protection import APIProtectionManager
+    from deadlines import Deadline
+
+    # A provider that takes 2s to answer: a short turn deadline runs out first, a short
+    # first-byte timeout of the provider's own fires first
+    async def slow(request):
+        await asyncio.sleep(2)
+        return web.json_response({})
+    app = web.Application()
+    app.router.add_post("/slow", slow)
+    runner = web.AppRunner(app, access_log=None)
+    await runner.setup()
+    await web.TCPSite(runner, "127.0.0.1", 0).start()
+    url = f"http://127.0.0.1:{runner.addresses[0][1]}/slow"
+
+    manager = APIProtectionManager()
+    manager.adaptive_limits = AdaptiveLimiter(state_path=None)
+    manager.max_retries = 1
+    async def no_pacing(api_type):
+        return 0.0
+    manager.get_recommended_delay = no_pacing
+
+    await manager.make_protected_request("POST", url, "openai", "slow-key", deadline=Deadline.after(0.8))
+    after_deadline = manager.adaptive_limits.stats["decreases"]
+    manager.first_byte_timeout = 0.3
+    await manager.make_protected_request("POST", url, "openai", "slow-key")
+    after_first_byte = manager.adaptive_limits.stats["decreases"]
+    await runner.cleanup()
+
+    # A provider that never accepts: its listen backlog is full, so connecting hangs
+    listener = socket.socket()
+    listener.bind(("127.0.0.1", 0))
+    listener.listen(0)
+    fillers = [socket.socket() for _ in range(3)]
+    for filler in fillers:
+        filler.setblocking(False)
+        filler.connect_ex(listener.getsockname())
+    url = f"http://127.0.0.1:{listener.getsockname()[1]}/stuck"
+
+    await manager.make_protected_request("POST", url, "openai", "stuck-key", deadline=Deadline.after(0.8))
+    after_connect_deadline = manager.adaptive_limits.stats["decreases"]
+    # The connect timeout is the provider's own even when the first-byte one is clipped
+    manager.connect_timeout = 0.3
+    await manager.make_protected_request("POST", url, "openai", "stuck-key", deadline=Deadline.after(5))
+    for sock in (listener, *fillers):
+        sock.close()
+    return {"after_deadline": after_deadline, "after_first_byte": after_first_byte,
+            "after_connect_deadline": after_connect_deadline,
+            "after_connect": manager.adaptive_limits.stats["decreases"],
+            "deadline_timeouts": manager.stats["deadline_timeouts"]}
+
+
+async def adaptive_limits() -> Dict:
+    from adaptive_limits import AdaptiveLimiter, SUCCESS, RATE_LIMITED
+
+    path = os.path.join(tempfile.mkdtemp(), "limits.json")
+    limiter = AdaptiveLimiter(initial_concurrency=4, state_path=path)
+    key = ("openai", "openai_test-key", 40)
+
+    # Four slots; a fifth caller waits and times out
+    slots = [await limiter.acquire(*key) for _ in range(4)]
+    fifth = await limiter.acquire(*key, timeout=0.05)
+
+    # Successes at full use grow both limits
+    for slot in slots:
+        limiter.release(slot, SUCCESS, window_calls=40)
+    grown = dict(limiter.get_stats()["limits"]["openai_test-key"])
+    grown_concurrency = limiter.limits["openai_test-key"].concurrency_limit
+
+    # A burst of 429s from attempts sent together cuts once
+    burst = [await limiter.acquire(*key) for _ in range(3)]
+    for slot in burst:
+        limiter.release(slot, RATE_LIMITED, window_calls=20)
+    cut = limiter.get_stats()
+
+    limiter.save()
+    restored = AdaptiveLimiter(initial_concurrency=4, state_path=path)
+    restored.load()
+    return {
+        "fifth_slot": fifth is not None,
+        "grown": grown, "grown_concurrency": grown_concurrency,
+        "cut": cut["limits"]["openai_test-key"], "decreases": cut["decreases"],
+        "ignored_overloads": cut["ignored_overloads"],
+        "restored_calls_per_minute": restored.calls_per_minute("openai", "openai_test-key", 40),
+        "timeout_decreases": await _timeout_decreases(),
+    }
+
+
+async def semantic_cache() -> Dict:
+    import server
+    from semantic_cache import SemanticCache
+
+    async with server.lifespan(server.app):
+        server.ai_service_manager.api_keys["gemini"] = ["mock-key"]
+        user_id = (await server.create_user(server.UserCreate(username="sc", age=30, interests=["travel"])))["user_id"]
+        session_id = (await server.start_chat_session(user_id, "alex_traveler"))["session_id"]
+        replies = [await server.run_chat_turn(session_id, user_id, text)
+                   for text in ["What's your favourite movie?", "whats ur fav film", "Where are you from?"]]
+        stats = await server.get_semantic_cache_stats()
+        upstream_requests = server.ai_service_manager.transport.get_stats()["requests"]
+
+        # A speculative reply that beats a rejecting moderation must not be cached
+        moderate_content = server.moderate_content
+
+        async def slow_moderation(content, user_id):
+            await asyncio.sleep(0.1)
+            return await moderate_content(content, user_id)
+        server.moderate_content = slow_moderation
+        server.ai_service_manager.transport.request_latency = 0.01
+        rejected = await server.run_chat_turn(session_id, user_id, "I hate this")
+        rejected_entries = server.semantic_cache.get_stats()["entries"] - stats["entries"]
+
+    # LRU eviction keeps the bound, and the most recently used entry survives
+    bounded = SemanticCache(enabled=True, max_entries=2)
+    bounded.store("bot", "where are you from", "a")
+    bounded.store("bot", "what is your favorite movie", "b")
+    bounded.lookup("bot", "where are you from")
+    bounded.store("bot", "do you have any pets", "c")
+    return {
+        "replies": [reply["content"] if reply else None for reply in replies],
+        "upstream_requests": upstream_requests,
+        "stats": stats,
+        "rejected": rejected["type"],
+        "rejected_entries": rejected_entries,
+        "bounded_entries": bounded.get_stats()["entries"],
+        "survivor": bounded.lookup("bot", "where are you from"),
+        "evicted": bounded.lookup("bot", "what is your favorite movie"),
+    }
+
+
+async def sse_events() -> Dict:
+    from event_stream import stream_turn_events
+
+    async def failing_turn():
+        await asyncio.sleep(0.05)
+        raise RuntimeError("storage went away")
+
+    async def answered_turn():
+        await asyncio.sleep(0.05)
+        return {"type": "message", "content": "hi"}
+
+    fanned_out = []
+
+    async def fan_out(reply):
+        fanned_out.append(reply["type"])
+
+    failed = [chunk.decode() async for chunk in stream_turn_events(asyncio.create_task(failing_turn()),
+                                                                   keepalive_seconds=0.02, on_reply=fan_out)]
+    answered = [chunk.decode() async for chunk in stream_turn_events(asyncio.create_task(answered_turn()),
+                                                                     keepalive_seconds=0.02, on_reply=fan_out)]
+    return {"failed": failed[-1], "answered": answered[-1],
+            "keepalives": failed.count(": keep-alive\n\n"), "fanned_out": fanned_out}
+
+
+async def session_cursor() -> Dict:
+    import uuid
+    import server
+    from data_access import DataAccess
+    from mock_replica_set import MockReplicaSet
+    from storage import make_storage
+
+    async with server.lifespan(server.app):
+        replica_set = MockReplicaSet(secondaries=1, replication_lag=0)
+        server.data_access = DataAccess(replica_set, "chatapp")
+        server.db = server.data_access.writer
+        server.storage = make_storage("mongodb", server.data_access)
+
+        user_id = (await server.create_user(server.UserCreate(username="sc", age=30, interests=["travel"])))["user_id"]
+        expected = [(await server.start_chat_session(user_id, "alex_traveler"))["session_id"] for _ in range(3)]
+        # Sessions written before the summary fields existed, not reached by the backfill yet
+        for _ in range(3):
+            session_id = str(uuid.uuid4())
+            await server.db.chat_sessions.insert_one({
+                "session_id": session_id, "user_id": user_id, "bot_id": "alex_traveler",
+                "started_at": datetime.utcnow(), "messages": [], "is_active": False,
+            })
+            expected.append(session_id)
+
+        listed, cursor, pages = [], None, 0
+        while pages < 10:
+            page = json.loads((await server.get_user_sessions(user_id, limit=2, cursor=cursor)).body)
+            listed.extend(session["session_id"] for session in page["sessions"])
+            pages += 1
+            cursor = page["next_cursor"]
+            if cursor is None:
+                break
+        replica_set.close()
+        return {"listed": sorted(listed), "expected": sorted(expected), "pages": pages}
+
+
+async def persona_pictures() -> Dict:
+    import server
+    from persona_catalog import PICTURE_URL_PREFIX
+
+    async with server.lifespan(server.app):
+        profiles = json.loads((await server.get_bot_profiles(None)).body)["bot_profiles"]
+        urls = [profile["profile_picture_url"] for profile in profiles]
+        picture = await server.get_bot_picture(urls[0][len(PICTURE_URL_PREFIX):])
+
+        # Drop the first persona: its sessions keep showing its picture
+        with open(server.persona_catalog.path, "rb") as catalog_file:
+            documents = json.loads(catalog_file.read())
+        with tempfile.TemporaryDirectory() as directory:
+            server.persona_catalog.path = os.path.join(directory, "personas.json")
+            with open(server.persona_catalog.path, "w") as catalog_file:
+                json.dump(documents[1:], catalog_file)
+            await server.reload_persona_catalog()
+        retired_picture = await server.get_bot_picture(urls[0][len(PICTURE_URL_PREFIX):])
+        try:
+            await server.get_bot_picture("0" * 16)
+            missing_status = 200
+        except server.HTTPException as e:
+            missing_status = e.status_code
+
+        return {
+            "inline_pictures": sum("profile_picture" in profile for profile in profiles),
+            "urls": urls,
+            "jpeg": picture.body[:2] == b"\xff\xd8",
+            "cache_control": picture.headers["cache-control"],
+            "retired_jpeg": retired_picture.body[:2] == b"\xff\xd8",
+            "missing_status": missing_status,
+            "catalog": server.persona_catalog.get_stats(),
+        }
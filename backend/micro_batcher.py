@@ -0,0 +1,125 @@
+import asyncio
+import logging
+from typing import Any, Awaitable, Callable, Dict, List, Optional
+
+from deadlines import Deadline, latest
+
+logger = logging.getLogger(__name__)
+
+
+class MicroBatcher:
+    """
+    Collects individual inputs for a few milliseconds and sends them upstream as one request
+    """
+
+    def __init__(self,
+                 name: str,
+                 send_batch: Callable[[List[Any], Optional[Deadline]], Awaitable[List[Any]]],
+                 max_batch_size: int = 8,
+                 max_wait_ms: float = 15.0):
+        self.name = name
+        self.send_batch = send_batch
+        self.max_batch_size = max(1, max_batch_size)
+        self.max_wait = max(0.0, max_wait_ms) / 1000.0
+
+        # Inputs waiting for the next flush, with the waiting turn's future and deadline
+        self.pending: List[tuple] = []
+        self.flush_timer: Optional[asyncio.Task] = None
+
+        # Metrics
+        self.stats = {
+            "batches_sent": 0,
+            "items_sent": 0,
+            "largest_batch": 0,
+            "failed_batches": 0,
+            # Inputs dropped because their turn was cancelled before the flush,
+            # and flushes that needed no request at all as a result
+            "cancelled_items": 0,
+            "skipped_batches": 0,
+        }
+
+    async def submit(self, item: Any, deadline: Optional[Deadline] = None) -> Any:
+        """Queue one input and wait for its share of the batched result"""
+        future = asyncio.get_running_loop().create_future()
+        self.pending.append((item, future, deadline))
+
+        if len(self.pending) >= self.max_batch_size:
+            self._flush_now()
+        elif self.flush_timer is None:
+            self.flush_timer = asyncio.ensure_future(self._flush_after_wait())
+
+        return await future
+
+    def _flush_now(self):
+        if self.flush_timer is not None:
+            self.flush_timer.cancel()
+            self.flush_timer = None
+
+        batch, self.pending = self.pending, []
+        if batch:
+            asyncio.ensure_future(self._send(batch))
+
+    async def _flush_after_wait(self):
+        await asyncio.sleep(self.max_wait)
+        self.flush_timer = None
+
+        batch, self.pending = self.pending, []
+        if batch:
+            await self._send(batch)
+
+    async def _send(self, batch: List[tuple]):
+        # A cancelled submit() cancels its future; nobody is waiting for that input any more
+        live = [entry for entry in batch if not entry[1].done()]
+        self.stats["cancelled_items"] += len(batch) - len(live)
+        if not live:
+            self.stats["skipped_batches"] += 1
+            return
+        batch = live
+
+        items = [item for item, _, _ in batch]
+        # The shared request may run as long as its most patient waiter allows
+        deadline = latest(item_deadline for _, _, item_deadline in batch)
+
+        self.stats["batches_sent"] += 1
+        self.stats["items_sent"] += len(items)
+        self.stats["largest_batch"] = max(self.stats["largest_batch"], len(items))
+
+        request = asyncio.ensure_future(self.send_batch(items, deadline))
+        futures = [future for _, future, _ in batch]
+
+        # Abort the shared request once every waiter has been cancelled
+        def abandon_if_unwanted(_future):
+            if not request.done() and all(future.cancelled() for future in futures):
+                request.cancel()
+
+        for future in futures:
+            future.add_done_callback(abandon_if_unwanted)
+
+        await asyncio.wait([request])
+        if request.cancelled():
+            return
+
+        try:
+            results = request.result()
+        except Exception as e:
+            logger.error(f"Micro-batch for {self.name} failed: {str(e)}")
+            self.stats["failed_batches"] += 1
+            results = None
+
+        # Fan results back out; a missing or short result list resolves to None,
+        # which callers already treat as "provider returned nothing"
+        results = list(results or [])
+        for index, (_, future, _) in enumerate(batch):
+            if not future.done():
+                future.set_result(results[index] if index < len(results) else None)
+
+    def get_stats(self) -> Dict:
+        """Get batching statistics"""
+        batches = self.stats["batches_sent"]
+        return {
+            **self.stats,
+            "max_batch_size": self.max_batch_size,
+            "max_wait_ms": self.max_wait * 1000.0,
+            "average_batch_size": round(self.stats["items_sent"] / batches, 2) if batches else 0.0,
+            "requests_saved": self.stats["items_sent"] - batches,
+        }
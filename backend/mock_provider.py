@@ -0,0 +1,146 @@
+import asyncio
+import logging
+import time
+from typing import Any, Dict, List, Optional
+
+logger = logging.getLogger(__name__)
+
+# Default per-minute quotas, mirroring APIProtectionManager.api_limits
+DEFAULT_MOCK_QUOTAS = {
+    'gemini': 55,
+    'deepinfra': 50,
+    'huggingface': 45,
+    'openai': 40
+}
+
+
+class MockProvider:
+    """
+    Local stand-in for the upstream AI providers, used for benchmarks and offline development.
+
+    Drop-in replacement for ``make_protected_api_call``: it accepts the same arguments and
+    returns provider-shaped JSON, simulating network latency and per-minute request quotas.
+    """
+
+    def __init__(self,
+                 request_latency: float = 0.05,
+                 per_item_latency: float = 0.005,
+                 quotas: Optional[Dict[str, int]] = None,
+                 max_concurrent_requests: Optional[int] = None,
+                 quota_window_seconds: float = 60.0):
+        self.request_latency = request_latency
+        self.per_item_latency = per_item_latency
+        self.quotas = dict(DEFAULT_MOCK_QUOTAS if quotas is None else quotas)
+        # Length of a quota "minute"; replays that compress time shrink it by the same factor
+        self.quota_window_seconds = quota_window_seconds
+
+        # Upstreams only serve a handful of concurrent requests per client
+        self.max_concurrent_requests = max_concurrent_requests
+        self.connection_slots: Optional[asyncio.Semaphore] = None
+
+        # api_type -> timestamps of accepted requests in the current minute
+        self.request_log: Dict[str, List[float]] = {}
+
+        # Metrics
+        self.stats = {
+            "requests": 0,
+            "items": 0,
+            "quota_rejections": 0,
+            "deadline_timeouts": 0,
+            "cancelled_calls": 0,
+        }
+
+    async def __call__(self, method: str, url: str, api_type: str, api_key: str, **kwargs) -> Optional[Dict]:
+        payload = kwargs.get("json") or {}
+        inputs = self._extract_inputs(api_type, payload)
+
+        if not self._take_quota(api_type):
+            self.stats["quota_rejections"] += 1
+            logger.warning(f"Mock {api_type} quota exhausted")
+            return None
+
+        self.stats["requests"] += 1
+        self.stats["items"] += len(inputs)
+
+        latency = self.request_latency + self.per_item_latency * len(inputs)
+        deadline = kwargs.get("deadline")
+        try:
+            if self.max_concurrent_requests:
+                if self.connection_slots is None:
+                    self.connection_slots = asyncio.Semaphore(self.max_concurrent_requests)
+                async with self.connection_slots:
+                    answered = await self._respond_within(latency, deadline)
+            else:
+                answered = await self._respond_within(latency, deadline)
+        except asyncio.CancelledError:
+            # The caller hung up mid-request
+            self.stats["cancelled_calls"] += 1
+            raise
+
+        if not answered:
+            # Like a real client, give up when the caller's deadline passes mid-request
+            self.stats["deadline_timeouts"] += 1
+            return None
+        return self._build_response(api_type, inputs)
+
+    @staticmethod
+    async def _respond_within(latency: float, deadline) -> bool:
+        if deadline is not None and latency > deadline.remaining():
+            await asyncio.sleep(deadline.remaining())
+            return False
+        await asyncio.sleep(latency)
+        return True
+
+    def _take_quota(self, api_type: str) -> bool:
+        limit = self.quotas.get(api_type)
+        if limit is None:
+            return True
+
+        now = time.monotonic()
+        log = self.request_log.setdefault(api_type, [])
+        log[:] = [t for t in log if now - t < self.quota_window_seconds]
+
+        if len(log) >= limit:
+            return False
+
+        log.append(now)
+        return True
+
+    @staticmethod
+    def _extract_inputs(api_type: str, payload: Dict) -> List[str]:
+        if api_type == 'gemini':
+            contents = payload.get("contents", [])
+            return [contents[-1]["parts"][0]["text"]] if contents else [""]
+        if api_type == 'openai':
+            messages = payload.get("messages", [])
+            return [messages[-1]["content"]] if messages else [""]
+
+        raw = payload.get("inputs") if api_type == 'huggingface' else payload.get("input")
+        if isinstance(raw, list):
+            return [str(item) for item in raw]
+        return [str(raw or "")]
+
+    @staticmethod
+    def _reply_for(prompt: str) -> str:
+        return f"Mock reply to a {len(prompt)}-character prompt"
+
+    def _build_response(self, api_type: str, inputs: List[str]) -> Any:
+        replies = [self._reply_for(prompt) for prompt in inputs]
+
+        if api_type == 'gemini':
+            return {"candidates": [{"content": {"parts": [{"text": replies[0]}]}}]}
+        if api_type == 'openai':
+            return {"choices": [{"message": {"content": replies[0]}}]}
+        if api_type == 'deepinfra':
+            return {"results": [{"generated_text": reply} for reply in replies]}
+
+        # Hugging Face echoes the prompt and nests batched outputs one list per input
+        outputs = [
+            [{"generated_text": f"{prompt}<|assistant|>\n{reply}"}]
+            for prompt, reply in zip(inputs, replies)
+        ]
+        return outputs if len(outputs) > 1 else outputs[0]
+
+    def get_stats(self) -> Dict:
+        """Get mock provider statistics"""
+        return dict(self.stats)
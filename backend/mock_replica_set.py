@@ -0,0 +1,304 @@
+import asyncio
+import copy
+import heapq
+import itertools
+import logging
+import time
+from typing import Any, Callable, Dict, List, Optional
+
+logger = logging.getLogger(__name__)
+
+# Collection methods that change data (replicated through the oplog); everything else is a read
+WRITE_METHODS = frozenset({
+    "insert_one", "insert_many", "update_one", "update_many", "replace_one", "delete_one", "delete_many",
+    "find_one_and_update", "find_one_and_replace", "find_one_and_delete", "bulk_write",
+    "create_index", "create_indexes", "drop_index", "drop",
+})
+CURSOR_METHODS = frozenset({"find", "aggregate"})
+
+
+def default_node_factory(name: str):
+    """One in-memory mongomock client per member"""
+    from mongomock_motor import AsyncMongoMockClient
+    return AsyncMongoMockClient()
+
+
+class MockSession:
+    """Client session with the cluster/operation time bookkeeping causal consistency relies on"""
+
+    def __init__(self, causal_consistency: bool = True):
+        self.causal_consistency = causal_consistency
+        self.cluster_time: Optional[Dict] = None
+        self.operation_time: Optional[int] = None
+
+    def advance_cluster_time(self, cluster_time: Dict):
+        if self.cluster_time is None or cluster_time["clusterTime"] > self.cluster_time["clusterTime"]:
+            self.cluster_time = cluster_time
+
+    def advance_operation_time(self, operation_time: int):
+        if self.operation_time is None or operation_time > self.operation_time:
+            self.operation_time = operation_time
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc_info):
+        return False
+
+
+class MockReplicaSet:
+    """
+    Local stand-in for a MongoDB replica set, used for tests and benchmarks of read routing.
+
+    Each member is its own database (in-memory mongomock by default; ``node_factory`` can hand
+    out clients of a real local mongod instead). Writes run on the primary and reach the
+    secondaries through an oplog after ``replication_lag`` seconds. Reads go to the member their
+    read preference selects, and reads in a causally consistent session wait on a secondary until
+    it has applied the session's operation time, as afterClusterTime does.
+
+    Drop-in for the ``AsyncIOMotorClient`` calls ``DataAccess`` makes: ``get_database`` and ``start_session``.
+    """
+
+    def __init__(self,
+                 secondaries: int = 2,
+                 replication_lag: float = 0.05,
+                 node_factory: Callable[[str], Any] = default_node_factory):
+        self.replication_lag = replication_lag
+        self.members = [node_factory(f"node{index}") for index in range(secondaries + 1)]
+        self.secondaries = list(range(1, secondaries + 1))
+        self._next_secondary = itertools.cycle(self.secondaries) if self.secondaries else None
+        self._next_member = itertools.cycle(range(len(self.members)))
+
+        self.optime = 0
+        self.applied = [0] * len(self.members)
+        self._oplogs: List[Optional[asyncio.Queue]] = [None] * len(self.members)
+        self._appliers: List[asyncio.Task] = []
+        self._replicating = False
+        # Per member: heap of (optime, sequence, future) for reads waiting on replication
+        self._waiters: List[List] = [[] for _ in self.members]
+        self._waiter_sequence = itertools.count()
+
+        # Metrics
+        self.stats = {
+            "writes": 0,
+            "primary_reads": 0,
+            "secondary_reads": 0,
+            "causal_waits": 0,
+            "causal_wait_seconds": 0.0,
+            "lagging_reads": 0,
+        }
+
+    def get_database(self, name: str, read_preference=None) -> "MockReplicaDatabase":
+        mode = getattr(read_preference, "mongos_mode", None) or "primary"
+        return MockReplicaDatabase(self, name, mode)
+
+    def __getitem__(self, name: str) -> "MockReplicaDatabase":
+        return self.get_database(name)
+
+    def __getattr__(self, name: str) -> "MockReplicaDatabase":
+        if name.startswith("_"):
+            raise AttributeError(name)
+        return self.get_database(name)
+
+    async def start_session(self, causal_consistency: bool = True, **kwargs) -> MockSession:
+        return MockSession(causal_consistency)
+
+    def select_member(self, mode: str) -> int:
+        """Member index a read with this preference mode is served by"""
+        if mode in ("secondary", "secondaryPreferred") and self._next_secondary:
+            return next(self._next_secondary)
+        if mode == "nearest":
+            return next(self._next_member)
+        return 0
+
+    def lag(self, member: int) -> int:
+        """Operations the member is behind the primary"""
+        return self.optime - self.applied[member]
+
+    def _start_replication(self):
+        self._replicating = True
+        for member in self.secondaries:
+            self._oplogs[member] = asyncio.Queue()
+            self._appliers.append(asyncio.create_task(self._apply_oplog(member)))
+
+    def record_write(self, database: str, collection: str, method: str, args, kwargs,
+                     session: Optional[MockSession]):
+        """Give the primary's write an operation time and ship it to the secondaries"""
+        if not self._replicating:
+            self._start_replication()
+        self.optime += 1
+        self.applied[0] = self.optime
+        self.stats["writes"] += 1
+        if session is not None:
+            session.advance_operation_time(self.optime)
+            session.advance_cluster_time({"clusterTime": self.optime})
+
+        # Copied after the primary ran it, so generated _ids replicate as they are
+        entry = (self.optime, time.monotonic() + self.replication_lag,
+                 database, collection, method, copy.deepcopy(args), copy.deepcopy(kwargs))
+        for member in self.secondaries:
+            self._oplogs[member].put_nowait(entry)
+
+    async def _apply_oplog(self, member: int):
+        oplog = self._oplogs[member]
+        node = self.members[member]
+        while True:
+            optime, due, database, collection, method, args, kwargs = await oplog.get()
+            delay = due - time.monotonic()
+            if delay > 0:
+                await asyncio.sleep(delay)
+            try:
+                await getattr(node[database][collection], method)(*args, **kwargs)
+            except Exception as e:
+                logger.error(f"Mock replica node{member} failed to apply {method} on {collection}: {e}")
+            self.applied[member] = optime
+            waiters = self._waiters[member]
+            while waiters and waiters[0][0] <= optime:
+                future = heapq.heappop(waiters)[2]
+                if not future.done():
+                    future.set_result(None)
+
+    async def _applied(self, member: int, optime: int):
+        if self.applied[member] >= optime:
+            return
+        future = asyncio.get_running_loop().create_future()
+        heapq.heappush(self._waiters[member], (optime, next(self._waiter_sequence), future))
+        await future
+
+    async def wait_for(self, member: int, session: Optional[MockSession]):
+        """Hold a read on ``member`` until it has applied the session's operation time"""
+        if member == 0:
+            self.stats["primary_reads"] += 1
+            return
+        self.stats["secondary_reads"] += 1
+        if session is None or not session.causal_consistency or session.operation_time is None:
+            if self.lag(member):
+                self.stats["lagging_reads"] += 1
+            return
+        if self.applied[member] >= session.operation_time:
+            return
+
+        started = time.perf_counter()
+        self.stats["causal_waits"] += 1
+        await self._applied(member, session.operation_time)
+        self.stats["causal_wait_seconds"] += time.perf_counter() - started
+
+    async def wait_until_replicated(self):
+        """Block until every secondary has caught up with the primary"""
+        optime = self.optime
+        for member in self.secondaries:
+            await self._applied(member, optime)
+
+    def close(self):
+        for applier in self._appliers:
+            applier.cancel()
+        self._appliers.clear()
+        self._replicating = False
+
+    def get_stats(self) -> Dict:
+        return {
+            **self.stats,
+            "causal_wait_seconds": round(self.stats["causal_wait_seconds"], 4),
+            "optime": self.optime,
+            "secondary_lag_ops": {f"node{member}": self.lag(member) for member in self.secondaries},
+        }
+
+
+class MockReplicaDatabase:
+    """Database handle bound to one read preference mode"""
+
+    def __init__(self, replica_set: MockReplicaSet, name: str, read_mode: str):
+        self._replica_set = replica_set
+        self.name = name
+        self.read_mode = read_mode
+
+    def get_collection(self, name: str) -> "MockReplicaCollection":
+        return MockReplicaCollection(self._replica_set, self.name, name, self.read_mode)
+
+    def __getitem__(self, name: str) -> "MockReplicaCollection":
+        return self.get_collection(name)
+
+    def __getattr__(self, name: str) -> "MockReplicaCollection":
+        if name.startswith("_"):
+            raise AttributeError(name)
+        return self.get_collection(name)
+
+
+class MockReplicaCollection:
+    """Collection whose writes go to the primary and whose reads follow the handle's read preference"""
+
+    def __init__(self, replica_set: MockReplicaSet, database: str, name: str, read_mode: str):
+        self._replica_set = replica_set
+        self._database = database
+        self.name = name
+        self._read_mode = read_mode
+
+    def _on(self, member: int):
+        return self._replica_set.members[member][self._database][self.name]
+
+    def __getattr__(self, method: str):
+        if method.startswith("_"):
+            raise AttributeError(method)
+        replica_set = self._replica_set
+
+        if method in WRITE_METHODS:
+            async def write(*args, session=None, **kwargs):
+                result = await getattr(self._on(0), method)(*args, **kwargs)
+                replica_set.record_write(self._database, self.name, method, args, kwargs, session)
+                return result
+            return write
+
+        if method in CURSOR_METHODS:
+            def open_cursor(*args, session=None, **kwargs):
+                member = replica_set.select_member(self._read_mode)
+                return MockCursor(replica_set, member, session,
+                                  lambda: getattr(self._on(member), method)(*args, **kwargs))
+            return open_cursor
+
+        async def read(*args, session=None, **kwargs):
+            member = replica_set.select_member(self._read_mode)
+            await replica_set.wait_for(member, session)
+            return await getattr(self._on(member), method)(*args, **kwargs)
+        return read
+
+
+class MockCursor:
+    """Records chained cursor options and runs the query once the member may answer it"""
+
+    def __init__(self, replica_set: MockReplicaSet, member: int, session: Optional[MockSession],
+                 open_cursor: Callable[[], Any]):
+        self._replica_set = replica_set
+        self._member = member
+        self._session = session
+        self._open_cursor = open_cursor
+        self._options: List = []
+        self._iterator = None
+
+    def __getattr__(self, option: str):
+        if option.startswith("_"):
+            raise AttributeError(option)
+
+        def chain(*args, **kwargs):
+            self._options.append((option, args, kwargs))
+            return self
+        return chain
+
+    async def _open(self):
+        if self._iterator is None:
+            await self._replica_set.wait_for(self._member, self._session)
+            cursor = self._open_cursor()
+            for option, args, kwargs in self._options:
+                cursor = getattr(cursor, option)(*args, **kwargs)
+            self._iterator = cursor
+        return self._iterator
+
+    async def to_list(self, length: Optional[int] = None) -> List:
+        cursor = await self._open()
+        return await cursor.to_list(length=length)
+
+    def __aiter__(self):
+        return self
+
+    async def __anext__(self):
+        cursor = await self._open()
+        return await cursor.__anext__()
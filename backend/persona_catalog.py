@@ -0,0 +1,205 @@
+import base64
+import hashlib
+import logging
+import os
+import sys
+import time
+from collections.abc import Mapping
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+from serialization import loads
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_CATALOG_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "personas.json")
+
+# Fields every persona carries, in the order they are served
+PERSONA_FIELDS = (
+    "bot_id", "name", "age", "bio", "interests", "personality_traits",
+    "profile_picture_url", "backstory", "conversation_style", "location",
+)
+
+# Short, heavily repeated values are interned so every persona shares one copy
+_INTERNED_FIELDS = ("conversation_style", "location")
+_INTERNED_LIST_FIELDS = ("interests", "personality_traits")
+
+# Catalog documents carry pictures inline as base64 JPEG; records only keep a URL to them,
+# named after the picture's content so clients can cache it for good
+PICTURE_URL_PREFIX = "/api/bots/pictures/"
+
+
+class PersonaRecord(Mapping):
+    """
+    Compact, read-only persona. Behaves like the profile dict it was loaded from.
+    """
+
+    __slots__ = PERSONA_FIELDS
+
+    def __init__(self, data: Dict):
+        for field in PERSONA_FIELDS:
+            value = data.get(field)
+            if field in _INTERNED_LIST_FIELDS:
+                value = tuple(sys.intern(str(item)) for item in (value or ()))
+            elif field in _INTERNED_FIELDS and isinstance(value, str):
+                value = sys.intern(value)
+            object.__setattr__(self, field, value)
+
+    def __setattr__(self, name: str, value: Any):
+        raise AttributeError("PersonaRecord is read-only; reload the catalog instead")
+
+    def __getitem__(self, key: str) -> Any:
+        if key not in PERSONA_FIELDS:
+            raise KeyError(key)
+        return getattr(self, key)
+
+    def __iter__(self) -> Iterator[str]:
+        return iter(PERSONA_FIELDS)
+
+    def __len__(self) -> int:
+        return len(PERSONA_FIELDS)
+
+    def __repr__(self) -> str:
+        return f"PersonaRecord(bot_id={self.bot_id!r}, name={self.name!r})"
+
+    def to_dict(self) -> Dict:
+        """Plain dict (lists instead of tuples) for JSON and MongoDB"""
+        return {
+            field: list(getattr(self, field)) if field in _INTERNED_LIST_FIELDS else getattr(self, field)
+            for field in PERSONA_FIELDS
+        }
+
+
+class CatalogSnapshot:
+    """One immutable generation of the catalog"""
+
+    __slots__ = ("records", "by_id", "pictures", "version", "source", "loaded_at")
+
+    def __init__(self, records: Tuple[PersonaRecord, ...], pictures: Dict[str, bytes], version: int, source: str):
+        self.records = records
+        self.by_id = {record.bot_id: record for record in records}
+        self.pictures = pictures
+        self.version = version
+        self.source = source
+        self.loaded_at = time.time()
+
+
+def parse_personas(documents: List[Dict]) -> Tuple[Tuple[PersonaRecord, ...], Dict[str, bytes]]:
+    """
+    Validate raw persona documents and turn them into records, plus the decoded profile
+    pictures by content digest (personas sharing a picture share one copy)
+    """
+    records = []
+    pictures: Dict[str, bytes] = {}
+    seen = set()
+    for document in documents:
+        bot_id = document.get("bot_id")
+        if not bot_id or not document.get("name"):
+            raise ValueError(f"Persona is missing bot_id or name: {document!r:.80}")
+        if bot_id in seen:
+            raise ValueError(f"Duplicate persona bot_id: {bot_id}")
+        seen.add(bot_id)
+
+        picture_url = None
+        if document.get("profile_picture"):
+            digest = hashlib.sha1(document["profile_picture"].encode("ascii")).hexdigest()[:16]
+            if digest not in pictures:
+                pictures[digest] = base64.b64decode(document["profile_picture"], validate=True)
+            picture_url = PICTURE_URL_PREFIX + digest
+        records.append(PersonaRecord({**document, "profile_picture_url": picture_url}))
+    return tuple(records), pictures
+
+
+class PersonaCatalog:
+    """
+    Persona catalog loaded from a JSON file or a MongoDB collection and swapped atomically on reload
+    """
+
+    def __init__(self, path: str = DEFAULT_CATALOG_PATH):
+        self.path = path
+        self.snapshot = CatalogSnapshot((), {}, version=0, source="empty")
+
+        # Personas dropped by a reload stay resolvable so live sessions with them keep working
+        self.retired: Dict[str, PersonaRecord] = {}
+        self._loaded_mtime: Optional[float] = None
+
+        # Metrics
+        self.stats = {
+            "reloads": 0,
+            "failed_reloads": 0,
+            "last_reload_seconds": 0.0,
+        }
+
+    @property
+    def records(self) -> Tuple[PersonaRecord, ...]:
+        return self.snapshot.records
+
+    def get(self, bot_id: str, include_retired: bool = True) -> Optional[PersonaRecord]:
+        """Look up a persona; retired ones only resolve for existing sessions"""
+        record = self.snapshot.by_id.get(bot_id)
+        if record is None and include_retired:
+            record = self.retired.get(bot_id)
+        return record
+
+    def picture(self, digest: str) -> Optional[bytes]:
+        """JPEG bytes of a profile picture by the digest in its URL"""
+        return self.snapshot.pictures.get(digest)
+
+    def load_file(self, path: Optional[str] = None) -> Tuple[Tuple[PersonaRecord, ...], Dict[str, bytes]]:
+        """Read and parse a catalog file: a list of personas or {"bot_profiles": [...]}"""
+        path = path or self.path
+        with open(path, "rb") as catalog_file:
+            data = loads(catalog_file.read())
+        if isinstance(data, dict):
+            data = data.get("bot_profiles", [])
+        self._loaded_mtime = os.path.getmtime(path)
+        return parse_personas(data)
+
+    async def load_collection(self, collection) -> Tuple[Tuple[PersonaRecord, ...], Dict[str, bytes]]:
+        """Read and parse every persona document from a MongoDB collection"""
+        projection = {"_id": 0, "profile_picture": 1, **{field: 1 for field in PERSONA_FIELDS}}
+        documents = await collection.find({}, projection).to_list(length=None)
+        return parse_personas(documents)
+
+    def file_changed(self) -> bool:
+        """Whether the catalog file was modified since it was last loaded"""
+        try:
+            return os.path.getmtime(self.path) != self._loaded_mtime
+        except OSError:
+            return False
+
+    def install(self, records: Tuple[PersonaRecord, ...], pictures: Dict[str, bytes], source: str):
+        """Make ``records`` and their ``pictures`` the live catalog in a single reference swap"""
+        previous = self.snapshot
+        snapshot = CatalogSnapshot(records, dict(pictures), version=previous.version + 1, source=source)
+
+        for bot_id, record in previous.by_id.items():
+            if bot_id not in snapshot.by_id:
+                self.retired[bot_id] = record
+        for bot_id in snapshot.by_id:
+            self.retired.pop(bot_id, None)
+
+        # Retired personas' pictures stay served for the sessions still showing them
+        for record in self.retired.values():
+            if record.profile_picture_url:
+                digest = record.profile_picture_url[len(PICTURE_URL_PREFIX):]
+                if digest not in snapshot.pictures and digest in previous.pictures:
+                    snapshot.pictures[digest] = previous.pictures[digest]
+
+        self.snapshot = snapshot
+        logger.info(f"Installed persona catalog v{snapshot.version}: {len(records)} personas from {source}")
+
+    def get_stats(self) -> Dict:
+        """Get catalog statistics"""
+        return {
+            **self.stats,
+            "personas": len(self.snapshot.records),
+            "retired_personas": len(self.retired),
+            "pictures": len(self.snapshot.pictures),
+            "version": self.snapshot.version,
+            "source": self.snapshot.source,
+            "loaded_at": self.snapshot.loaded_at,
+        }
+
+
+# Global persona catalog instance
+persona_catalog = PersonaCatalog(os.getenv("PERSONA_CATALOG_PATH") or DEFAULT_CATALOG_PATH)
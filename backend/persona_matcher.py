@@ -0,0 +1,280 @@
+import logging
+import time
+import zlib
+from typing import Dict, Iterable, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from persona_responder import STOPWORDS, _WORD_RE, stem
+
+logger = logging.getLogger(__name__)
+
+# Related interests share a concept feature, so "food" and "cooking" earn partial credit
+INTEREST_CONCEPTS = {
+    "food": "cuisine", "cooking": "cuisine", "cook": "cuisine", "baking": "cuisine",
+    "restaurants": "cuisine", "wine": "cuisine", "coffee": "cuisine", "recipes": "cuisine",
+    "travel": "exploring", "adventure": "exploring", "culture": "exploring", "hiking": "exploring",
+    "nature": "outdoors", "camping": "outdoors", "sustainability": "outdoors", "gardening": "outdoors",
+    "fitness": "wellness", "running": "wellness", "yoga": "wellness", "meditation": "wellness",
+    "nutrition": "wellness", "health": "wellness", "sports": "wellness",
+    "art": "creative", "creativity": "creative", "painting": "creative", "design": "creative",
+    "photography": "creative", "museums": "creative", "writing": "creative", "poetry": "creative",
+    "music": "performing", "guitar": "performing", "songwriting": "performing", "concerts": "performing",
+    "dance": "performing", "theater": "performing",
+    "technology": "tech", "gaming": "tech", "coding": "tech", "programming": "tech", "ai": "tech",
+    "science": "tech", "startups": "tech", "innovation": "tech",
+    "books": "learning", "reading": "learning", "philosophy": "learning", "history": "learning",
+    "fashion": "style", "beauty": "style", "shopping": "style", "trends": "style",
+}
+
+# Relative weight of each kind of feature before IDF weighting
+INTEREST_WEIGHT = 3.0
+CONCEPT_WEIGHT = 1.5
+TRIGRAM_WEIGHT = 0.5
+TRAIT_WEIGHT = 1.0
+TEXT_WEIGHT = 1.0
+
+# Scores closer than this count as tied when picking the top k
+TIE_TOLERANCE = 1e-6
+
+# Bound on the per-word hashing caches (the vocabulary of a catalog is far smaller)
+MAX_CACHED_WORDS = 200000
+
+
+def interest_word_features(word: str) -> List[Tuple[str, float]]:
+    """Weighted features for one interest word (shared by users and personas)"""
+    stemmed = stem(word)
+    features = [("i:" + stemmed, INTEREST_WEIGHT)]
+
+    concept = INTEREST_CONCEPTS.get(word) or INTEREST_CONCEPTS.get(stemmed)
+    if concept:
+        features.append(("c:" + concept, CONCEPT_WEIGHT))
+
+    # Character trigrams give partial credit to "photo" vs "photography"
+    padded = f"#{stemmed}#"
+    trigrams = [padded[i:i + 3] for i in range(len(padded) - 2)]
+    features.extend(("g:" + trigram, TRIGRAM_WEIGHT / len(trigrams)) for trigram in trigrams)
+    return features
+
+
+def interest_words(interests: Iterable[str]) -> List[str]:
+    """Split interests such as "urban_life" into lower-case words"""
+    return [
+        word
+        for interest in interests
+        for word in interest.lower().replace("_", " ").replace("-", " ").split()
+    ]
+
+
+class PersonaMatcher:
+    """
+    Hashed TF-IDF vectors for every persona and batched cosine top-k over them
+    """
+
+    def __init__(self, dim: int = 256, seed: Optional[int] = None):
+        self.dim = dim
+        self.rng = np.random.default_rng(seed)
+
+        # Word -> hashed (column, signed weight) pairs; words repeat heavily across personas
+        self._interest_columns: Dict[str, Tuple[Tuple[int, float], ...]] = {}
+        self._text_columns: Dict[str, Optional[int]] = {}
+
+        # (profiles, idf, vectors) replaced as one tuple, so a rebuild in a worker thread
+        # never exposes a mix of old and new state. Vectors are stored dimension-major
+        # (dim x personas) so a query only reads the rows it uses.
+        self.index: Tuple[List[Dict], np.ndarray, np.ndarray] = (
+            [], np.ones(dim, dtype=np.float32), np.zeros((dim, 0), dtype=np.float32)
+        )
+
+        # Metrics
+        self.stats = {
+            "queries": 0,
+            "users_scored": 0,
+            "query_seconds": 0.0,
+            "build_seconds": 0.0,
+        }
+
+    def _hash(self, feature: str) -> Tuple[int, float]:
+        """Column and sign of a feature; crc32 is stable across processes, unlike hash()"""
+        digest = zlib.crc32(feature.encode("utf-8"))
+        return digest % self.dim, (1.0 if digest & 0x80000000 else -1.0)
+
+    def _interest_row(self, interests: Iterable[str], columns: List[int], weights: List[float]):
+        for word in interest_words(interests):
+            hashed = self._interest_columns.get(word)
+            if hashed is None:
+                hashed = tuple(
+                    (column, sign * weight)
+                    for feature, weight in interest_word_features(word)
+                    for column, sign in [self._hash(feature)]
+                )
+                if len(self._interest_columns) < MAX_CACHED_WORDS:
+                    self._interest_columns[word] = hashed
+            for column, weight in hashed:
+                columns.append(column)
+                weights.append(weight)
+
+    def _persona_row(self, bot_profile: Dict, columns: List[int], weights: List[float]):
+        """Interests, traits, bio and backstory of one persona"""
+        self._interest_row(bot_profile.get("interests", []), columns, weights)
+
+        for trait in bot_profile.get("personality_traits", []):
+            column, sign = self._hash("t:" + stem(trait.lower()))
+            columns.append(column)
+            weights.append(sign * TRAIT_WEIGHT)
+
+        # Free text lands on the interest features, so a bio about cooking matches "cooking"
+        text_columns = []
+        text = (bot_profile.get("bio", "") + " " + bot_profile.get("backstory", "")).lower()
+        for word in _WORD_RE.findall(text):
+            if word not in self._text_columns:
+                signed = None
+                if word not in STOPWORDS:
+                    column, sign = self._hash("i:" + stem(word))
+                    signed = column if sign > 0 else ~column
+                if len(self._text_columns) < MAX_CACHED_WORDS:
+                    self._text_columns[word] = signed
+            else:
+                signed = self._text_columns[word]
+            if signed is not None:
+                text_columns.append(signed)
+
+        if text_columns:
+            weight = TEXT_WEIGHT / len(text_columns)
+            for signed in text_columns:
+                columns.append(signed if signed >= 0 else ~signed)
+                weights.append(weight if signed >= 0 else -weight)
+
+    def _hashed_matrix(self, rows: List[Tuple[List[int], List[float]]]) -> np.ndarray:
+        """Dense (len(rows) x dim) float32 matrix from per-row hashed columns and weights"""
+        lengths = np.fromiter((len(columns) for columns, _ in rows), dtype=np.int64, count=len(rows))
+        offsets = np.repeat(np.arange(len(rows), dtype=np.int64) * self.dim, lengths)
+        positions = offsets + np.fromiter(
+            (column for columns, _ in rows for column in columns), dtype=np.int64, count=int(lengths.sum())
+        )
+        values = np.fromiter(
+            (weight for _, weights in rows for weight in weights), dtype=np.float64, count=int(lengths.sum())
+        )
+        flat = np.bincount(positions, weights=values, minlength=len(rows) * self.dim)
+        return flat.reshape(len(rows), self.dim).astype(np.float32)
+
+    def build(self, profiles: Sequence[Dict]):
+        """(Re)index the persona catalog"""
+        started = time.perf_counter()
+        index = self.build_index(profiles)
+        self.install(index, time.perf_counter() - started)
+
+    def build_index(self, profiles: Sequence[Dict]) -> Tuple[List[Dict], np.ndarray, np.ndarray]:
+        """Index for ``profiles``, without touching the live one; safe to run in a thread"""
+        profiles = list(profiles)
+
+        rows = []
+        for profile in profiles:
+            columns: List[int] = []
+            weights: List[float] = []
+            self._persona_row(profile, columns, weights)
+            rows.append((columns, weights))
+        matrix = self._hashed_matrix(rows)
+
+        # Smoothed IDF over hashed columns: features every persona has say little
+        document_frequency = np.count_nonzero(matrix, axis=0)
+        idf = (np.log((1.0 + len(profiles)) / (1.0 + document_frequency)) + 1.0).astype(np.float32)
+        matrix *= idf
+
+        norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+        matrix /= np.maximum(norms, 1e-12)
+
+        return profiles, idf, np.ascontiguousarray(matrix.T)
+
+    def install(self, index: Tuple[List[Dict], np.ndarray, np.ndarray], build_seconds: float = 0.0):
+        """Make an index from ``build_index`` the live one in a single reference swap"""
+        self.index = index
+        self.stats["build_seconds"] = build_seconds
+        logger.info(f"Indexed {len(index[0])} personas in {build_seconds * 1000:.1f}ms")
+
+    @property
+    def profiles(self) -> List[Dict]:
+        return self.index[0]
+
+    def user_vectors(self, interest_lists: Sequence[Iterable[str]], idf: Optional[np.ndarray] = None) -> np.ndarray:
+        """Normalized query vectors for a batch of users"""
+        rows = []
+        for interests in interest_lists:
+            columns: List[int] = []
+            weights: List[float] = []
+            self._interest_row(interests, columns, weights)
+            rows.append((columns, weights))
+
+        matrix = self._hashed_matrix(rows) * (self.index[1] if idf is None else idf)
+        norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+        return matrix / np.maximum(norms, 1e-12)
+
+    def _break_ties(self, scores: np.ndarray, chosen: np.ndarray, k: int) -> np.ndarray:
+        """Re-pick one user's top ``k`` when more personas tie at the cut-off than fit"""
+        threshold = scores[chosen].min()
+        above = np.flatnonzero(scores > threshold + TIE_TOLERANCE)
+        tied = np.flatnonzero(np.abs(scores - threshold) <= TIE_TOLERANCE)
+        return np.concatenate([above, self.rng.choice(tied, k - len(above), replace=False)])
+
+    def top_k(self, interest_lists: Sequence[Iterable[str]], k: int = 1) -> List[List[Tuple[Dict, float]]]:
+        """Best ``k`` personas and cosine scores for each user in the batch"""
+        profiles, idf, vectors = self.index
+        if not profiles or not interest_lists:
+            return [[] for _ in interest_lists]
+
+        started = time.perf_counter()
+        k = min(k, len(profiles))
+        queries = self.user_vectors(interest_lists, idf)
+
+        # Only the hashed columns some user actually has contribute to the scores; gathering
+        # them pays off while they are few, otherwise streaming the whole matrix is cheaper
+        active = np.flatnonzero(np.any(queries != 0.0, axis=0))
+        if len(active) <= self.dim // 8:
+            scores = queries[:, active] @ vectors[active]
+        else:
+            scores = queries @ vectors
+
+        if k < len(profiles):
+            chosen = np.argpartition(scores, -k, axis=1)[:, -k:]
+            thresholds = np.take_along_axis(scores, chosen, axis=1).min(axis=1)
+            # Rows where personas outside the partition tie with the cut-off need a fair draw
+            tie_counts = np.count_nonzero(scores >= (thresholds - TIE_TOLERANCE)[:, None], axis=1)
+            for row in np.flatnonzero(tie_counts > k):
+                chosen[row] = self._break_ties(scores[row], chosen[row], k)
+        else:
+            chosen = np.tile(np.arange(len(profiles)), (len(scores), 1))
+
+        # Shuffle so equal scores come out in random order after the stable sort
+        chosen = self.rng.permuted(chosen, axis=1)
+        chosen_scores = np.take_along_axis(scores, chosen, axis=1)
+        order = np.argsort(-chosen_scores, axis=1, kind="stable")
+        chosen = np.take_along_axis(chosen, order, axis=1)
+        chosen_scores = np.take_along_axis(chosen_scores, order, axis=1)
+
+        results = [
+            [(profiles[index], float(score)) for index, score in zip(row, row_scores)]
+            for row, row_scores in zip(chosen.tolist(), chosen_scores.tolist())
+        ]
+
+        self.stats["queries"] += 1
+        self.stats["users_scored"] += len(interest_lists)
+        self.stats["query_seconds"] += time.perf_counter() - started
+        return results
+
+    def get_stats(self) -> Dict:
+        """Get matcher statistics"""
+        queries = self.stats["queries"] or 1
+        profiles, _, vectors = self.index
+        return {
+            "personas": len(profiles),
+            "dim": self.dim,
+            "vector_bytes": int(vectors.nbytes),
+            "queries": self.stats["queries"],
+            "users_scored": self.stats["users_scored"],
+            "avg_query_ms": round(self.stats["query_seconds"] / queries * 1000, 3),
+            "build_ms": round(self.stats["build_seconds"] * 1000, 3),
+        }
+
+
+# Global persona matcher instance
+persona_matcher = PersonaMatcher()
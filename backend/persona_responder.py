@@ -0,0 +1,248 @@
+import logging
+import random
+import re
+from typing import Dict, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+_WORD_RE = re.compile(r"[a-z][a-z']+")
+_SENTENCE_RE = re.compile(r"(?<=[.!?])\s+")
+
+# Words that carry no topical signal in either user messages or persona text
+STOPWORDS = frozenset("""
+a about after again all also am an and any are as at be because been before being but by can
+could did do does doing done for from get got had has have having he her here hers him his how
+i i'm if in into is it it's its just like me more most my myself no not now of off on once only
+or other our out over own really same she should so some such than that that's the their them
+then there these they this those through to too under until up very was we were what when where
+which while who why will with would you your yours yourself
+""".split())
+
+GREETINGS = frozenset(["hi", "hey", "hello", "hiya", "yo", "sup", "howdy", "heya"])
+
+# Style-specific reactions that work whatever the user said
+STYLE_REACTIONS = {
+    "enthusiastic": [
+        "That's so interesting! I'd love to hear more about that! ✨",
+        "Wow, that's amazing! Tell me more! 🌟",
+        "That sounds incredible! I'm really curious about your thoughts on this! 💫"
+    ],
+    "thoughtful": [
+        "That's a fascinating perspective. I've been thinking about something similar...",
+        "Hmm, that's really thought-provoking. It makes me reflect on a few things...",
+        "Interesting point. That connects to something I've been pondering..."
+    ],
+    "motivational": [
+        "You've got this! That's exactly the kind of thinking that leads to success! 💪",
+        "I love your energy! Keep that momentum going! 🔥",
+        "That's the spirit! You're on the right track! ⚡"
+    ],
+    "logical": [
+        "That's a logical approach. Have you considered the broader implications?",
+        "Interesting analysis. Let's think through this systematically...",
+        "Good reasoning. That follows a clear logical pattern..."
+    ],
+    "poetic": [
+        "Your words paint such a beautiful picture... 🎵",
+        "There's something lyrical about what you're saying... ✨",
+        "That touches something deep... like a melody in my mind... 🎶"
+    ],
+    "knowledgeable": [
+        "That's a great topic! Based on my experience, there's a lot to unpack there...",
+        "Ah, that reminds me of something I learned recently...",
+        "Interesting! That connects to several things I'm familiar with..."
+    ],
+    "trendy": [
+        "OMG yes! That's totally having a moment right now! ✨",
+        "So chic! You're definitely onto something there! 💫",
+        "Love that vibe! You've got such great taste! 👑"
+    ]
+}
+
+# Replies for when the user touched on one of the persona's own topics
+TOPIC_REPLIES = {
+    "enthusiastic": [
+        "Wait, you're into {topic} too?! That's one of my favorite things ever! ✨",
+        "Oh, {topic}! Don't get me started, I could talk about it for hours! 🌟"
+    ],
+    "thoughtful": [
+        "{Topic} is something I think about a lot, actually. What draws you to it?",
+        "I find {topic} endlessly fascinating... there's always another layer to it."
+    ],
+    "motivational": [
+        "{Topic}? Yes! That's exactly where progress happens! 💪",
+        "Love that you brought up {topic} - let's make it a goal! 🔥"
+    ],
+    "logical": [
+        "{Topic} is a great subject. What's the part you find most interesting?",
+        "Ah, {topic}. I've spent way too many late nights on that one."
+    ],
+    "poetic": [
+        "{Topic}... that word alone feels like the start of a song 🎵",
+        "There's so much heart in {topic}, isn't there? 🎶"
+    ],
+    "knowledgeable": [
+        "{Topic} is right up my alley! Happy to share what I've learned.",
+        "Ah, {topic}! That's something I've spent years getting better at."
+    ],
+    "trendy": [
+        "{Topic} is SO in right now, you clearly have taste! 👑",
+        "Okay, {topic} talk? I'm obsessed already ✨"
+    ]
+}
+
+GREETING_REPLIES = [
+    "Hey! I'm {name} 😊 How's your day going?",
+    "Hi there! So glad you messaged, what's up?",
+    "Hello! {name} here - what's on your mind today?"
+]
+
+QUESTION_REPLIES = [
+    "Good question! Honestly, it depends, but I'd say go with your gut.",
+    "Ooh, let me think about that one... what's your take first?",
+    "Great question! I've wondered about that too."
+]
+
+STORY_LEADS = [
+    "Funny you mention that!",
+    "Oh, that hits close to home.",
+    "Ha, that reminds me of my own story."
+]
+
+FOLLOW_UPS = [
+    "By the way, are you into {interest}? I'd love to hear your thoughts!",
+    "This reminds me - do you have any experience with {interest}?",
+    "Speaking of interests, what's your take on {interest}?"
+]
+
+
+def stem(word: str) -> str:
+    """Crude suffix stripping so "cooking", "cooked" and "cook" share a keyword"""
+    for suffix in ("ing", "ed", "s"):
+        if word.endswith(suffix) and len(word) - len(suffix) >= 3:
+            return word[:-len(suffix)]
+    return word
+
+
+def tokenize(text: str) -> List[str]:
+    """Stemmed, lower-case content words of ``text`` without stopwords"""
+    return [stem(word) for word in _WORD_RE.findall(text.lower()) if word not in STOPWORDS]
+
+
+class CompiledPersona:
+    """Pre-rendered templates and keyword model for one bot"""
+
+    __slots__ = ("name", "reactions", "topic_templates", "follow_ups", "greetings", "keywords")
+
+    def __init__(self, bot_profile: Dict):
+        self.name = bot_profile.get("name", "Assistant")
+        style = bot_profile.get("conversation_style", "enthusiastic")
+
+        self.reactions = tuple(STYLE_REACTIONS.get(style, STYLE_REACTIONS["enthusiastic"]))
+        self.topic_templates = tuple(TOPIC_REPLIES.get(style, TOPIC_REPLIES["enthusiastic"]))
+        self.greetings = tuple(reply.format(name=self.name) for reply in GREETING_REPLIES)
+
+        interests = [interest.replace("_", " ") for interest in bot_profile.get("interests", [])]
+        self.follow_ups = tuple(
+            template.format(interest=interest) for interest in interests for template in FOLLOW_UPS
+        )
+
+        # Keyword/n-gram model: unigram or bigram -> (weight, kind, payload).
+        # Interests point at a topic reply; words from the backstory point at the
+        # backstory sentence they came from, so the bot can share that bit of its life.
+        self.keywords: Dict[str, Tuple[float, str, str]] = {}
+        for interest in interests:
+            interest_words = tokenize(interest)
+            self._add(" ".join(interest_words), 3.0, "topic", interest)
+            for word in interest_words:
+                self._add(word, 2.0, "topic", interest)
+
+        for sentence in _SENTENCE_RE.split(bot_profile.get("backstory", "")):
+            sentence = sentence.strip()
+            if not sentence:
+                continue
+            story = sentence if sentence[-1] in ".!?" else sentence + "."
+            words = [word for word in tokenize(sentence) if len(word) >= 4]
+            for index, word in enumerate(words):
+                self._add(word, 1.0, "story", story)
+                if index + 1 < len(words):
+                    self._add(f"{word} {words[index + 1]}", 1.5, "story", story)
+
+    def _add(self, gram: str, weight: float, kind: str, payload: str):
+        current = self.keywords.get(gram)
+        if current is None or current[0] < weight:
+            self.keywords[gram] = (weight, kind, payload)
+
+    def best_match(self, words: List[str]) -> Optional[Tuple[float, str, str]]:
+        """Highest-weighted persona keyword mentioned in ``words``"""
+        best = None
+        grams = words + [f"{words[i]} {words[i + 1]}" for i in range(len(words) - 1)]
+        for gram in grams:
+            hit = self.keywords.get(gram)
+            if hit and (best is None or hit[0] > best[0]):
+                best = hit
+        return best
+
+
+class PersonaResponseEngine:
+    """
+    Offline persona response engine for the fallback tier when every provider is down
+    """
+
+    def __init__(self):
+        self.personas: Dict[str, CompiledPersona] = {}
+
+    @staticmethod
+    def _persona_key(bot_profile: Dict) -> str:
+        return bot_profile.get("bot_id") or bot_profile.get("name", "")
+
+    def compile(self, bot_profiles: List[Dict]):
+        """Pre-build templates and keyword models for every bot (call once at startup)"""
+        self.install(self.compile_personas(bot_profiles))
+
+    def compile_personas(self, bot_profiles: List[Dict]) -> Dict[str, CompiledPersona]:
+        """Compiled personas for ``bot_profiles``, without touching the live ones; safe to run in a thread"""
+        return {self._persona_key(profile): CompiledPersona(profile) for profile in bot_profiles}
+
+    def install(self, personas: Dict[str, CompiledPersona]):
+        """Make personas from ``compile_personas`` the live ones in a single reference swap"""
+        self.personas = personas
+        logger.info(f"Compiled offline responses for {len(personas)} personas")
+
+    def _get_persona(self, bot_profile: Dict) -> CompiledPersona:
+        key = self._persona_key(bot_profile)
+        persona = self.personas.get(key)
+        if persona is None:
+            persona = CompiledPersona(bot_profile)
+            self.personas[key] = persona
+        return persona
+
+    def respond(self, message: str, bot_profile: Dict, context: List[Dict] = None) -> str:
+        """Build an in-character reply to ``message`` without any upstream call"""
+        persona = self._get_persona(bot_profile)
+        words = tokenize(message or "")
+        raw_words = (message or "").lower().split()
+
+        if raw_words and raw_words[0].strip("!.,") in GREETINGS and len(raw_words) <= 4:
+            return random.choice(persona.greetings)
+
+        match = persona.best_match(words) if words else None
+        if match:
+            _, kind, payload = match
+            if kind == "topic":
+                template = random.choice(persona.topic_templates)
+                return template.format(topic=payload, Topic=payload[:1].upper() + payload[1:])
+            return f"{random.choice(STORY_LEADS)} {payload}"
+
+        if (message or "").rstrip().endswith("?"):
+            response = random.choice(QUESTION_REPLIES)
+        else:
+            response = random.choice(persona.reactions)
+
+        if persona.follow_ups:
+            response += f" {random.choice(persona.follow_ups)}"
+        return response
+
+
+# Global offline response engine instance
+persona_responder = PersonaResponseEngine()
@@ -0,0 +1,146 @@
+import asyncio
+import hashlib
+import json
+import logging
+import random
+import re
+from typing import Awaitable, Callable, Dict, List, Tuple
+
+logger = logging.getLogger(__name__)
+
+# Light-touch openers used when a subscriber opts in to variation, so users who
+# sent the same message at the same moment don't all see a byte-identical reply.
+VARIATION_OPENERS = ["Haha, ", "Oh, ", "Honestly, ", "Hmm, ", "Ooh, ", "Okay so, "]
+
+_WHITESPACE_RE = re.compile(r"\s+")
+
+
+class RequestCoalescer:
+    """
+    Single-flight layer: concurrent identical generations share one upstream call
+    """
+
+    def __init__(self, context_window: int = 10):
+        # Number of trailing context messages that participate in the fingerprint
+        self.context_window = context_window
+
+        # coalescing key -> shared in-flight task
+        self.in_flight: Dict[Tuple[str, str, str], asyncio.Task] = {}
+        # shared task -> subscribers still waiting on it
+        self.waiters: Dict[asyncio.Task, int] = {}
+
+        # Metrics
+        self.stats = {
+            "upstream_calls": 0,
+            "coalesced_requests": 0,
+            "varied_responses": 0,
+            "cancelled_generations": 0,
+        }
+
+    @staticmethod
+    def normalize_prompt(prompt: str) -> str:
+        """Normalize a user prompt so trivially different spellings coalesce"""
+        return _WHITESPACE_RE.sub(" ", (prompt or "").strip().lower())
+
+    def context_fingerprint(self, context: List[Dict] = None) -> str:
+        """Stable hash of the conversation context that influences generation"""
+        if not context:
+            return ""
+
+        recent = [
+            (msg.get("type", ""), msg.get("content", ""))
+            for msg in context[-self.context_window:]
+        ]
+        encoded = json.dumps(recent, ensure_ascii=False, separators=(",", ":"))
+        return hashlib.sha1(encoded.encode("utf-8")).hexdigest()
+
+    def make_key(self, prompt: str, bot_profile: Dict, context: List[Dict] = None) -> Tuple[str, str, str]:
+        """Build the (bot_id, normalized prompt, context fingerprint) coalescing key"""
+        return (
+            bot_profile.get("bot_id", bot_profile.get("name", "")),
+            self.normalize_prompt(prompt),
+            self.context_fingerprint(context),
+        )
+
+    async def run(self,
+                  key: Tuple[str, str, str],
+                  generate: Callable[[], Awaitable[str]],
+                  vary: bool = False) -> str:
+        """
+        Await the shared generation for ``key``, starting it if nobody else has
+        """
+        task = self.in_flight.get(key)
+        is_leader = task is None
+
+        if is_leader:
+            self.stats["upstream_calls"] += 1
+            task = asyncio.ensure_future(generate())
+            self.in_flight[key] = task
+            task.add_done_callback(lambda _t: self._forget(key, _t))
+        else:
+            self.stats["coalesced_requests"] += 1
+            logger.info(f"Coalesced generation for bot {key[0]} onto in-flight call")
+
+        # Shield so one subscriber going away doesn't cancel everyone else's answer;
+        # the shared call is only cancelled once the last subscriber has gone
+        self.waiters[task] = self.waiters.get(task, 0) + 1
+        try:
+            response = await asyncio.shield(task)
+        except asyncio.CancelledError:
+            if self._leave(task) == 0 and not task.done():
+                task.cancel()
+                self.stats["cancelled_generations"] += 1
+                logger.info(f"Cancelled generation for bot {key[0]}: every subscriber went away")
+            raise
+        except BaseException:
+            self._leave(task)
+            raise
+        self._leave(task)
+
+        if vary and not is_leader:
+            response = self.apply_variation(response)
+
+        return response
+
+    def apply_variation(self, response: str) -> str:
+        """Apply a small per-subscriber variation to a shared response"""
+        if not response:
+            return response
+
+        self.stats["varied_responses"] += 1
+        opener = random.choice(VARIATION_OPENERS)
+
+        # Lower-case an ordinary leading word, but leave "I", names and acronyms alone
+        first_word = response.split(" ", 1)[0]
+        if len(first_word) > 1 and first_word[0] != "I" and first_word[1:].islower():
+            response = response[0].lower() + response[1:]
+
+        return opener + response
+
+    def _leave(self, task: asyncio.Task) -> int:
+        """Drop one subscriber of ``task`` and return how many are left"""
+        remaining = self.waiters.get(task, 1) - 1
+        if remaining > 0:
+            self.waiters[task] = remaining
+        else:
+            self.waiters.pop(task, None)
+        return remaining
+
+    def _forget(self, key: Tuple[str, str, str], task: asyncio.Task):
+        if self.in_flight.get(key) is task:
+            del self.in_flight[key]
+
+    def get_stats(self) -> Dict:
+        """Get coalescing statistics"""
+        total = self.stats["upstream_calls"] + self.stats["coalesced_requests"]
+        return {
+            **self.stats,
+            "upstream_calls_saved": self.stats["coalesced_requests"],
+            "in_flight": len(self.in_flight),
+            "waiting_subscribers": sum(self.waiters.values()),
+            "coalescing_ratio": round(self.stats["coalesced_requests"] / total, 4) if total else 0.0,
+        }
+
+
+# Global request coalescer instance
+request_coalescer = RequestCoalescer()
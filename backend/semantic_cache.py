@@ -0,0 +1,282 @@
+import logging
+import os
+import re
+import time
+import zlib
+from collections import OrderedDict, deque
+from typing import Deque, Dict, List, Optional, Tuple
+
+import numpy as np
+
+from persona_responder import STOPWORDS, stem
+
+logger = logging.getLogger(__name__)
+
+_TOKEN_RE = re.compile(r"[a-z0-9]+(?:'[a-z]+)?")
+
+# Chat shorthand and contractions spelled out, so "wat do u do" and "what do you do" embed alike
+SHORTHAND = {
+    "u": "you", "ya": "you", "yu": "you", "ur": "your", "youre": "you are", "you're": "you are",
+    "r": "are", "wat": "what", "wut": "what", "whats": "what is", "what's": "what is",
+    "wheres": "where is", "where's": "where is", "hows": "how is", "how's": "how is",
+    "whos": "who is", "who's": "who is", "im": "i am", "i'm": "i am", "ive": "i have", "i've": "i have",
+    "dont": "do not", "don't": "do not", "doesnt": "does not", "doesn't": "does not",
+    "cant": "can not", "can't": "can not", "wanna": "want to", "gonna": "going to",
+    "pls": "please", "plz": "please", "thx": "thanks", "ty": "thanks", "tho": "though",
+    "bc": "because", "cuz": "because", "abt": "about", "rn": "right now", "fav": "favorite",
+    "fave": "favorite", "favourite": "favorite", "hobbys": "hobbies",
+}
+
+# Words that mean the same thing in small talk share one token
+SYNONYMS = {
+    "hi": "hello", "hey": "hello", "hiya": "hello", "howdy": "hello", "heya": "hello",
+    "occupation": "job", "profession": "job", "career": "job",
+    "film": "movie", "films": "movies", "flick": "movie",
+    "song": "music", "songs": "music", "tunes": "music",
+    "book": "books", "novel": "books", "novels": "books",
+    "pastime": "hobby", "pastimes": "hobbies",
+    "hometown": "home", "reside": "live",
+}
+
+# Relative weight of each kind of feature
+WORD_WEIGHT = 1.0
+STOPWORD_WEIGHT = 0.4
+BIGRAM_WEIGHT = 0.5
+TRIGRAM_WEIGHT = 0.6
+
+# Best-similarity histogram buckets reported by get_stats
+SIMILARITY_BUCKETS = 10
+
+
+def message_tokens(message: str) -> List[str]:
+    """Lower-case tokens with shorthand expanded and synonyms folded"""
+    tokens = []
+    for token in _TOKEN_RE.findall(message.lower()):
+        for word in SHORTHAND.get(token, token).split():
+            tokens.append(SYNONYMS.get(word, word))
+    return tokens
+
+
+class MessageEmbedder:
+    """
+    Hashing-trick embedding of a chat message: words, word bigrams (order) and character
+    trigrams (partial credit for misspellings), signed-hashed into ``dim`` columns and
+    L2-normalised. No model and no vocabulary to fit.
+    """
+
+    def __init__(self, dim: int = 256):
+        self.dim = dim
+
+    def _hash(self, feature: str) -> Tuple[int, float]:
+        """Column and sign of a feature; crc32 is stable across processes, unlike hash()"""
+        digest = zlib.crc32(feature.encode("utf-8"))
+        return digest % self.dim, (1.0 if digest & 0x80000000 else -1.0)
+
+    def features(self, message: str) -> List[Tuple[str, float]]:
+        tokens = message_tokens(message)
+        features = []
+        for index, token in enumerate(tokens):
+            stemmed = stem(token)
+            features.append(("w:" + stemmed, STOPWORD_WEIGHT if token in STOPWORDS else WORD_WEIGHT))
+            if index:
+                features.append(("b:" + stem(tokens[index - 1]) + " " + stemmed, BIGRAM_WEIGHT))
+            if token not in STOPWORDS:
+                padded = f"#{token}#"
+                trigrams = [padded[i:i + 3] for i in range(len(padded) - 2)]
+                features.extend(("g:" + trigram, TRIGRAM_WEIGHT / len(trigrams)) for trigram in trigrams)
+        return features
+
+    def embed(self, message: str) -> np.ndarray:
+        vector = np.zeros(self.dim, dtype=np.float32)
+        for feature, weight in self.features(message):
+            column, sign = self._hash(feature)
+            vector[column] += sign * weight
+        norm = np.linalg.norm(vector)
+        return vector / norm if norm > 0 else vector
+
+
+class PersonaShard:
+    """One persona's cached messages: a growable matrix of embeddings and the replies"""
+
+    def __init__(self, dim: int, capacity: int = 64):
+        self.vectors = np.zeros((capacity, dim), dtype=np.float32)
+        self.replies: List[Optional[str]] = [None] * capacity
+        self.messages: List[Optional[str]] = [None] * capacity
+        self.size = 0  # rows in use, including freed ones
+        self.free: List[int] = []
+
+    def add(self, vector: np.ndarray, message: str, reply: str) -> int:
+        if self.free:
+            row = self.free.pop()
+        else:
+            if self.size == len(self.vectors):
+                grown = np.zeros((len(self.vectors) * 2, self.vectors.shape[1]), dtype=np.float32)
+                grown[:self.size] = self.vectors
+                self.vectors = grown
+                self.replies.extend([None] * self.size)
+                self.messages.extend([None] * self.size)
+            row = self.size
+            self.size += 1
+        self.vectors[row] = vector
+        self.replies[row] = reply
+        self.messages[row] = message
+        return row
+
+    def remove(self, row: int):
+        # A zero row scores 0 against every query, so it can never be a hit
+        self.vectors[row] = 0.0
+        self.replies[row] = None
+        self.messages[row] = None
+        self.free.append(row)
+
+    def nearest(self, query: np.ndarray) -> Tuple[int, float]:
+        """Row and cosine similarity of the closest cached message"""
+        scores = self.vectors[:self.size] @ query
+        row = int(np.argmax(scores))
+        return row, float(scores[row])
+
+    def nbytes(self) -> int:
+        text = sum(len(reply) + len(message) for reply, message in zip(self.replies, self.messages) if reply)
+        return self.vectors.nbytes + text
+
+
+class SemanticCache:
+    """
+    Near-duplicate reply cache in front of AI generation, one shard per persona.
+
+    Upstream replies to context-free turns are stored under an embedding of the user's
+    message; a later message to the same persona whose embedding is at least ``threshold``
+    cosine-similar to a cached one gets that reply without an upstream call. The shards are
+    small enough that an exact NumPy scan beats building an ANN index. At most
+    ``max_entries`` replies are kept, least recently used evicted first.
+    """
+
+    def __init__(self,
+                 enabled: bool = False,
+                 threshold: float = 0.9,
+                 max_entries: int = 20000,
+                 dim: int = 256,
+                 recent_similarities: int = 2000):
+        self.enabled = enabled
+        self.threshold = threshold
+        self.max_entries = max_entries
+        self.embedder = MessageEmbedder(dim)
+
+        self.shards: Dict[str, PersonaShard] = {}
+        # (bot_id, row) in least-recently-used order
+        self.lru: "OrderedDict[Tuple[str, int], None]" = OrderedDict()
+
+        # Best similarity of each lookup: a histogram over all of them, and the recent ones
+        # split by outcome for percentiles
+        self.similarity_histogram = [0] * SIMILARITY_BUCKETS
+        self.recent_hit_similarities: Deque[float] = deque(maxlen=recent_similarities)
+        self.recent_miss_similarities: Deque[float] = deque(maxlen=recent_similarities)
+
+        # Metrics
+        self.stats = {
+            "lookups": 0,
+            "hits": 0,
+            "misses": 0,
+            "stores": 0,
+            "evictions": 0,
+            "lookup_seconds": 0.0,
+        }
+
+    def lookup(self, bot_id: str, message: str) -> Optional[str]:
+        """The cached reply to a message close enough to ``message``, or ``None``"""
+        if not self.enabled:
+            return None
+        started = time.perf_counter()
+        self.stats["lookups"] += 1
+
+        shard = self.shards.get(bot_id)
+        similarity, reply = 0.0, None
+        if shard is not None and len(shard.free) < shard.size:
+            row, similarity = shard.nearest(self.embedder.embed(message))
+            if similarity >= self.threshold:
+                reply = shard.replies[row]
+                self.lru.move_to_end((bot_id, row))
+
+        bucket = min(SIMILARITY_BUCKETS - 1, max(0, int(similarity * SIMILARITY_BUCKETS)))
+        self.similarity_histogram[bucket] += 1
+        if reply is not None:
+            self.stats["hits"] += 1
+            self.recent_hit_similarities.append(similarity)
+        else:
+            self.stats["misses"] += 1
+            self.recent_miss_similarities.append(similarity)
+        self.stats["lookup_seconds"] += time.perf_counter() - started
+        return reply
+
+    def store(self, bot_id: str, message: str, reply: str):
+        """Remember an upstream ``reply`` to ``message`` for this persona"""
+        if not self.enabled or not reply:
+            return
+        vector = self.embedder.embed(message)
+        if not vector.any():
+            return  # nothing to match on, e.g. only punctuation
+
+        shard = self.shards.get(bot_id)
+        if shard is None:
+            shard = self.shards[bot_id] = PersonaShard(self.embedder.dim)
+        elif len(shard.free) < shard.size:
+            row, similarity = shard.nearest(vector)
+            if similarity >= 0.999:
+                # Same message again (e.g. a racing miss): refresh instead of duplicating
+                shard.replies[row] = reply
+                self.lru.move_to_end((bot_id, row))
+                return
+
+        row = shard.add(vector, message, reply)
+        self.lru[(bot_id, row)] = None
+        self.stats["stores"] += 1
+        while len(self.lru) > self.max_entries:
+            (evicted_bot, evicted_row), _ = self.lru.popitem(last=False)
+            evicted_shard = self.shards[evicted_bot]
+            evicted_shard.remove(evicted_row)
+            if len(evicted_shard.free) == evicted_shard.size:
+                # Personas nobody talks to any more don't keep their matrix
+                del self.shards[evicted_bot]
+            self.stats["evictions"] += 1
+
+    def clear(self):
+        """Forget every cached reply (personas changed)"""
+        self.shards.clear()
+        self.lru.clear()
+
+    @staticmethod
+    def _percentiles(values) -> Optional[Dict]:
+        if not values:
+            return None
+        p50, p90, p99 = np.percentile(np.fromiter(values, dtype=np.float64), [50, 90, 99])
+        return {"p50": round(float(p50), 3), "p90": round(float(p90), 3), "p99": round(float(p99), 3)}
+
+    def get_stats(self) -> Dict:
+        lookups = self.stats["lookups"]
+        return {
+            "enabled": self.enabled,
+            "threshold": self.threshold,
+            "entries": len(self.lru),
+            "max_entries": self.max_entries,
+            "personas": len(self.shards),
+            "memory_bytes": sum(shard.nbytes() for shard in self.shards.values()),
+            "hit_rate": round(self.stats["hits"] / lookups, 4) if lookups else 0.0,
+            "avg_lookup_ms": round(self.stats["lookup_seconds"] / lookups * 1000, 4) if lookups else 0.0,
+            "similarity_histogram": {
+                f"{bucket / SIMILARITY_BUCKETS:.1f}-{(bucket + 1) / SIMILARITY_BUCKETS:.1f}": count
+                for bucket, count in enumerate(self.similarity_histogram)
+            },
+            "hit_similarity": self._percentiles(self.recent_hit_similarities),
+            "miss_similarity": self._percentiles(self.recent_miss_similarities),
+            **self.stats,
+            "lookup_seconds": round(self.stats["lookup_seconds"], 4),
+        }
+
+
+# Global semantic cache instance
+semantic_cache = SemanticCache(
+    enabled=os.getenv("SEMANTIC_CACHE_ENABLED", "false").lower() == "true",
+    threshold=float(os.getenv("SEMANTIC_CACHE_THRESHOLD", "0.9")),
+    max_entries=int(os.getenv("SEMANTIC_CACHE_MAX_ENTRIES", "20000")),
+    dim=int(os.getenv("SEMANTIC_CACHE_DIM", "256"))
+)
@@ -0,0 +1,135 @@
+import hashlib
+import json
+import logging
+from collections.abc import Mapping
+from datetime import date, datetime
+from typing import Any, Callable, Dict, List, Optional, Union
+
+from fastapi.responses import JSONResponse, Response
+
+logger = logging.getLogger(__name__)
+
+try:
+    import orjson
+    ORJSON_AVAILABLE = True
+except ImportError:
+    ORJSON_AVAILABLE = False
+
+try:
+    import msgpack
+    MSGPACK_AVAILABLE = True
+except ImportError:
+    MSGPACK_AVAILABLE = False
+
+try:
+    from bson import ObjectId
+except ImportError:
+    ObjectId = None
+
+
+def _default(obj: Any) -> Any:
+    """Encode the non-JSON types that come back from MongoDB"""
+    if ObjectId is not None and isinstance(obj, ObjectId):
+        return str(obj)
+    if isinstance(obj, (datetime, date)):
+        return obj.isoformat()
+    if isinstance(obj, (set, frozenset, tuple)):
+        return list(obj)
+    if isinstance(obj, bytes):
+        return obj.decode("utf-8", errors="replace")
+    if isinstance(obj, Mapping):
+        return dict(obj)
+    raise TypeError(f"Object of type {type(obj).__name__} is not JSON serializable")
+
+
+if ORJSON_AVAILABLE:
+    # Naive datetimes are written without a UTC offset, matching datetime.isoformat()
+    _ORJSON_OPTIONS = orjson.OPT_NON_STR_KEYS
+
+    def dumps_bytes(obj: Any) -> bytes:
+        """Serialize ``obj`` to UTF-8 JSON bytes"""
+        return orjson.dumps(obj, default=_default, option=_ORJSON_OPTIONS)
+
+    def loads(data: Any) -> Any:
+        """Parse JSON from ``str`` or ``bytes``"""
+        return orjson.loads(data)
+else:
+    def dumps_bytes(obj: Any) -> bytes:
+        """Serialize ``obj`` to UTF-8 JSON bytes"""
+        return json.dumps(obj, default=_default, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+
+    def loads(data: Any) -> Any:
+        """Parse JSON from ``str`` or ``bytes``"""
+        return json.loads(data)
+
+
+def dumps(obj: Any) -> str:
+    """Serialize ``obj`` to a JSON string (for WebSocket text frames)"""
+    return dumps_bytes(obj).decode("utf-8")
+
+
+# WebSocket subprotocol clients request to receive binary MessagePack frames instead of JSON text
+MSGPACK_SUBPROTOCOL = "msgpack"
+
+
+def negotiate_frame_protocol(requested_subprotocols: List[str]) -> Optional[str]:
+    """Pick the frame format for a WebSocket from the client's requested subprotocols"""
+    if MSGPACK_AVAILABLE and MSGPACK_SUBPROTOCOL in (requested_subprotocols or []):
+        return MSGPACK_SUBPROTOCOL
+    return None
+
+
+def encode_frame(payload: Any, protocol: Optional[str] = None) -> Union[str, bytes]:
+    """Encode a WebSocket frame: MessagePack bytes or JSON text"""
+    if protocol == MSGPACK_SUBPROTOCOL:
+        return msgpack.packb(payload, default=_default, use_bin_type=True)
+    return dumps(payload)
+
+
+def decode_frame(data: Union[str, bytes], protocol: Optional[str] = None) -> Any:
+    """Decode a WebSocket frame produced by the client in the negotiated format"""
+    if protocol == MSGPACK_SUBPROTOCOL and isinstance(data, (bytes, bytearray)):
+        return msgpack.unpackb(data, raw=False)
+    return loads(data)
+
+
+class FastJSONResponse(JSONResponse):
+    """
+    JSON response rendered with orjson, with native ObjectId and datetime support.
+
+    Return it directly from hot endpoints to skip FastAPI's jsonable_encoder pass.
+    """
+
+    def render(self, content: Any) -> bytes:
+        return dumps_bytes(content)
+
+
+class CachedJSONPayload:
+    """
+    Pre-encoded JSON body for static payloads such as the bot catalog
+    """
+
+    def __init__(self, build: Callable[[], Any]):
+        self.build = build
+        self.body: Optional[bytes] = None
+        self.etag: Optional[str] = None
+
+    def invalidate(self):
+        """Drop the cached bytes so the next response re-encodes the payload"""
+        self.body = None
+        self.etag = None
+
+    def _encode(self):
+        self.body = dumps_bytes(self.build())
+        self.etag = '"' + hashlib.sha1(self.body).hexdigest() + '"'
+
+    def response(self, if_none_match: Optional[str] = None) -> Response:
+        """Serve the cached bytes, or 304 when the client already has them"""
+        if self.body is None:
+            self._encode()
+
+        headers: Dict[str, str] = {"ETag": self.etag, "Cache-Control": "no-cache"}
+        if if_none_match and if_none_match == self.etag:
+            return Response(status_code=304, headers=headers)
+
+        return Response(content=self.body, media_type="application/json", headers=headers)
@@ -1,15 +1,21 @@
-from fastapi import FastAPI, HTTPException, WebSocket, WebSocketDisconnect, Depends
+import time
+
+# Cold-start accounting starts before the heavy framework imports
+_IMPORT_STARTED = time.perf_counter()
+
+from fastapi import FastAPI, HTTPException, WebSocket, Depends, Header
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import Response, StreamingResponse
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
-from motor.motor_asyncio import AsyncIOMotorClient
 import os
 from dotenv import load_dotenv
 import uuid
 import json
 import asyncio
+from contextlib import asynccontextmanager
 from datetime import datetime, timedelta
 import random
-from typing import Dict, List, Optional
+from typing import Awaitable, Dict, List, Optional
 import base64
 from pydantic import BaseModel
 import logging
@@ -21,19 +27,164 @@ logger = logging.getLogger(__name__)
 import sys
 sys.path.append('/app/backend')
 
-# Import our IP protection and AI service managers
-try:
-    from api_protection import initialize_protection, protection_manager
-    from ai_service_manager import ai_service_manager
+# Load environment variables before anything reads them
+load_dotenv()
+
+from persona_responder import persona_responder
+from serialization import FastJSONResponse, CachedJSONPayload
+from compression import CompressionMiddleware
+from turn_metrics import TurnMetrics
+from deadlines import Deadline
+from user_cache import UserCache, USER_CACHE_FIELDS
+from persona_matcher import persona_matcher
+from persona_catalog import persona_catalog
+from chat_export import chat_exporter, decode_export_cursor
+from session_lifecycle import session_lifecycle
+from connection_manager import manager, Inbox
+from event_stream import stream_turn_events, SSE_HEADERS
+from pymongo import UpdateOne
+from data_access import DataAccess, read_preferences_from_env
+from storage import make_storage
+from semantic_cache import semantic_cache
+
+# IP protection and AI service managers are imported lazily by load_protection_modules(),
+# so importing this module (tests, autoscaled pods) doesn't pay for aiohttp and friends
+PROTECTION_ENABLED = False
+initialize_protection = None
+protection_manager = None
+ai_service_manager = None
+admission_controller = None
+
+def load_protection_modules() -> bool:
+    """Import the provider and protection machinery on first use"""
+    global PROTECTION_ENABLED, initialize_protection, protection_manager, ai_service_manager, admission_controller
+    if PROTECTION_ENABLED:
+        return True
+    
+    try:
+        import api_protection
+        import ai_service_manager as ai_service_module
+        import admission_control
+    except ImportError as e:
+        logger.warning(f"Protection modules not available: {e}")
+        return False
+    
+    initialize_protection = api_protection.initialize_protection
+    protection_manager = api_protection.protection_manager
+    ai_service_manager = ai_service_module.ai_service_manager
+    admission_controller = admission_control.admission_controller
     PROTECTION_ENABLED = True
-except ImportError as e:
-    logger.warning(f"Protection modules not available: {e}")
-    PROTECTION_ENABLED = False
+    return True
 
-# Load environment variables
-load_dotenv()
+# Where users, sessions and messages live: mongodb, sqlite or memory
+STORAGE_BACKEND = os.getenv("STORAGE_BACKEND", "mongodb")
+storage = None
+
+# MongoDB connection (opened in the lifespan handler, not at import time). Exports, retention
+# and the persona catalog collection need it; with other storage backends it stays None.
+MONGO_URL = os.getenv("MONGO_URL", "mongodb://localhost:27017/chatapp")
+client = None
+db = None
+# Read/write routing over the same client; ``db`` is its primary (write) handle
+data_access = None
+CAUSAL_READS = os.getenv("CAUSAL_READS", "true").lower() == "true"
+CAUSAL_READ_WINDOW_SECONDS = float(os.getenv("CAUSAL_READ_WINDOW_SECONDS", "300"))
+READ_MAX_STALENESS_SECONDS = int(os.getenv("READ_MAX_STALENESS_SECONDS", "-1"))
+
+# Cold-start budgets; exceeding them is logged and reported by /api/admin/startup-metrics
+IMPORT_TIME_BUDGET_SECONDS = float(os.getenv("IMPORT_TIME_BUDGET_SECONDS", "1.5"))
+TIME_TO_READY_BUDGET_SECONDS = float(os.getenv("TIME_TO_READY_BUDGET_SECONDS", "2.5"))
+startup_metrics = {}
+
+def require_mongodb(feature: str):
+    """Refuse MongoDB-only admin features when another storage backend is configured"""
+    if db is None:
+        raise HTTPException(status_code=503, detail=f"{feature} requires STORAGE_BACKEND=mongodb")
+
+def connect_database():
+    """Create the storage backend (and the Motor client, which connects lazily on the first operation)"""
+    global client, db, data_access, storage
+    if STORAGE_BACKEND != "mongodb":
+        storage = make_storage(STORAGE_BACKEND)
+        return
+    
+    from motor.motor_asyncio import AsyncIOMotorClient
+    client = AsyncIOMotorClient(MONGO_URL)
+    data_access = DataAccess(
+        client, "chatapp",
+        read_preferences=read_preferences_from_env(),
+        max_staleness_seconds=READ_MAX_STALENESS_SECONDS,
+        causal_consistency=CAUSAL_READS,
+        causal_window_seconds=CAUSAL_READ_WINDOW_SECONDS
+    )
+    db = data_access.writer
+    storage = make_storage("mongodb", data_access)
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """Startup and shutdown work for the application"""
+    startup_started = time.perf_counter()
+    
+    connect_database()
+    
+    # Load personas and compile the matcher and offline fallback tier before serving
+    await reload_persona_catalog()
+    
+    await initialize_protection_systems()
+    
+    # Index maintenance talks to MongoDB, so it runs after we start serving
+    index_task = asyncio.create_task(ensure_indexes_in_background()) if db is not None else None
+    catalog_watch_task = (
+        asyncio.create_task(watch_persona_catalog()) if PERSONA_CATALOG_WATCH_SECONDS > 0 else None
+    )
+    lifecycle_task = (
+        asyncio.create_task(run_session_lifecycle())
+        if SESSION_LIFECYCLE_INTERVAL_SECONDS > 0 and db is not None else None
+    )
+    reaper_task = (
+        asyncio.create_task(run_connection_reaper()) if manager.heartbeat_interval > 0 else None
+    )
+    limits_checkpoint_task = (
+        asyncio.create_task(checkpoint_adaptive_limits())
+        if PROTECTION_ENABLED and ADAPTIVE_LIMITS_SAVE_SECONDS > 0 else None
+    )
+    
+    ready = time.perf_counter()
+    startup_metrics.update({
+        "import_seconds": round(IMPORT_SECONDS, 4),
+        "startup_seconds": round(ready - startup_started, 4),
+        "time_to_ready_seconds": round(ready - _IMPORT_STARTED, 4),
+        "import_budget_seconds": IMPORT_TIME_BUDGET_SECONDS,
+        "time_to_ready_budget_seconds": TIME_TO_READY_BUDGET_SECONDS
+    })
+    startup_metrics["within_budget"] = (
+        startup_metrics["import_seconds"] <= IMPORT_TIME_BUDGET_SECONDS
+        and startup_metrics["time_to_ready_seconds"] <= TIME_TO_READY_BUDGET_SECONDS
+    )
+    if startup_metrics["within_budget"]:
+        logger.info(f"Ready in {startup_metrics['time_to_ready_seconds']}s (import {startup_metrics['import_seconds']}s)")
+    else:
+        logger.warning(f"Cold start over budget: {startup_metrics}")
+    
+    yield
+    
+    if index_task:
+        index_task.cancel()
+    if catalog_watch_task:
+        catalog_watch_task.cancel()
+    if lifecycle_task:
+        lifecycle_task.cancel()
+    if reaper_task:
+        reaper_task.cancel()
+    if limits_checkpoint_task:
+        limits_checkpoint_task.cancel()
+    if PROTECTION_ENABLED and protection_manager.adaptive_limits.dirty:
+        await save_adaptive_limits()
+    await storage.close()
+    if client:
+        client.close()
 
-app = FastAPI(title="AI Chat App", version="1.0.0")
+app = FastAPI(title="AI Chat App", version="1.0.0", default_response_class=FastJSONResponse, lifespan=lifespan)
 
 # CORS middleware
 app.add_middleware(
@@ -44,36 +195,46 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
-# MongoDB connection
-MONGO_URL = os.getenv("MONGO_URL", "mongodb://localhost:27017/chatapp")
-client = AsyncIOMotorClient(MONGO_URL)
-db = client.chatapp
+# Compress REST responses above a size threshold (brotli when available, else gzip)
+app.add_middleware(
+    CompressionMiddleware,
+    minimum_size=int(os.getenv("COMPRESSION_MIN_SIZE", "500")),
+    gzip_level=int(os.getenv("GZIP_LEVEL", "6")),
+    brotli_quality=int(os.getenv("BROTLI_QUALITY", "4"))
+)
 
 # Security
 security = HTTPBearer()
 
-# WebSocket connection manager
-class ConnectionManager:
-    def __init__(self):
-        self.active_connections: Dict[str, WebSocket] = {}
-        self.user_sessions: Dict[str, str] = {}  # user_id -> session_id
+# Frames a client may send ahead of the turn currently being answered
+MAX_QUEUED_FRAMES = 16
 
-    async def connect(self, websocket: WebSocket, user_id: str, session_id: str):
-        await websocket.accept()
-        self.active_connections[session_id] = websocket
-        self.user_sessions[user_id] = session_id
+# Comment lines sent on a quiet /api/chat/stream response so proxies keep it open
+SSE_KEEPALIVE_SECONDS = float(os.getenv("SSE_KEEPALIVE_SECONDS", "15"))
+
+# Hot user state (interests, premium, ban and mute) shared by matching and moderation
+user_cache = UserCache(
+    max_entries=int(os.getenv("USER_CACHE_MAX_ENTRIES", "10000")),
+    ttl_seconds=float(os.getenv("USER_CACHE_TTL_SECONDS", "300"))
+)
+MUTE_DURATION_MINUTES = int(os.getenv("MUTE_DURATION_MINUTES", "10"))
 
-    def disconnect(self, session_id: str, user_id: str):
-        if session_id in self.active_connections:
-            del self.active_connections[session_id]
-        if user_id in self.user_sessions:
-            del self.user_sessions[user_id]
+# Bounds on one batched recommendations call
+MAX_RECOMMENDATION_USERS = int(os.getenv("MAX_RECOMMENDATION_USERS", "500"))
+MAX_RECOMMENDATION_LIMIT = 20
 
-    async def send_personal_message(self, message: str, session_id: str):
-        if session_id in self.active_connections:
-            await self.active_connections[session_id].send_text(message)
+async def get_cached_user(user_id: str) -> Optional[dict]:
+    """Read a user's hot fields, hitting MongoDB only on a cache miss"""
+    return await user_cache.get(user_id, load_user)
 
-manager = ConnectionManager()
+async def load_user(user_id: str) -> Optional[dict]:
+    """User cache loader (on MongoDB, misses are served by the "users" read preference)"""
+    return await storage.get_user(user_id, USER_CACHE_FIELDS)
+
+# Chat turn pipeline: generation may start before moderation finishes and is
+# cancelled if the message gets rejected
+SPECULATIVE_GENERATION = os.getenv("SPECULATIVE_GENERATION", "true").lower() == "true"
+turn_metrics = TurnMetrics()
 
 # Pydantic models
 class UserCreate(BaseModel):
@@ -86,6 +247,10 @@ class ChatMessage(BaseModel):
     content: str
     session_id: str
 
+class RecommendationRequest(BaseModel):
+    user_ids: List[str]
+    limit: int = 5
+
 class BotProfile(BaseModel):
     bot_id: str
     name: str
@@ -93,100 +258,181 @@ class BotProfile(BaseModel):
     bio: str
     interests: List[str]
     personality_traits: List[str]
-    profile_picture: str  # base64 encoded
+    profile_picture_url: Optional[str]  # served by /api/bots/pictures/{digest}
     backstory: str
     conversation_style: str
 
-# Realistic bot profiles with Instagram-like bios
-REALISTIC_BOT_PROFILES = [
-    {
-        "bot_id": "alex_traveler",
-        "name": "Alex Johnson",
-        "age": 25,
-        "bio": "✈️ Digital nomad living the dream | 📸 Capturing moments across 47 countries | 🌮 Foodie with serious wanderlust | Currently in: Bali 🌴",
-        "interests": ["travel", "photography", "food", "culture", "adventure"],
-        "personality_traits": ["adventurous", "optimistic", "curious", "outgoing"],
-        "profile_picture": "/9j/4AAQSkZJRgABAQAAAQABAAD/2wBDAAYEBQYFBAYGBQYHBwYIChAKCgkJChQODwwQFxQYGBcUFhYaHSUfGhsjHBYWICwgIyYnKSopGR8tMC0oMCUoKSj/2wBDAQcHBwoIChMKChMoGhYaKCgoKCgoKCgoKCgoKCgoKCgoKCgoKCgoKCgoKCgoKCgoKCgoKCgoKCgoKCgoKCgoKCj/wAARCAAyADIDASIAAhEBAxEB/8QAHwAAAQUBAQEBAQEAAAAAAAAAAAECAwQFBgcICQoL/8QAtRAAAgEDAwIEAwUFBAQAAAF9AQIDAAQRBRIhMUEGE1FhByJxFDKBkaEII0KxwRVS0fAkM2JyggkKFhcYGRolJicoKSo0NTY3ODk6Q0RFRkdISUpTVFVWV1hZWmNkZWZnaGlqc3R1dnd4eXqDhIWGh4iJipKTlJWWl5iZmqKjpKWmp6ipqrKztLW2t7i5usLDxMXGx8jJytLT1NXW19jZ2uHi4+Tl5ufo6erx8vP09fb3+Pn6/8QAHwEAAwEBAQEBAQEBAQAAAAAAAAECAwQFBgcICQoL/8QAtREAAgECBAQDBAcFBAQAAQJ3AAECAxEEBSExBhJBUQdhcRMiMoEIFEKRobHBCSMzUvAVYnLRChYkNOEl8RcYGRomJygpKjU2Nzg5OkNERUZHSElKU1RVVldYWVpjZGVmZ2hpanN0dXZ3eHl6goOEhYaHiImKkpOUlZaXmJmaoqOkpaanqKmqsrO0tba3uLm6wsPExcbHyMnK0tPU1dbX2Nna4uPk5ebn6Onq8vP09fb3+Pn6/9oADAMBAAIRAxEAPwD3+iiigAooooAKKKKACiiigAooooA//9k=",
-        "backstory": "Graduated with a marketing degree but chose the nomad life instead. Started a travel blog that now funds my adventures. Love connecting with locals and finding hidden gems.",
-        "conversation_style": "enthusiastic",
-        "location": "Bali, Indonesia"
-    },
-    {
-        "bot_id": "maya_artist",
-        "name": "Maya Chen",
-        "age": 23,
-        "bio": "🎨 Art is my language | Coffee addict ☕ | Creating magic one brushstroke at a time | Gallery opening next month! | NYC based 🗽",
-        "interests": ["art", "coffee", "museums", "creativity", "urban_life"],
-        "personality_traits": ["creative", "introspective", "passionate", "intuitive"],
-        "profile_picture": "/9j/4AAQSkZJRgABAQAAAQABAAD/2wBDAAYEBQYFBAYGBQYHBwYIChAKCgkJChQODwwQFxQYGBcUFhYaHSUfGhsjHBYWICwgIyYnKSopGR8tMC0oMCUoKSj/2wBDAQcHBwoIChMKChMoGhYaKCgoKCgoKCgoKCgoKCgoKCgoKCgoKCgoKCgoKCgoKCgoKCgoKCgoKCgoKCgoKCgoKCj/wAARCAAyADIDASIAAhEBAxEB/8QAHwAAAQUBAQEBAQEAAAAAAAAAAAECAwQFBgcICQoL/8QAtRAAAgEDAwIEAwUFBAQAAAF9AQIDAAQRBRIhMUEGE1FhByJxFDKBkaEII0KxwRVS0fAkM2JyggkKFhcYGRolJicoKSo0NTY3ODk6Q0RFRkdISUpTVFVWV1hZWmNkZWZnaGlqc3R1dnd4eXqDhIWGh4iJipKTlJWWl5iZmqKjpKWmp6ipqrKztLW2t7i5usLDxMXGx8jJytLT1NXW19jZ2uHi4+Tl5ufo6erx8vP09fb3+Pn6/8QAHwEAAwEBAQEBAQEBAQAAAAAAAAECAwQFBgcICQoL/8QAtREAAgECBAQDBAcFBAQAAQJ3AAECAxEEBSExBhJBUQdhcRMiMoEIFEKRobHBCSMzUvAVYnLRChYkNOEl8RcYGRomJygpKjU2Nzg5OkNERUZHSElKU1RVVldYWVpjZGVmZ2hpanN0dXZ3eHl6goOEhYaHiImKkpOUlZaXmJmaoqOkpaanqKmqsrO0tba3uLm6wsPExcbHyMnK0tPU1dbX2Nna4uPk5ebn6Onq8vP09fb3+Pn6/9oADAMBAAIRAxEAPwD3+iiigAooooAKKKKACiiigAooooA//9k=",
-        "backstory": "Fine arts graduate from Parsons. Working on my first solo exhibition while doing freelance design work. Passionate about bringing color to the world.",
-        "conversation_style": "thoughtful"
-    },
-    {
-        "bot_id": "jake_fitness",
-        "name": "Jake Rodriguez",
-        "age": 28,
-        "bio": "💪 Your friendly neighborhood trainer | Marathon runner 🏃‍♂️ | Plant-based athlete 🌱 | Helping others crush their goals | Miami Beach 🏖️",
-        "interests": ["fitness", "running", "nutrition", "motivation", "beach_life"],
-        "personality_traits": ["motivational", "energetic", "disciplined", "supportive"],
-        "profile_picture": "/9j/4AAQSkZJRgABAQAAAQABAAD/2wBDAAYEBQYFBAYGBQYHBwYIChAKCgkJChQODwwQFxQYGBcUFhYaHSUfGhsjHBYWICwgIyYnKSopGR8tMC0oMCUoKSj/2wBDAQcHBwoIChMKChMoGhYaKCgoKCgoKCgoKCgoKCgoKCgoKCgoKCgoKCgoKCgoKCgoKCgoKCgoKCgoKCgoKCgoKCj/wAARCAAyADIDASIAAhEBAxEB/8QAHwAAAQUBAQEBAQEAAAAAAAAAAAECAwQFBgcICQoL/8QAtRAAAgEDAwIEAwUFBAQAAAF9AQIDAAQRBRIhMUEGE1FhByJxFDKBkaEII0KxwRVS0fAkM2JyggkKFhcYGRolJicoKSo0NTY3ODk6Q0RFRkdISUpTVFVWV1hZWmNkZWZnaGlqc3R1dnd4eXqDhIWGh4iJipKTlJWWl5iZmqKjpKWmp6ipqrKztLW2t7i5usLDxMXGx8jJytLT1NXW19jZ2uHi4+Tl5ufo6erx8vP09fb3+Pn6/8QAHwEAAwEBAQEBAQEBAQAAAAAAAAECAxQFBgcICQoL/8QAtREAAgECBAQDBAcFBAQAAQJ3AAECAxEEBSExBhJBUQdhcRMiMoEIFEKRobHBCSMzUvAVYnLRChYkNOEl8RcYGRomJygpKjU2Nzg5OkNERUZHSElKU1RVVldYWVpjZGVmZ2hpanN0dXZ3eHl6goOEhYaHiImKkpOUlZaXmJmaoqOkpaanqKmqsrO0tba3uLm6wsPExcbHyMnK0tPU1dbX2Nna4uPk5ebn6Onq8vP09fb3+Pn6/9oADAMBAAIRAxEAPwD3+iiigAooooAKKKKACiiigAooooA//9k=",
-        "backstory": "Former college athlete turned personal trainer. Discovered the power of plant-based nutrition. Love helping people transform their lives through fitness.",
-        "conversation_style": "motivational"
-    },
-    {
-        "bot_id": "sophia_tech",
-        "name": "Sophia Kim",
-        "age": 26,
-        "bio": "👩‍💻 Full-stack dev by day, gaming queen by night 🎮 | Code, coffee, and cats 🐱 | Building the future one line at a time | San Francisco",
-        "interests": ["technology", "gaming", "cats", "coding", "startups"],
-        "personality_traits": ["analytical", "witty", "intelligent", "geeky"],
-        "profile_picture": "/9j/4AAQSkZJRgABAQAAAQABAAD/2wBDAAYEBQYFBAYGBQYHBwYIChAKCgkJChQODwwQFxQYGBcUFhYaHSUfGhsjHBYWICwgIyYnKSopGR8tMC0oMCUoKSj/2wBDAQcHBwoIChMKChMoGhYaKCgoKCgoKCgoKCgoKCgoKCgoKCgoKCgoKCgoKCgoKCgoKCgoKCgoKCgoKCgoKCgoKCj/wAARCAAyADIDASIAAhEBAxEB/8QAHwAAAQUBAQEBAQEAAAAAAAAAAAECAwQFBgcICQoL/8QAtRAAAgEDAwIEAwUFBAQAAAF9AQIDAAQRBRIhMUEGE1FhByJxFDKBkaEII0KxwRVS0fAkM2JyggkKFhcYGRolJicoKSo0NTY3ODk6Q0RFRkdISUpTVFVWV1hZWmNkZWZnaGlqc3R1dnd4eXqDhIWGh4iJipKTlJWWl5iZmqKjpKWmp6ipqrKztLW2t7i5usLDxMXGx8jJytLT1NXW19jZ2uHi4+Tl5ufo6erx8vP09fb3+Pn6/8QAHwEAAwEBAQEBAQEBAQAAAAAAAAECAwQFBgcICQoL/8QAtREAAgECBAQDBAcFBAQAAQJ3AAECAxEEBSExBhJBUQdhcRMiMoEIFEKRobHBCSMzUvAVYnLRChYkNOEl8RcYGRomJygpKjU2Nzg5OkNERUZHSElKU1RVVldYWVpjZGVmZ2hpanN0dXZ3eHl6goOEhYaHiImKkpOUlZaXmJmaoqOkpaanqKmqsrO0tba3uLm6wsPExcbHyMnK0tPU1dbX2Nna4uPk5ebn6Onq8vP09fb3+Pn6/9oADAMBAAIRAxEAPwD3+iiigAooooAKKKKACiiigAooooA//9k=",
-        "backstory": "CS graduate from Stanford. Works at a startup developing AI tools. Passionate about making technology accessible and loves solving complex problems.",
-        "conversation_style": "logical"
-    },
-    {
-        "bot_id": "luna_music",
-        "name": "Luna Martinez",
-        "age": 24,
-        "bio": "🎵 Singer-songwriter with a dream | Guitar strings and heartstrings 💕 | Coffee shop performances every Friday | Spotify: @LunaMartinezMusic | Austin, TX 🤠",
-        "interests": ["music", "songwriting", "guitar", "performing", "coffee_culture"],
-        "personality_traits": ["artistic", "emotional", "expressive", "dreamy"],
-        "profile_picture": "/9j/4AAQSkZJRgABAQAAAQABAAD/2wBDAAYEBQYFBAYGBQYHBwYIChAKCgkJChQODwwQFxQYGBcUFhYaHSUfGhsjHBYWICwgIyYnKSopGR8tMC0oMCUoKSj/2wBDAQcHBwoIChMKChMoGhYaKCgoKCgoKCgoKCgoKCgoKCgoKCgoKCgoKCgoKCgoKCgoKCgoKCgoKCgoKCgoKCgoKCj/wAARCAAyADIDASIAAhEBAxEB/8QAHwAAAQUBAQEBAQEAAAAAAAAAAAECAwQFBgcICQoL/8QAtRAAAgEDAwIEAwUFBAQAAAF9AQIDAAQRBRIhMUEGE1FhByJxFDKBkaEII0KxwRVS0fAkM2JyggkKFhcYGRolJicoKSo0NTY3ODk6Q0RFRkdISUpTVFVWV1hZWmNkZWZnaGlqc3R1dnd4eXqDhIWGh4iJipKTlJWWl5iZmqKjpKWmp6ipqrKztLW2t7i5usLDxMXGx8jJytLT1NXW19jZ2uHi4+Tl5ufo6erx8vP09fb3+Pn6/8QAHwEAAwEBAQEBAQEBAQAAAAAAAAECAwQFBgcICQoL/8QAtREAAgECBAQDBAcFBAQAAQJ3AAECAxEEBSExBhJBUQdhcRMiMoEIFEKRobHBCSMzUvAVYnLRChYkNOEl8RcYGRomJygpKjU2Nzg5OkNERUZHSElKU1RVVldYWVpjZGVmZ2hpanN0dXZ3eHl6goOEhYaHiImKkpOUlZaXmJmaoqOkpaanqKmqsrO0tba3uLm6wsPExcbHyMnK0tPU1dbX2Nna4uPk5ebn6Onq8vP09fb3+Pn6/9oADAMBAAIRAxEAPwD3+iiigAooooAKKKKACiiigAooooA//9k=",
-        "backstory": "Music therapy graduate who performs at local venues. Writing her debut album about love, loss, and finding yourself in a big city.",
-        "conversation_style": "poetic"
-    },
-    {
-        "bot_id": "daniel_chef",
-        "name": "Daniel Brooks",
-        "age": 29,
-        "bio": "👨‍🍳 Michelin-trained chef | Farm-to-table enthusiast 🌾 | Cookbook coming 2025 | Teaching cooking classes weekends | Portland, OR",
-        "interests": ["cooking", "food", "sustainability", "teaching", "local_ingredients"],
-        "personality_traits": ["perfectionist", "passionate", "knowledgeable", "patient"],
-        "profile_picture": "/9j/4AAQSkZJRgABAQAAAQABAAD/2wBDAAYEBQYFBAYGBQYHBwYIChAKCgkJChQODwwQFxQYGBcUFhYaHSUfGhsjHBYWICwgIyYnKSopGR8tMC0oMCUoKSj/2wBDAQcHBwoIChMKChMoGhYaKCgoKCgoKCgoKCgoKCgoKCgoKCgoKCgoKCgoKCgoKCgoKCgoKCgoKCgoKCgoKCgoKCj/wAARCAAyADIDASIAAhEBAxEB/8QAHwAAAQUBAQEBAQEAAAAAAAAAAAECAwQFBgcICQoL/8QAtRAAAgEDAwIEAwUFBAQAAAF9AQIDAAQRBRIhMUEGE1FhByJxFDKBkaEII0KxwRVS0fAkM2JyggkKFhcYGRolJicoKSo0NTY3ODk6Q0RFRkdISUpTVFVWV1hZWmNkZWZnaGlqc3R1dnd4eXqDhIWGh4iJipKTlJWWl5iZmqKjpKWmp6ipqrKztLW2t7i5usLDxMXGx8jJytLT1NXW19jZ2uHi4+Tl5ufo6erx8vP09fb3+Pn6/8QAHwEAAwEBAQEBAQEBAQAAAAAAAAECAwQFBgcICQoL/8QAtREAAgECBAQDBAcFBAQAAQJ3AAECAxEEBSExBhJBUQdhcRMiMoEIFEKRobHBCSMzUvAVYnLRChYkNOEl8RcYGRomJygpKjU2Nzg5OkNERUZHSElKU1RVVldYWVpjZGVmZ2hpanN0dXZ3eHl6goOEhYaHiImKkpOUlZaXmJmaoqOkpaanqKmqsrO0tba3uLm6wsPExcbHyMnK0tPU1dbX2Nna4uPk5ebn6Onq8vP09fb3+Pn6/9oADAMBAAIRAxEAPwD3+iiigAooooAKKKKACiiigAooooA//9k=",
-        "backstory": "Worked in top restaurants in Europe before opening his own place. Believes in sustainable cooking and teaching the next generation of chefs.",
-        "conversation_style": "knowledgeable"
-    },
-    {
-        "bot_id": "zara_fashion",
-        "name": "Zara Williams",
-        "age": 22,
-        "bio": "✨ Fashion is art you wear | Sustainable style advocate 🌍 | Thrift flip queen 👑 | Style tips on my blog | London calling 📞",
-        "interests": ["fashion", "sustainability", "thrifting", "blogging", "design"],
-        "personality_traits": ["trendy", "environmentally_conscious", "creative", "confident"],
-        "profile_picture": "/9j/4AAQSkZJRgABAQAAAQABAAD/2wBDAAYEBQYFBAYGBQYHBwYIChAKCgkJChQODwwQFxQYGBcUFhYaHSUfGhsjHBYWICwgIyYnKSopGR8tMC0oMCUoKSj/2wBDAQcHBwoIChMKChMoGhYaKCgoKCgoKCgoKCgoKCgoKCgoKCgoKCgoKCgoKCgoKCgoKCgoKCgoKCgoKCgoKCgoKCj/wAARCAAyADIDASIAAhEBAxEB/8QAHwAAAQUBAQEBAQEAAAAAAAAAAAECAwQFBgcICQoL/8QAtRAAAgEDAwIEAwUFBAQAAAF9AQIDAAQRBRIhMUEGE1FhByJxFDKBkaEII0KxwRVS0fAkM2JyggkKFhcYGRolJicoKSo0NTY3ODk6Q0RFRkdISUpTVFVWV1hZWmNkZWZnaGlqc3R1dnd4eXqDhIWGh4iJipKTlJWWl5iZmqKjpKWmp6ipqrKztLW2t7i5usLDxMXGx8jJytLT1NXW19jZ2uHi4+Tl5ufo6erx8vP09fb3+Pn6/8QAHwEAAwEBAQEBAQEBAQAAAAAAAAECAwQFBgcICQoL/8QAtREAAgECBAQDBAcFBAQAAQJ3AAECAxEEBSExBhJBUQdhcRMiMoEIFEKRobHBCSMzUvAVYnLRChYkNOEl8RcYGRomJygpKjU2Nzg5OkNERUZHSElKU1RVVldYWVpjZGVmZ2hpanN0dXZ3eHl6goOEhYaHiImKkpOUlZaXmJmaoqOkpaanqKmqsrO0tba3uLm6wsPExcbHyMnK0tPU1dbX2Nna4uPk5ebn6Onq8vP09fb3+Pn6/9oADAMBAAIRAxEAPwD3+iiigAooooAKKKKACiiigAooooA//9k=",
-        "backstory": "Fashion design student passionate about sustainable fashion. Runs a popular blog about ethical fashion choices and thrift transformations.",
-        "conversation_style": "trendy"
-    }
-]
+# Bot personas live in personas.json (or a MongoDB collection) and can be reloaded without a restart
+PERSONA_CATALOG_COLLECTION = os.getenv("PERSONA_CATALOG_COLLECTION", "")
+PERSONA_CATALOG_WATCH_SECONDS = float(os.getenv("PERSONA_CATALOG_WATCH_SECONDS", "0"))
+
+# The bot catalog only changes on reload, so it is encoded once and served as cached bytes
+BOT_PROFILES_PAYLOAD = CachedJSONPayload(lambda: {"bot_profiles": persona_catalog.records})
+
+# The file watcher and the admin endpoint may both ask for a reload; they run one at a time
+persona_reload_lock = asyncio.Lock()
+
+def build_persona_models(records) -> tuple:
+    """Matcher index and compiled offline personas for ``records``; nothing live is touched"""
+    started = time.perf_counter()
+    index = persona_matcher.build_index(records)
+    build_seconds = time.perf_counter() - started
+    return index, build_seconds, persona_responder.compile_personas(records)
+
+async def reload_persona_catalog():
+    """
+    Load the persona catalog and swap it in atomically.
+    
+    Parsing, indexing and compiling run off the event loop and only produce new values;
+    once every part has succeeded, matcher, responder and catalog are swapped together
+    in one synchronous step. Live sessions keep resolving their bot, including personas
+    the new catalog no longer lists.
+    """
+    async with persona_reload_lock:
+        started = time.perf_counter()
+        try:
+            if PERSONA_CATALOG_COLLECTION and db is not None:
+                records, pictures = await persona_catalog.load_collection(db[PERSONA_CATALOG_COLLECTION])
+                source = f"mongodb:{PERSONA_CATALOG_COLLECTION}"
+            else:
+                records, pictures = await asyncio.to_thread(persona_catalog.load_file)
+                source = persona_catalog.path
+            
+            index, build_seconds, compiled = await asyncio.to_thread(build_persona_models, records)
+        except Exception as e:
+            persona_catalog.stats["failed_reloads"] += 1
+            logger.error(f"Persona catalog reload failed, keeping v{persona_catalog.snapshot.version}: {e}")
+            raise
+        
+        # No await from here on: requests see either the old catalog or the new one, never a mix
+        persona_matcher.install(index, build_seconds)
+        persona_responder.install(compiled)
+        persona_catalog.install(records, pictures, source)
+        BOT_PROFILES_PAYLOAD.invalidate()
+        # Cached replies were written in the old personas' voice
+        semantic_cache.clear()
+        persona_catalog.stats["reloads"] += 1
+        persona_catalog.stats["last_reload_seconds"] = round(time.perf_counter() - started, 4)
+
+async def watch_persona_catalog():
+    """Reload the catalog file whenever it changes on disk"""
+    while True:
+        await asyncio.sleep(PERSONA_CATALOG_WATCH_SECONDS)
+        if not PERSONA_CATALOG_COLLECTION and persona_catalog.file_changed():
+            try:
+                await reload_persona_catalog()
+            except Exception as e:
+                # Already logged by the reload; the previous catalog stays live
+                logger.debug(f"Persona catalog watcher skipped a failed reload: {e}")
+
+MAX_SESSIONS_PAGE_SIZE = 100
+SESSION_PREVIEW_LENGTH = 120
+# Sessions updated per bulk write when backfilling summary fields
+SESSION_BACKFILL_BATCH_SIZE = 500
+
+# Retention: how often the idle/archive job runs (0 disables it)
+SESSION_LIFECYCLE_INTERVAL_SECONDS = float(os.getenv("SESSION_LIFECYCLE_INTERVAL_SECONDS", "3600"))
+
+# How often learned upstream limits are written to ADAPTIVE_LIMITS_PATH (0: only at shutdown)
+ADAPTIVE_LIMITS_SAVE_SECONDS = float(os.getenv("ADAPTIVE_LIMITS_SAVE_SECONDS", "30"))
+
+def encode_session_cursor(session: dict) -> str:
+    """Opaque keyset cursor for the session after which the next page starts"""
+    # Sessions the summary backfill has not reached yet have no activity time and sort last
+    last_active_at = session.get("last_active_at")
+    raw = json.dumps([last_active_at.isoformat() if last_active_at else None, session["session_id"]])
+    return base64.urlsafe_b64encode(raw.encode("utf-8")).decode("ascii")
+
+def decode_session_cursor(cursor: str) -> tuple:
+    """Decode a cursor produced by encode_session_cursor"""
+    try:
+        last_active_at, session_id = json.loads(base64.urlsafe_b64decode(cursor.encode("ascii")))
+        return (datetime.fromisoformat(last_active_at) if last_active_at is not None else None), session_id
+    except Exception as e:
+        raise ValueError(f"Invalid session cursor: {e}")
+
+def message_preview(text: str) -> str:
+    """Short preview of a message for session listings"""
+    text = " ".join((text or "").split())
+    if len(text) <= SESSION_PREVIEW_LENGTH:
+        return text
+    return text[:SESSION_PREVIEW_LENGTH - 1].rstrip() + "…"
+
+async def ensure_indexes():
+    """Create the indexes hot queries rely on and backfill session summary fields"""
+    await db.chat_sessions.create_index(
+        [("user_id", 1), ("last_active_at", -1), ("session_id", -1)],
+        name="user_recent_sessions"
+    )
+    
+    # Streaming exports walk sessions in _id order, per user or per bot
+    await db.chat_sessions.create_index([("user_id", 1), ("_id", 1)], name="user_export_order")
+    await db.chat_sessions.create_index([("bot_id", 1), ("_id", 1)], name="bot_export_order")
+    
+    await session_lifecycle.ensure_indexes(db)
+    
+    # Sessions created before summaries existed get them computed once from their messages;
+    # the preview is truncated here so it matches the one append_message writes
+    backfilled = 0
+    updates = []
+    async for session in db.chat_sessions.aggregate([
+        {"$match": {"last_active_at": {"$exists": False}}},
+        {"$project": {
+            "last_active_at": {"$ifNull": [{"$arrayElemAt": ["$messages.timestamp", -1]}, "$started_at"]},
+            "message_count": {"$size": {"$ifNull": ["$messages", []]}},
+            "last_reply": {"$arrayElemAt": [{"$filter": {
+                "input": {"$ifNull": ["$messages.bot_response", []]},
+                "cond": {"$ne": ["$$this", None]}
+            }}, -1]}
+        }}
+    ]):
+        updates.append(UpdateOne(
+            {"_id": session["_id"], "last_active_at": {"$exists": False}},
+            {"$set": {
+                "last_active_at": session["last_active_at"],
+                "message_count": session["message_count"],
+                "last_message_preview": message_preview(session.get("last_reply"))
+            }}
+        ))
+        if len(updates) >= SESSION_BACKFILL_BATCH_SIZE:
+            backfilled += (await db.chat_sessions.bulk_write(updates, ordered=False)).modified_count
+            updates = []
+    if updates:
+        backfilled += (await db.chat_sessions.bulk_write(updates, ordered=False)).modified_count
+    if backfilled:
+        logger.info(f"Backfilled summary fields on {backfilled} chat sessions")
 
 # AI Response Generation with IP Protection and Multiple APIs
-async def generate_ai_response(message: str, bot_profile: dict, context: List[dict] = None) -> str:
-    """Generate AI response using protected APIs with fallback system"""
+async def generate_ai_response(message: str, bot_profile: dict, context: List[dict] = None,
+                               premium: bool = False, deadline: Optional[Deadline] = None,
+                               accepted: Optional[Awaitable[bool]] = None) -> str:
+    """
+    Generate AI response using protected APIs with fallback system.
+    
+    A speculative turn passes ``accepted``, resolving to whether moderation let the message
+    through; its reply is only cached for near-duplicates once it has.
+    """
+    
+    # A near-duplicate of a message this persona already answered needs no upstream call
+    if not context:
+        cached = semantic_cache.lookup(bot_profile.get("bot_id", ""), message)
+        if cached is not None:
+            return cached
     
     try:
-        # Use the AI service manager for protected API calls if available
+        # Use the AI service manager for protected API calls if available; turns that
+        # would miss the latency SLO are answered straight from the template tier
         if PROTECTION_ENABLED:
-            response = await ai_service_manager.generate_response(message, bot_profile, context)
+            # Every provider call, retry and back-off in this turn shares one latency budget
+            deadline = deadline or Deadline.after(admission_controller.turn_budget(premium))
+            response, upstream = await admission_controller.run(
+                lambda: ai_service_manager.generate_reply(message, bot_profile, context, deadline=deadline),
+                lambda: generate_template_response(message, bot_profile, context),
+                premium=premium
+            )
+            # Only provider replies to context-free turns can answer someone else's similar message
+            if upstream and not context and (accepted is None or await asyncio.shield(accepted)):
+                semantic_cache.store(bot_profile.get("bot_id", ""), message, response)
             return response
         else:
             # Fallback to template responses if protection not available
@@ -198,74 +444,54 @@ async def generate_ai_response(message: str, bot_profile: dict, context: List[di
 
 async def generate_template_response(message: str, bot_profile: dict, context: List[dict] = None) -> str:
     """Generate template response as ultimate fallback"""
-    # Personality-based response templates
-    responses_by_style = {
-        "enthusiastic": [
-            f"That's amazing! {message} reminds me of when I was in {bot_profile.get('location', 'my travels')}! ✨",
-            f"Oh wow! I totally get that! Speaking of {message}, have you ever tried...",
-            f"That's so cool! {message} is exactly the kind of thing that gets me excited! 🌟"
-        ],
-        "thoughtful": [
-            f"Hmm, that's really interesting. {message} makes me think about...",
-            f"I find that fascinating. When you mention {message}, it reminds me of...",
-            f"That's a deep perspective. {message} connects to something I've been reflecting on..."
-        ],
-        "motivational": [
-            f"You've got this! {message} shows you're already on the right track! 💪",
-            f"That's the spirit! {message} is exactly the mindset you need! Keep pushing!",
-            f"Amazing energy! {message} tells me you're ready to crush your goals! 🔥"
-        ],
-        "logical": [
-            f"Interesting point. Regarding {message}, have you considered the technical aspects?",
-            f"That makes sense. {message} is actually quite logical when you think about it...",
-            f"Good thinking! {message} follows a clear pattern that I've observed..."
-        ],
-        "poetic": [
-            f"Your words about {message} paint such a beautiful picture... 🎵",
-            f"There's something musical about {message}... it reminds me of a song I'm writing",
-            f"That touches my soul. {message} has the rhythm of poetry..."
-        ],
-        "knowledgeable": [
-            f"Ah, {message}! That actually reminds me of a technique I learned...",
-            f"Interesting! When it comes to {message}, I've found that...",
-            f"Great question! {message} is something I'm quite passionate about..."
-        ],
-        "trendy": [
-            f"OMG yes! {message} is totally having a moment right now! ✨",
-            f"So chic! {message} is giving me major inspiration vibes! 💫",
-            f"Love that! {message} is such a vibe - very on-trend! 👑"
-        ]
-    }
-    
-    style = bot_profile.get("conversation_style", "enthusiastic")
-    response_templates = responses_by_style.get(style, responses_by_style["enthusiastic"])
-    
-    # Select random response and add personality touches
-    base_response = random.choice(response_templates)
-    
-    # Add interest-based follow-ups
-    interests = bot_profile.get("interests", [])
-    if interests:
-        interest = random.choice(interests)
-        follow_ups = [
-            f"By the way, are you into {interest}? I'd love to hear your thoughts!",
-            f"This reminds me - do you have any experience with {interest}?",
-            f"Speaking of interests, what's your take on {interest}?"
-        ]
-        base_response += f" {random.choice(follow_ups)}"
-    
-    return base_response
+    return persona_responder.respond(message, bot_profile, context)
 
 # API Routes
 @app.get("/api/health")
 async def health_check():
     return {"status": "healthy", "timestamp": datetime.now().isoformat()}
 
-@app.on_event("startup")
-async def startup_event():
+async def run_session_lifecycle():
+    """Periodically close idle sessions and archive cold history"""
+    while True:
+        await asyncio.sleep(SESSION_LIFECYCLE_INTERVAL_SECONDS)
+        try:
+            await session_lifecycle.run(db)
+        except Exception as e:
+            logger.error(f"Session lifecycle job failed: {str(e)}")
+
+async def run_connection_reaper():
+    """Ping quiet WebSockets and evict dead or idle ones"""
+    while True:
+        await asyncio.sleep(min(manager.heartbeat_interval, manager.pong_timeout))
+        try:
+            await manager.reap()
+        except Exception as e:
+            logger.error(f"Connection reaper failed: {str(e)}")
+
+async def save_adaptive_limits():
+    try:
+        await asyncio.to_thread(protection_manager.adaptive_limits.save)
+    except Exception as e:
+        logger.error(f"Failed to save adaptive API limits: {str(e)}")
+
+async def checkpoint_adaptive_limits():
+    """Persist learned upstream limits now and then, so a crash loses little of what was learned"""
+    while True:
+        await asyncio.sleep(ADAPTIVE_LIMITS_SAVE_SECONDS)
+        if protection_manager.adaptive_limits.dirty:
+            await save_adaptive_limits()
+
+async def ensure_indexes_in_background():
+    try:
+        await ensure_indexes()
+    except Exception as e:
+        logger.error(f"Failed to ensure database indexes: {str(e)}")
+
+async def initialize_protection_systems():
     """Initialize protection systems on startup"""
     try:
-        if PROTECTION_ENABLED:
+        if load_protection_modules():
             # Initialize IP protection system
             await initialize_protection(enable_proxy_rotation=True)
             
@@ -284,6 +510,69 @@ async def startup_event():
     except Exception as e:
         logger.error(f"Failed to initialize protection systems: {str(e)}")
 
+@app.get("/api/admin/turn-metrics")
+async def get_turn_metrics():
+    """Get per-stage chat turn timings and the time saved by running stages concurrently"""
+    stats = turn_metrics.get_stats()
+    if PROTECTION_ENABLED:
+        stats["cancellation"] = ai_service_manager.get_cancellation_stats()
+    return stats
+
+@app.get("/api/admin/connections")
+async def get_connection_stats():
+    """Get live WebSocket connection and fan-out statistics"""
+    return manager.get_stats()
+
+@app.get("/api/admin/data-access")
+async def get_data_access_stats():
+    """Get read routing (read preference per query kind) and causal read statistics"""
+    require_mongodb("Read routing")
+    return data_access.get_stats()
+
+@app.get("/api/admin/storage")
+async def get_storage_stats():
+    """Get the storage backend in use and its statistics"""
+    return storage.get_stats()
+
+@app.get("/api/admin/cache-stats")
+async def get_cache_stats():
+    """Get in-memory cache statistics"""
+    return {
+        "user_cache": user_cache.get_stats(),
+        "persona_matcher": persona_matcher.get_stats(),
+        "exports": chat_exporter.get_stats()
+    }
+
+@app.get("/api/admin/personas")
+async def get_persona_catalog_status():
+    """Get persona catalog status"""
+    return persona_catalog.get_stats()
+
+@app.post("/api/admin/personas/reload")
+async def reload_personas():
+    """Reload the persona catalog without dropping live sessions"""
+    try:
+        await reload_persona_catalog()
+    except Exception as e:
+        raise HTTPException(status_code=400, detail=f"Catalog reload failed: {e}")
+    return {"message": "Persona catalog reloaded", **persona_catalog.get_stats()}
+
+@app.get("/api/admin/lifecycle")
+async def get_session_lifecycle_status():
+    """Get retention job status and the last run's before/after measurements"""
+    return session_lifecycle.get_stats()
+
+@app.post("/api/admin/lifecycle/run")
+async def run_session_lifecycle_now():
+    """Run the retention job immediately"""
+    require_mongodb("Session retention")
+    return await session_lifecycle.run(db)
+
+@app.get("/api/admin/startup-metrics")
+async def get_startup_metrics():
+    """Get import time and time-to-ready for this worker"""
+    return startup_metrics
+
 @app.get("/api/admin/protection-status")
 async def get_protection_status():
     """Get current API protection status"""
@@ -296,9 +585,17 @@ async def get_protection_status():
     return {
         "protection_enabled": True,
         "protection_stats": protection_manager.get_protection_stats(),
-        "ai_service_status": ai_service_manager.get_service_status()
+        "ai_service_status": ai_service_manager.get_service_status(),
+        "coalescing_stats": ai_service_manager.get_coalescing_stats(),
+        "batching_stats": ai_service_manager.get_batching_stats(),
+        "admission_stats": admission_controller.get_stats()
     }
 
+@app.get("/api/admin/semantic-cache")
+async def get_semantic_cache_stats():
+    """Get near-duplicate reply cache hit rate, size and similarity distribution"""
+    return semantic_cache.get_stats()
+
 @app.post("/api/admin/reset-failed-services")
 async def reset_failed_services():
     """Reset failed AI services for recovery"""
@@ -349,42 +646,64 @@ async def create_user(user: UserCreate):
         "premium": False
     }
     
-    await db.users.insert_one(user_data)
+    await storage.create_user(user_data)
+    user_cache.put(user_id, user_data)
     return {"user_id": user_id, "message": "User created successfully"}
 
 @app.get("/api/bots/profiles")
-async def get_bot_profiles():
+async def get_bot_profiles(if_none_match: Optional[str] = Header(None)):
     """Get all available bot profiles"""
-    return {"bot_profiles": REALISTIC_BOT_PROFILES}
+    return BOT_PROFILES_PAYLOAD.response(if_none_match)
+
+@app.get("/api/bots/pictures/{digest}")
+async def get_bot_picture(digest: str):
+    """A persona's profile picture; its URL changes with its content, so clients may cache it for good"""
+    picture = persona_catalog.picture(digest)
+    if picture is None:
+        raise HTTPException(status_code=404, detail="Picture not found")
+    return Response(content=picture, media_type="image/jpeg",
+                    headers={"Cache-Control": "public, max-age=31536000, immutable"})
 
 @app.get("/api/bots/match/{user_id}")
 async def match_bot(user_id: str):
     """Match user with a compatible bot based on interests"""
     # Get user data
-    user = await db.users.find_one({"user_id": user_id})
+    user = await get_cached_user(user_id)
     if not user:
         raise HTTPException(status_code=404, detail="User not found")
     
-    user_interests = set(user.get("interests", []))
+    # Cosine similarity over hashed interest/bio vectors; ties are broken at random
+    matches = persona_matcher.top_k([user.get("interests", [])], k=1)[0]
+    if not matches:
+        raise HTTPException(status_code=503, detail="No bots available")
     
-    # Find best matching bot
-    best_match = None
-    highest_score = 0
+    best_match, score = matches[0]
+    return {"matched_bot": best_match, "compatibility_score": round(score, 3)}
+
+@app.post("/api/bots/recommendations")
+async def recommend_bots(request: RecommendationRequest):
+    """Top bot matches for many users in one call"""
+    if len(request.user_ids) > MAX_RECOMMENDATION_USERS:
+        raise HTTPException(status_code=400, detail=f"At most {MAX_RECOMMENDATION_USERS} users per call")
     
-    for bot in REALISTIC_BOT_PROFILES:
-        bot_interests = set(bot.get("interests", []))
-        common_interests = user_interests.intersection(bot_interests)
-        score = len(common_interests)
-        
-        if score > highest_score:
-            highest_score = score
-            best_match = bot
+    limit = max(1, min(request.limit, MAX_RECOMMENDATION_LIMIT))
+    users = await asyncio.gather(*[get_cached_user(user_id) for user_id in request.user_ids])
+    known = [(user_id, user) for user_id, user in zip(request.user_ids, users) if user]
     
-    # If no good match, select random bot
-    if not best_match:
-        best_match = random.choice(REALISTIC_BOT_PROFILES)
+    # One batched scoring pass for every user in the request
+    matches = persona_matcher.top_k([user.get("interests", []) for _, user in known], k=limit)
+    recommendations = {
+        user_id: [
+            {"bot_id": bot["bot_id"], "name": bot["name"], "score": round(score, 3)}
+            for bot, score in user_matches
+        ]
+        for (user_id, _), user_matches in zip(known, matches)
+    }
     
-    return {"matched_bot": best_match, "compatibility_score": highest_score}
+    return {
+        "recommendations": recommendations,
+        "unknown_user_ids": [user_id for user_id, user in zip(request.user_ids, users) if not user]
+    }
 
 @app.post("/api/chat/start")
 async def start_chat_session(user_id: str, bot_id: str):
@@ -392,22 +711,27 @@ async def start_chat_session(user_id: str, bot_id: str):
     session_id = str(uuid.uuid4())
     
     # Find bot profile
-    bot_profile = next((bot for bot in REALISTIC_BOT_PROFILES if bot["bot_id"] == bot_id), None)
+    # Retired personas cannot start new sessions
+    bot_profile = persona_catalog.get(bot_id, include_retired=False)
     if not bot_profile:
         raise HTTPException(status_code=404, detail="Bot not found")
     
-    # Create chat session
+    # Create chat session (summary fields are kept up to date on every message)
+    started_at = datetime.now()
     session_data = {
         "session_id": session_id,
         "user_id": user_id,
         "bot_id": bot_id,
         "bot_name": bot_profile["name"],
-        "started_at": datetime.now(),
+        "started_at": started_at,
         "messages": [],
-        "is_active": True
+        "is_active": True,
+        "last_active_at": started_at,
+        "message_count": 0,
+        "last_message_preview": ""
     }
     
-    await db.chat_sessions.insert_one(session_data)
+    await storage.create_session(session_data)
     
     # Generate welcome message
     welcome_messages = [
@@ -425,41 +749,74 @@ async def start_chat_session(user_id: str, bot_id: str):
     }
 
 @app.get("/api/chat/sessions/{user_id}")
-async def get_user_sessions(user_id: str):
-    """Get user's chat sessions"""
-    sessions = await db.chat_sessions.find(
-        {"user_id": user_id}, 
-        {"messages": 0}  # Exclude messages for performance
-    ).to_list(length=50)
-    
-    # Convert ObjectId to string for JSON serialization
-    for session in sessions:
-        if "_id" in session:
-            session["_id"] = str(session["_id"])
-        # Also convert any datetime objects to ISO strings
-        if "started_at" in session and hasattr(session["started_at"], "isoformat"):
-            session["started_at"] = session["started_at"].isoformat()
-    
-    return {"sessions": sessions}
+async def get_user_sessions(user_id: str, limit: int = 20, cursor: Optional[str] = None):
+    """Get user's chat sessions, most recently active first, one page at a time"""
+    limit = max(1, min(limit, MAX_SESSIONS_PAGE_SIZE))
+    
+    after = None
+    if cursor:
+        try:
+            after = decode_session_cursor(cursor)
+        except ValueError:
+            raise HTTPException(status_code=400, detail="Invalid cursor")
+    
+    # Keyset pagination: continue strictly after the last session of the previous page
+    sessions = await storage.list_sessions(user_id, limit + 1, after=after)
+    
+    next_cursor = None
+    if len(sessions) > limit:
+        sessions = sessions[:limit]
+        next_cursor = encode_session_cursor(sessions[-1])
+    
+    return FastJSONResponse({"sessions": sessions, "next_cursor": next_cursor})
 
 @app.get("/api/chat/messages/{session_id}")
 async def get_chat_messages(session_id: str):
-    """Get messages for a chat session"""
-    session = await db.chat_sessions.find_one({"session_id": session_id})
-    if not session:
+    """Get messages for a chat session (archived history is rehydrated transparently)"""
+    messages = await storage.get_messages(session_id)
+    if messages is None:
         raise HTTPException(status_code=404, detail="Session not found")
     
-    # Convert any ObjectId fields to strings in messages if needed
-    messages = session.get("messages", [])
-    for message in messages:
-        if "_id" in message:
-            message["_id"] = str(message["_id"])
+    return FastJSONResponse({"messages": messages})
+
+@app.get("/api/admin/export/messages")
+async def export_messages(user_id: Optional[str] = None, bot_id: Optional[str] = None,
+                          since: Optional[datetime] = None, until: Optional[datetime] = None,
+                          cursor: Optional[str] = None, gzip: bool = False):
+    """
+    Stream chat history as NDJSON, filtered by user, bot and/or time range.
+    
+    The body ends with a checkpoint line; pass its cursor back to resume an interrupted export.
+    """
+    require_mongodb("Exports")
+    resume_after = None
+    if cursor:
+        try:
+            resume_after = decode_export_cursor(cursor)
+        except ValueError:
+            raise HTTPException(status_code=400, detail="Invalid cursor")
     
-    return {"messages": messages}
+    filename = "chat-export.ndjson.gz" if gzip else "chat-export.ndjson"
+    export_db = data_access.reader("export")
+    return StreamingResponse(
+        chat_exporter.stream(export_db.chat_sessions, export_db.chat_archives, user_id=user_id, bot_id=bot_id,
+                             since=since, until=until, resume_after=resume_after, compress=gzip),
+        media_type="application/gzip" if gzip else "application/x-ndjson",
+        headers={"Content-Disposition": f'attachment; filename="{filename}"'}
+    )
 
 # Content Moderation (Placeholder)
 async def moderate_content(content: str, user_id: str) -> dict:
     """Basic content moderation"""
+    # Ban and mute state come from the user cache, so enforcing them costs no extra read
+    user = await get_cached_user(user_id)
+    if user and user.get("is_banned"):
+        return {"is_safe": False, "violations": [], "action": "banned"}
+    
+    muted_until = user.get("muted_until") if user else None
+    if muted_until and muted_until > datetime.now():
+        return {"is_safe": False, "violations": [], "action": "muted"}
+    
     violation_keywords = [
         "kill", "die", "suicide", "harm", "hurt", "hate", 
         "nazi", "terrorist", "bomb", "weapon", "drug"
@@ -469,82 +826,247 @@ async def moderate_content(content: str, user_id: str) -> dict:
     violations = [word for word in violation_keywords if word in content_lower]
     
     if violations:
-        # Increment user violation score
-        await db.users.update_one(
-            {"user_id": user_id},
-            {"$inc": {"violation_score": len(violations)}}
+        action = "warning" if len(violations) < 3 else "mute"
+        
+        # Increment user violation score (and mute on serious violations)
+        muted_until = datetime.now() + timedelta(minutes=MUTE_DURATION_MINUTES) if action == "mute" else None
+        updated_user = await storage.record_violation(
+            user_id, len(violations), muted_until=muted_until, fields=USER_CACHE_FIELDS
         )
         
+        # Write-through so the next turn sees the new moderation state
+        if updated_user:
+            user_cache.put(user_id, updated_user)
+        else:
+            user_cache.invalidate(user_id)
+        
         return {
             "is_safe": False,
             "violations": violations,
-            "action": "warning" if len(violations) < 3 else "mute"
+            "action": action
         }
     
     return {"is_safe": True, "violations": [], "action": "none"}
 
+async def load_turn_context(session_id: str) -> Optional[dict]:
+    """Resolve the bot profile for a session (no message bodies are read)"""
+    bot_id = await storage.get_session_bot_id(session_id)
+    if not bot_id:
+        return None
+    return persona_catalog.get(bot_id)
+
+async def persist_interrupted_turn(session_id: str, user_id: str, user_message: str):
+    """Record a user message whose turn was cancelled before the bot answered"""
+    now = datetime.now()
+    try:
+        await storage.append_message(session_id, user_id, {
+            "timestamp": now,
+            "user_message": user_message,
+            "bot_response": None,
+            "interrupted": True
+        })
+    except Exception as e:
+        logger.error(f"Failed to persist interrupted turn for session {session_id}: {str(e)}")
+
+async def run_chat_turn(session_id: str, user_id: str, user_message: str, premium: bool = False) -> Optional[dict]:
+    """
+    Run one chat turn as a small dependency graph and return the frame to send back.
+    
+    Moderation and session/bot resolution run concurrently. Generation only needs the
+    bot profile, so it starts speculatively and is cancelled if moderation rejects the message.
+    """
+    turn_started = time.perf_counter()
+    timings: Dict[str, float] = {}
+    
+    moderation_task = asyncio.create_task(
+        turn_metrics.timed("moderation", moderate_content(user_message, user_id), timings)
+    )
+    context_task = asyncio.create_task(
+        turn_metrics.timed("context", load_turn_context(session_id), timings)
+    )
+    
+    generation_task = None
+    # Resolved once moderation decides, so a speculative reply is only cached for an accepted turn
+    accepted = asyncio.get_running_loop().create_future()
+    try:
+        bot_profile = await context_task
+        
+        if bot_profile and SPECULATIVE_GENERATION and not moderation_task.done():
+            turn_metrics.speculative_started += 1
+            generation_task = asyncio.create_task(turn_metrics.timed(
+                "generation", generate_ai_response(user_message, bot_profile, premium=premium, accepted=accepted),
+                timings
+            ))
+        
+        moderation = await moderation_task
+    except BaseException:
+        for task in (moderation_task, context_task, generation_task, accepted):
+            if task:
+                task.cancel()
+        raise
+    accepted.set_result(moderation["is_safe"])
+    
+    if not moderation["is_safe"]:
+        if generation_task:
+            generation_task.cancel()
+            turn_metrics.speculative_cancelled += 1
+        if moderation["action"] == "banned":
+            return {"type": "banned", "message": "This account has been suspended."}
+        if moderation["action"] == "muted":
+            return {"type": "moderation_warning", "message": "You're muted for a little while. Take a breather! 💙"}
+        return {
+            "type": "moderation_warning",
+            "message": "Please keep our conversation respectful and positive! 💙"
+        }
+    
+    if not bot_profile:
+        return None
+    
+    # Generate AI response
+    try:
+        if generation_task:
+            ai_response = await generation_task
+        else:
+            ai_response = await turn_metrics.timed(
+                "generation", generate_ai_response(user_message, bot_profile, premium=premium), timings
+            )
+    except asyncio.CancelledError:
+        # The client left mid-generation: keep their message, without an answer
+        await persist_interrupted_turn(session_id, user_id, user_message)
+        raise
+    
+    # Save messages to database
+    message_doc = {
+        "timestamp": datetime.now(),
+        "user_message": user_message,
+        "bot_response": ai_response
+    }
+    
+    await turn_metrics.timed("persist", storage.append_message(
+        session_id, user_id, message_doc, preview=message_preview(ai_response)
+    ), timings)
+    
+    turn_metrics.record(timings, time.perf_counter() - turn_started)
+    
+    return {
+        "type": "message",
+        "bot_name": bot_profile["name"],
+        "content": ai_response,
+        "timestamp": datetime.now().isoformat()
+    }
+
+async def chat_event_stream(session_id: str, user_id: str, user_message: str, premium: bool):
+    async def fan_out(reply: dict):
+        if reply["type"] == "message":
+            # Tabs holding the session open over WebSocket show the answer too
+            if manager.connections_for_session(session_id):
+                await manager.send_personal_message(reply, session_id)
+        elif reply["type"] == "banned":
+            await manager.close_user(user_id, code=1008)
+    
+    turn = asyncio.create_task(run_chat_turn(session_id, user_id, user_message, premium=premium))
+    try:
+        async for chunk in stream_turn_events(turn, keepalive_seconds=SSE_KEEPALIVE_SECONDS, on_reply=fan_out):
+            yield chunk
+    finally:
+        if not turn.done():
+            # The response was dropped mid-turn; nobody is left to read the answer
+            turn.cancel()
+            turn_metrics.turns_cancelled += 1
+            logger.info(f"SSE client left session {session_id} mid-turn, cancelled generation")
+
+# Server-Sent Events alternative to the WebSocket for clients that can't hold one open
+@app.post("/api/chat/stream")
+async def chat_stream(message: ChatMessage, user_id: str):
+    """
+    Send one message and receive the reply as a ``text/event-stream`` response.
+    
+    The turn runs through the same pipeline as the WebSocket. The stream carries keep-alive
+    comments while the answer is generated, then a single event named after the reply
+    type (``message``, ``moderation_warning``, ``banned`` or ``error``), and ends.
+    """
+    user = await get_cached_user(user_id)
+    if user and user.get("is_banned"):
+        raise HTTPException(status_code=403, detail="This account has been suspended.")
+    
+    premium = bool(user and user.get("premium"))
+    return StreamingResponse(
+        chat_event_stream(message.session_id, user_id, message.content, premium),
+        media_type="text/event-stream",
+        headers=SSE_HEADERS
+    )
+
 # WebSocket endpoint for real-time chat
 @app.websocket("/ws/{session_id}/{user_id}")
 async def websocket_endpoint(websocket: WebSocket, session_id: str, user_id: str):
-    await manager.connect(websocket, user_id, session_id)
+    # Banned users are refused before the handshake completes (served from the user cache)
+    user = await get_cached_user(user_id)
+    if user and user.get("is_banned"):
+        await websocket.close(code=1008)
+        return
+    
+    connection = await manager.connect(websocket, user_id, session_id)
+    
+    # Premium users get a longer latency SLO and reserved upstream capacity
+    premium = bool(user and user.get("premium"))
+    
+    # Frames are read alongside the running turn, so a disconnect is seen while the
+    # answer is still being generated rather than on the next receive
+    inbox = Inbox(maxsize=MAX_QUEUED_FRAMES)
+    reader = manager.start_reader(connection, inbox)
     
     try:
         while True:
             # Receive message from user
-            data = await websocket.receive_text()
-            message_data = json.loads(data)
+            message_data = await inbox.get()
+            if message_data is None:
+                return
             
             user_message = message_data.get("content", "")
             
-            # Moderate content
-            moderation = await moderate_content(user_message, user_id)
+            turn = asyncio.create_task(run_chat_turn(session_id, user_id, user_message, premium=premium))
+            await asyncio.wait({turn, reader}, return_when=asyncio.FIRST_COMPLETED)
+            if not turn.done():
+                manager.disconnect(connection)
+                if not manager.connections_for_session(session_id):
+                    # Nobody is left to read the answer: stop the upstream work it would cost
+                    turn.cancel()
+                    turn_metrics.turns_cancelled += 1
+                    logger.info(f"Client left session {session_id} mid-turn, cancelled generation")
+                    await asyncio.wait({turn})
+                    return
+                # The session is still open in another tab, which gets the answer
+                await asyncio.wait({turn})
             
-            if not moderation["is_safe"]:
-                await manager.send_personal_message(
-                    json.dumps({
-                        "type": "moderation_warning",
-                        "message": "Please keep our conversation respectful and positive! 💙"
-                    }),
-                    session_id
-                )
+            reply = turn.result()
+            if not reply:
                 continue
-            
-            # Get session and bot info
-            session = await db.chat_sessions.find_one({"session_id": session_id})
-            if not session:
-                continue
-                
-            bot_profile = next((bot for bot in REALISTIC_BOT_PROFILES if bot["bot_id"] == session["bot_id"]), None)
-            
-            # Generate AI response
-            ai_response = await generate_ai_response(user_message, bot_profile)
-            
-            # Save messages to database
-            message_doc = {
-                "timestamp": datetime.now(),
-                "user_message": user_message,
-                "bot_response": ai_response
-            }
-            
-            await db.chat_sessions.update_one(
-                {"session_id": session_id},
-                {"$push": {"messages": message_doc}}
-            )
-            
-            # Send response back to user
-            await manager.send_personal_message(
-                json.dumps({
-                    "type": "message",
-                    "bot_name": bot_profile["name"],
-                    "content": ai_response,
-                    "timestamp": datetime.now().isoformat()
-                }),
-                session_id
-            )
-            
-    except WebSocketDisconnect:
-        manager.disconnect(session_id, user_id)
+            if reply["type"] == "message":
+                # Every tab with the session open shows the bot's answer
+                await manager.send_personal_message(reply, session_id)
+            elif reply["type"] == "banned":
+                await manager.send(connection, reply)
+                await manager.close_user(user_id, code=1008)
+                return
+            else:
+                await manager.send(connection, reply)
+    finally:
+        reader.cancel()
+        manager.disconnect(connection)
+
+# Everything above runs at import time
+IMPORT_SECONDS = time.perf_counter() - _IMPORT_STARTED
 
 if __name__ == "__main__":
     import uvicorn
-    uvicorn.run(app, host="0.0.0.0", port=8001)
\ No newline at end of file
+    uvicorn.run(
+        app,
+        host="0.0.0.0",
+        port=8001,
+        ws="websockets",
+        # Idle keep-alive connections are kept this long for reuse by the next request
+        # (/api/chat/stream clients post one request per turn)
+        timeout_keep_alive=int(os.getenv("HTTP_KEEP_ALIVE_SECONDS", "75")),
+        # Negotiated permessage-deflate on /ws/{session_id}/{user_id}
+        ws_per_message_deflate=os.getenv("WS_PER_MESSAGE_DEFLATE", "true").lower() == "true"
+    )
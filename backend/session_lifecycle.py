@@ -0,0 +1,251 @@
+import logging
+import os
+import time
+import zlib
+from datetime import datetime, timedelta
+from typing import AsyncIterator, Dict, List, Optional, Tuple
+
+import bson
+from bson import Binary
+
+logger = logging.getLogger(__name__)
+
+
+def compress_messages(messages: List[Dict]) -> Binary:
+    """BSON-encode (keeping datetimes intact) and zlib-compress a run of messages"""
+    return Binary(zlib.compress(bson.encode({"messages": messages}), 6))
+
+
+def decompress_messages(data: bytes) -> List[Dict]:
+    """Inverse of compress_messages"""
+    return bson.decode(zlib.decompress(data))["messages"]
+
+
+async def iter_archived_messages(archive_collection, session_id: str,
+                                 session=None) -> AsyncIterator[Tuple[int, Dict]]:
+    """Yield ``(message_index, message)`` for a session's archived history, one chunk in memory at a time"""
+    chunks = archive_collection.find(
+        {"session_id": session_id}, {"_id": 0, "first_index": 1, "data": 1}, session=session
+    ).sort("first_index", 1)
+    async for chunk in chunks:
+        for offset, message in enumerate(decompress_messages(chunk["data"])):
+            yield chunk["first_index"] + offset, message
+
+
+async def load_session_messages(sessions, archive_collection, session_id: str,
+                                session=None) -> Optional[List[Dict]]:
+    """
+    Full message history of a session, rehydrating archived messages in front of the hot tail.
+    ``session`` is an optional (causally consistent) client session for both reads.
+    """
+    document = await sessions.find_one(
+        {"session_id": session_id}, {"_id": 0, "messages": 1, "archived_message_count": 1}, session=session
+    )
+    if document is None:
+        return None
+
+    messages = document.get("messages", [])
+    if document.get("archived_message_count"):
+        archived = [message async for _, message in iter_archived_messages(archive_collection, session_id, session)]
+        messages = archived + messages
+    return messages
+
+
+class SessionLifecycleJob:
+    """
+    Background retention job: marks idle sessions inactive and moves the cold part of
+    their history into compressed archive documents, keeping only a short hot tail inline
+    """
+
+    def __init__(self):
+        self.idle_minutes = float(os.getenv("SESSION_IDLE_MINUTES", "30"))
+        self.archive_after_days = float(os.getenv("SESSION_ARCHIVE_AFTER_DAYS", "7"))
+        # Recent messages that stay inline for previews and the chat UI
+        self.hot_tail_messages = int(os.getenv("SESSION_HOT_TAIL_MESSAGES", "20"))
+        self.chunk_messages = int(os.getenv("ARCHIVE_CHUNK_MESSAGES", "500"))
+        self.sessions_per_run = int(os.getenv("ARCHIVE_SESSIONS_PER_RUN", "500"))
+
+        self.running = False
+        self.last_run: Dict = {}
+
+        # Metrics
+        self.stats = {
+            "runs": 0,
+            "sessions_deactivated": 0,
+            "sessions_archived": 0,
+            "messages_archived": 0,
+            "archive_conflicts": 0,
+            "bytes_before_compression": 0,
+            "bytes_after_compression": 0,
+        }
+
+    async def ensure_indexes(self, db):
+        await db.chat_archives.create_index(
+            [("session_id", 1), ("first_index", 1)], name="session_archive_chunks", unique=True
+        )
+        await db.chat_sessions.create_index(
+            [("is_active", 1), ("last_active_at", 1)], name="session_lifecycle"
+        )
+
+    async def mark_idle_inactive(self, sessions, now: datetime) -> int:
+        """Close sessions that have seen no message for ``idle_minutes``"""
+        result = await sessions.update_many(
+            {"is_active": True, "last_active_at": {"$lt": now - timedelta(minutes=self.idle_minutes)}},
+            {"$set": {"is_active": False, "ended_at": now}}
+        )
+        return result.modified_count
+
+    async def archive_session(self, sessions, archives, session_id: str, now: datetime) -> int:
+        """Move all but the hot tail of one session into archive chunks; returns messages moved"""
+        session = await sessions.find_one(
+            {"session_id": session_id},
+            {"_id": 0, "messages": 1, "message_count": 1, "archived_message_count": 1}
+        )
+        if not session:
+            return 0
+
+        messages = session.get("messages", [])
+        cold = messages[:-self.hot_tail_messages] if self.hot_tail_messages else messages
+        if not cold:
+            return 0
+
+        archived_count = session.get("archived_message_count", 0)
+        chunk_starts = []
+        for offset in range(0, len(cold), self.chunk_messages):
+            chunk = cold[offset:offset + self.chunk_messages]
+            raw_size = len(bson.encode({"messages": chunk}))
+            data = compress_messages(chunk)
+            first_index = archived_count + offset
+            await archives.update_one(
+                {"session_id": session_id, "first_index": first_index},
+                {"$set": {
+                    "message_count": len(chunk),
+                    "first_timestamp": chunk[0].get("timestamp"),
+                    "last_timestamp": chunk[-1].get("timestamp"),
+                    "archived_at": now,
+                    "data": data
+                }},
+                upsert=True
+            )
+            chunk_starts.append(first_index)
+            self.stats["bytes_before_compression"] += raw_size
+            self.stats["bytes_after_compression"] += len(data)
+
+        # Only trim if no message arrived since we read the session; otherwise undo and retry next run
+        result = await sessions.update_one(
+            {"session_id": session_id, "message_count": session.get("message_count")},
+            {"$set": {
+                "messages": messages[len(cold):],
+                "archived_message_count": archived_count + len(cold),
+                "archived_at": now
+            }}
+        )
+        if not result.modified_count:
+            await archives.delete_many({"session_id": session_id, "first_index": {"$in": chunk_starts}})
+            self.stats["archive_conflicts"] += 1
+            return 0
+
+        return len(cold)
+
+    async def archive_cold_sessions(self, sessions, archives, now: datetime) -> Tuple[int, int]:
+        """Archive inactive sessions older than ``archive_after_days``"""
+        candidates = await sessions.find(
+            {
+                "is_active": False,
+                "last_active_at": {"$lt": now - timedelta(days=self.archive_after_days)},
+                "$expr": {"$gt": [
+                    {"$subtract": ["$message_count", {"$ifNull": ["$archived_message_count", 0]}]},
+                    self.hot_tail_messages
+                ]}
+            },
+            {"_id": 0, "session_id": 1}
+        ).limit(self.sessions_per_run).to_list(length=self.sessions_per_run)
+
+        archived_sessions = 0
+        archived_messages = 0
+        for candidate in candidates:
+            moved = await self.archive_session(sessions, archives, candidate["session_id"], now)
+            if moved:
+                archived_sessions += 1
+                archived_messages += moved
+        return archived_sessions, archived_messages
+
+    async def measure(self, db, probe_session_ids: List[str]) -> Dict:
+        """Working-set size of chat_sessions and latency of the hot message read"""
+        report: Dict = {}
+        try:
+            coll_stats = await db.command("collStats", "chat_sessions")
+            report["sessions_bytes"] = coll_stats.get("size")
+            report["avg_session_bytes"] = coll_stats.get("avgObjSize")
+        except Exception:
+            report["sessions_bytes"] = None
+
+        timings = []
+        for session_id in probe_session_ids:
+            started = time.perf_counter()
+            await db.chat_sessions.find_one({"session_id": session_id}, {"_id": 0, "messages": 1})
+            timings.append(time.perf_counter() - started)
+        if timings:
+            timings.sort()
+            report["hot_read_p50_ms"] = round(timings[len(timings) // 2] * 1000, 3)
+            report["hot_read_max_ms"] = round(timings[-1] * 1000, 3)
+        return report
+
+    async def run(self, db) -> Dict:
+        """One pass of the retention job, with before/after working-set measurements"""
+        if self.running:
+            return {"skipped": "already running"}
+
+        self.running = True
+        started = time.perf_counter()
+        try:
+            now = datetime.now()
+            # The most recently active sessions stand in for the hot query path
+            probes = await db.chat_sessions.find({}, {"_id": 0, "session_id": 1}).sort(
+                "last_active_at", -1
+            ).limit(20).to_list(length=20)
+            probe_ids = [probe["session_id"] for probe in probes]
+
+            before = await self.measure(db, probe_ids)
+            deactivated = await self.mark_idle_inactive(db.chat_sessions, now)
+            archived_sessions, archived_messages = await self.archive_cold_sessions(
+                db.chat_sessions, db.chat_archives, now
+            )
+            after = await self.measure(db, probe_ids)
+        finally:
+            self.running = False
+
+        self.stats["runs"] += 1
+        self.stats["sessions_deactivated"] += deactivated
+        self.stats["sessions_archived"] += archived_sessions
+        self.stats["messages_archived"] += archived_messages
+
+        self.last_run = {
+            "finished_at": datetime.now(),
+            "duration_seconds": round(time.perf_counter() - started, 3),
+            "sessions_deactivated": deactivated,
+            "sessions_archived": archived_sessions,
+            "messages_archived": archived_messages,
+            "before": before,
+            "after": after,
+        }
+        logger.info(
+            f"Session lifecycle: {deactivated} deactivated, {archived_messages} messages "
+            f"archived from {archived_sessions} sessions"
+        )
+        return self.last_run
+
+    def get_stats(self) -> Dict:
+        """Get retention job statistics"""
+        raw = self.stats["bytes_before_compression"]
+        return {
+            **self.stats,
+            "compression_ratio": round(raw / self.stats["bytes_after_compression"], 2)
+            if self.stats["bytes_after_compression"] else None,
+            "running": self.running,
+            "last_run": self.last_run,
+        }
+
+
+# Global session lifecycle job instance
+session_lifecycle = SessionLifecycleJob()
@@ -0,0 +1,329 @@
+import asyncio
+import logging
+import sqlite3
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from typing import Any, Callable, Dict, Iterable, List, Optional, Tuple
+
+import bson
+
+from storage import ChatStorage, SESSION_SUMMARY_FIELDS, pick_fields, truncate_to_millis
+
+logger = logging.getLogger(__name__)
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS users (
+    user_id TEXT PRIMARY KEY,
+    doc BLOB NOT NULL
+);
+CREATE TABLE IF NOT EXISTS sessions (
+    session_id TEXT PRIMARY KEY,
+    user_id TEXT NOT NULL,
+    last_active_at TEXT NOT NULL,
+    message_count INTEGER NOT NULL DEFAULT 0,
+    doc BLOB NOT NULL
+);
+CREATE INDEX IF NOT EXISTS user_recent_sessions ON sessions (user_id, last_active_at DESC, session_id DESC);
+CREATE TABLE IF NOT EXISTS messages (
+    session_id TEXT NOT NULL,
+    seq INTEGER NOT NULL,
+    doc BLOB NOT NULL,
+    PRIMARY KEY (session_id, seq)
+) WITHOUT ROWID;
+"""
+
+
+def encode(document: Dict) -> bytes:
+    """BSON keeps datetimes intact (at MongoDB's millisecond precision)"""
+    return bson.encode({key: value for key, value in document.items() if key != "_id"})
+
+
+def decode(data: bytes) -> Dict:
+    return bson.decode(data)
+
+
+def sort_key(value: datetime) -> str:
+    """Fixed-width text form of a datetime, so SQLite orders it correctly"""
+    return truncate_to_millis(value).strftime("%Y-%m-%dT%H:%M:%S.%f")
+
+
+class SQLiteStorage(ChatStorage):
+    """
+    Local SQLite database in WAL mode.
+
+    Writes from all coroutines are queued and committed together: one transaction per batch
+    of up to ``commit_batch_size`` writes, gathered for at most ``commit_wait_ms`` or for as
+    long as the previous batch takes to commit. A write returns once its batch has committed.
+    Reads run on ``read_threads`` threads with a connection each, which WAL lets run
+    alongside the writer.
+    """
+
+    name = "sqlite"
+
+    def __init__(self, path: str, commit_batch_size: int = 256, commit_wait_ms: float = 2.0,
+                 read_threads: int = 4):
+        self.path = path
+        self.commit_batch_size = max(1, commit_batch_size)
+        self.commit_wait = commit_wait_ms / 1000.0
+
+        # sqlite3 connections are used from the one thread of their executor
+        self._writer = ThreadPoolExecutor(max_workers=1, thread_name_prefix="sqlite-writer")
+        self._reader = ThreadPoolExecutor(max_workers=max(1, read_threads), thread_name_prefix="sqlite-reader")
+        self._write_connection: Optional[sqlite3.Connection] = None
+        self._read_local = threading.local()
+        self._read_connections: List[sqlite3.Connection] = []
+
+        self._pending: List[Tuple[Callable, tuple, asyncio.Future]] = []
+        self._wakeup: Optional[asyncio.Event] = None
+        self._committer: Optional[asyncio.Task] = None
+        self._committing = False
+
+        # Metrics
+        self.stats = {
+            "writes": 0,
+            "reads": 0,
+            "commits": 0,
+            "failed_writes": 0,
+            "largest_batch": 0,
+            "commit_seconds": 0.0,
+        }
+
+    def _connect(self) -> sqlite3.Connection:
+        connection = sqlite3.connect(self.path, isolation_level=None, check_same_thread=False)
+        connection.execute("PRAGMA journal_mode=WAL")
+        # With WAL, NORMAL fsyncs at checkpoints only: commits survive a process crash, not a power cut
+        connection.execute("PRAGMA synchronous=NORMAL")
+        connection.execute("PRAGMA busy_timeout=5000")
+        return connection
+
+    def _open_writer(self):
+        if self._write_connection is None:
+            self._write_connection = self._connect()
+            self._write_connection.executescript(SCHEMA)
+        return self._write_connection
+
+    # Write path: group commit
+
+    async def _write(self, operation: Callable, *args) -> Any:
+        loop = asyncio.get_running_loop()
+        if self._committer is None:
+            self._wakeup = asyncio.Event()
+            self._committer = asyncio.create_task(self._commit_batches())
+        future = loop.create_future()
+        self._pending.append((operation, args, future))
+        self._wakeup.set()
+        return await future
+
+    async def _commit_batches(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            await self._wakeup.wait()
+            # Give concurrent writers a moment to join the batch
+            if self.commit_wait > 0 and len(self._pending) < self.commit_batch_size:
+                await asyncio.sleep(self.commit_wait)
+            batch = self._pending[:self.commit_batch_size]
+            del self._pending[:self.commit_batch_size]
+            if not self._pending:
+                self._wakeup.clear()
+
+            started = time.perf_counter()
+            self._committing = True
+            try:
+                results = await loop.run_in_executor(self._writer, self._commit, batch)
+            except Exception as e:
+                logger.error(f"SQLite commit of {len(batch)} writes failed: {e}")
+                results = [e] * len(batch)
+            finally:
+                self._committing = False
+            self.stats["commit_seconds"] += time.perf_counter() - started
+            self.stats["commits"] += 1
+            self.stats["writes"] += len(batch)
+            self.stats["largest_batch"] = max(self.stats["largest_batch"], len(batch))
+
+            for (_, _, future), result in zip(batch, results):
+                if future.done():
+                    continue
+                if isinstance(result, Exception):
+                    self.stats["failed_writes"] += 1
+                    future.set_exception(result)
+                else:
+                    future.set_result(result)
+
+    def _commit(self, batch) -> List[Any]:
+        """One transaction for the whole batch; a failing write is rolled back on its own"""
+        connection = self._open_writer()
+        results = []
+        connection.execute("BEGIN IMMEDIATE")
+        try:
+            for operation, args, _ in batch:
+                connection.execute("SAVEPOINT write")
+                try:
+                    results.append(operation(connection, *args))
+                    connection.execute("RELEASE write")
+                except Exception as e:
+                    connection.execute("ROLLBACK TO write")
+                    connection.execute("RELEASE write")
+                    results.append(e)
+            connection.execute("COMMIT")
+        except BaseException:
+            connection.execute("ROLLBACK")
+            raise
+        return results
+
+    # Read path
+
+    async def _read(self, query: Callable, *args) -> Any:
+        self.stats["reads"] += 1
+        return await asyncio.get_running_loop().run_in_executor(self._reader, self._run_read, query, args)
+
+    def _run_read(self, query: Callable, args: tuple) -> Any:
+        connection = getattr(self._read_local, "connection", None)
+        if connection is None:
+            connection = self._read_local.connection = self._connect()
+            connection.executescript(SCHEMA)
+            self._read_connections.append(connection)
+        return query(connection, *args)
+
+    # ChatStorage
+
+    async def create_user(self, user: Dict):
+        await self._write(self._insert_user, user["user_id"], encode(user))
+
+    @staticmethod
+    def _insert_user(connection, user_id: str, doc: bytes):
+        connection.execute("INSERT INTO users (user_id, doc) VALUES (?, ?)", (user_id, doc))
+
+    async def get_user(self, user_id: str, fields: Optional[Iterable[str]] = None) -> Optional[Dict]:
+        row = await self._read(
+            lambda connection: connection.execute("SELECT doc FROM users WHERE user_id = ?", (user_id,)).fetchone()
+        )
+        return pick_fields(decode(row[0]), fields) if row else None
+
+    async def record_violation(self, user_id: str, points: int,
+                               muted_until: Optional[datetime] = None,
+                               fields: Optional[Iterable[str]] = None) -> Optional[Dict]:
+        user = await self._write(self._add_violation, user_id, points, muted_until)
+        return pick_fields(user, fields) if user else None
+
+    @staticmethod
+    def _add_violation(connection, user_id: str, points: int, muted_until: Optional[datetime]) -> Optional[Dict]:
+        # Read-modify-write is atomic: the writer thread is the only one changing the database
+        row = connection.execute("SELECT doc FROM users WHERE user_id = ?", (user_id,)).fetchone()
+        if row is None:
+            return None
+        user = decode(row[0])
+        user["violation_score"] = user.get("violation_score", 0) + points
+        if muted_until is not None:
+            user["muted_until"] = muted_until
+        doc = encode(user)
+        connection.execute("UPDATE users SET doc = ? WHERE user_id = ?", (doc, user_id))
+        return decode(doc)
+
+    async def create_session(self, session: Dict):
+        header = {key: value for key, value in session.items() if key != "messages"}
+        header.setdefault("message_count", 0)
+        await self._write(self._insert_session, session["session_id"], session["user_id"],
+                          sort_key(session["last_active_at"]), header["message_count"], encode(header))
+
+    @staticmethod
+    def _insert_session(connection, session_id: str, user_id: str, last_active_at: str,
+                        message_count: int, doc: bytes):
+        connection.execute(
+            "INSERT INTO sessions (session_id, user_id, last_active_at, message_count, doc) VALUES (?, ?, ?, ?, ?)",
+            (session_id, user_id, last_active_at, message_count, doc)
+        )
+
+    async def get_session_bot_id(self, session_id: str) -> Optional[str]:
+        row = await self._read(
+            lambda connection: connection.execute(
+                "SELECT doc FROM sessions WHERE session_id = ?", (session_id,)
+            ).fetchone()
+        )
+        return decode(row[0]).get("bot_id") if row else None
+
+    async def append_message(self, session_id: str, user_id: str, message: Dict,
+                             preview: Optional[str] = None) -> bool:
+        return await self._write(self._append_message, session_id, message, preview)
+
+    @staticmethod
+    def _append_message(connection, session_id: str, message: Dict, preview: Optional[str]) -> bool:
+        row = connection.execute(
+            "SELECT message_count, doc FROM sessions WHERE session_id = ?", (session_id,)
+        ).fetchone()
+        if row is None:
+            return False
+        message_count, header = row[0], decode(row[1])
+        header.update(
+            message_count=message_count + 1,
+            last_active_at=message["timestamp"],
+            is_active=True
+        )
+        if preview is not None:
+            header["last_message_preview"] = preview
+        connection.execute(
+            "INSERT INTO messages (session_id, seq, doc) VALUES (?, ?, ?)",
+            (session_id, message_count, encode(message))
+        )
+        connection.execute(
+            "UPDATE sessions SET last_active_at = ?, message_count = ?, doc = ? WHERE session_id = ?",
+            (sort_key(message["timestamp"]), message_count + 1, encode(header), session_id)
+        )
+        return True
+
+    async def list_sessions(self, user_id: str, limit: int,
+                            after: Optional[Tuple[datetime, str]] = None) -> List[Dict]:
+        if after and after[0] is None:
+            return []  # every session here has an activity time, so none sorts after
+        if after:
+            sql = ("SELECT doc FROM sessions WHERE user_id = ? AND (last_active_at < ? "
+                   "OR (last_active_at = ? AND session_id < ?)) "
+                   "ORDER BY last_active_at DESC, session_id DESC LIMIT ?")
+            last_active_at = sort_key(after[0])
+            params = (user_id, last_active_at, last_active_at, after[1], limit)
+        else:
+            sql = "SELECT doc FROM sessions WHERE user_id = ? ORDER BY last_active_at DESC, session_id DESC LIMIT ?"
+            params = (user_id, limit)
+        rows = await self._read(lambda connection: connection.execute(sql, params).fetchall())
+        return [pick_fields(decode(row[0]), SESSION_SUMMARY_FIELDS) for row in rows]
+
+    async def get_messages(self, session_id: str) -> Optional[List[Dict]]:
+        def query(connection):
+            if connection.execute("SELECT 1 FROM sessions WHERE session_id = ?", (session_id,)).fetchone() is None:
+                return None
+            return connection.execute(
+                "SELECT doc FROM messages WHERE session_id = ? ORDER BY seq", (session_id,)
+            ).fetchall()
+
+        rows = await self._read(query)
+        return None if rows is None else [decode(row[0]) for row in rows]
+
+    async def close(self):
+        # Let queued writes commit before shutting the threads down
+        while self._pending or self._committing:
+            await asyncio.sleep(self.commit_wait or 0.001)
+        if self._committer:
+            self._committer.cancel()
+            self._committer = None
+        loop = asyncio.get_running_loop()
+        if self._write_connection is not None:
+            await loop.run_in_executor(self._writer, self._write_connection.close)
+            self._write_connection = None
+        self._reader.shutdown(wait=True)
+        for connection in self._read_connections:
+            connection.close()
+        self._read_connections.clear()
+        self._writer.shutdown(wait=True)
+
+    def get_stats(self) -> Dict:
+        commits = self.stats["commits"]
+        return {
+            "backend": self.name,
+            "path": self.path,
+            "commit_batch_size": self.commit_batch_size,
+            "commit_wait_ms": self.commit_wait * 1000,
+            **self.stats,
+            "commit_seconds": round(self.stats["commit_seconds"], 4),
+            "writes_per_commit": round(self.stats["writes"] / commits, 2) if commits else 0.0,
+        }
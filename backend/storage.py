@@ -0,0 +1,299 @@
+import copy
+import logging
+import os
+from abc import ABC, abstractmethod
+from datetime import datetime
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from pymongo import ReturnDocument
+
+logger = logging.getLogger(__name__)
+
+# Fields a session listing returns (no message bodies)
+SESSION_SUMMARY_FIELDS = (
+    "session_id", "user_id", "bot_id", "bot_name", "started_at", "is_active",
+    "last_active_at", "message_count", "last_message_preview",
+)
+
+
+def truncate_to_millis(value: datetime) -> datetime:
+    """Datetimes as MongoDB stores them (millisecond precision), so every backend returns the same values"""
+    return value.replace(microsecond=value.microsecond // 1000 * 1000)
+
+
+def pick_fields(document: Dict, fields: Optional[Iterable[str]]) -> Dict:
+    if fields is None:
+        return {key: value for key, value in document.items() if key != "_id"}
+    return {key: document[key] for key in fields if key in document}
+
+
+class ChatStorage(ABC):
+    """
+    Persistence for users, chat sessions, their messages and violation counters.
+
+    The server only talks to this interface; ``MotorStorage`` keeps everything in MongoDB,
+    ``MemoryStorage`` in process memory and ``SQLiteStorage`` in a local WAL-mode database.
+    Documents go in and come out as plain dicts with datetimes at millisecond precision.
+    A backend missing any of the abstract methods fails when it is constructed.
+    """
+
+    name = "abstract"
+
+    @abstractmethod
+    async def create_user(self, user: Dict):
+        """Store a new user document"""
+
+    @abstractmethod
+    async def get_user(self, user_id: str, fields: Optional[Iterable[str]] = None) -> Optional[Dict]:
+        """The user's document (only ``fields`` when given), or ``None``"""
+
+    @abstractmethod
+    async def record_violation(self, user_id: str, points: int,
+                               muted_until: Optional[datetime] = None,
+                               fields: Optional[Iterable[str]] = None) -> Optional[Dict]:
+        """Add ``points`` to the violation score (and mute until ``muted_until``); the updated user or ``None``"""
+
+    @abstractmethod
+    async def create_session(self, session: Dict):
+        """Store a new session document (``messages`` empty)"""
+
+    @abstractmethod
+    async def get_session_bot_id(self, session_id: str) -> Optional[str]:
+        """The bot a session talks to, or ``None`` if it does not exist"""
+
+    @abstractmethod
+    async def append_message(self, session_id: str, user_id: str, message: Dict,
+                             preview: Optional[str] = None) -> bool:
+        """
+        Append a turn and bump the session's activity summary; ``preview`` replaces the
+        listing preview when given. ``False`` if the session does not exist.
+        """
+
+    @abstractmethod
+    async def list_sessions(self, user_id: str, limit: int,
+                            after: Optional[Tuple[datetime, str]] = None) -> List[Dict]:
+        """
+        The user's session summaries, most recently active first (ties by session id, descending),
+        starting strictly after the ``(last_active_at, session_id)`` keyset cursor. Sessions with
+        no ``last_active_at`` yet (not reached by the summary backfill) sort last, and a cursor
+        from one of them has ``None`` in its place.
+        """
+
+    @abstractmethod
+    async def get_messages(self, session_id: str) -> Optional[List[Dict]]:
+        """Full message history of a session, oldest first, or ``None`` if it does not exist"""
+
+    async def close(self):
+        pass
+
+    def get_stats(self) -> Dict:
+        return {"backend": self.name}
+
+
+class MotorStorage(ChatStorage):
+    """
+    MongoDB through Motor, with history reads routed by ``DataAccess`` and archived
+    history rehydrated transparently
+    """
+
+    name = "mongodb"
+
+    def __init__(self, data_access):
+        self.data_access = data_access
+        self.db = data_access.writer
+
+    async def create_user(self, user: Dict):
+        async with self.data_access.causal_write(user["user_id"]) as session:
+            # insert_one adds _id to the document it is given
+            await self.db.users.insert_one(dict(user), session=session)
+
+    async def get_user(self, user_id: str, fields: Optional[Iterable[str]] = None) -> Optional[Dict]:
+        async with self.data_access.causal_read(user_id) as session:
+            return await self.data_access.reader("users").users.find_one(
+                {"user_id": user_id}, self._projection(fields), session=session
+            )
+
+    async def record_violation(self, user_id: str, points: int,
+                               muted_until: Optional[datetime] = None,
+                               fields: Optional[Iterable[str]] = None) -> Optional[Dict]:
+        update: Dict = {"$inc": {"violation_score": points}}
+        if muted_until is not None:
+            update["$set"] = {"muted_until": muted_until}
+        async with self.data_access.causal_write(user_id) as session:
+            return await self.db.users.find_one_and_update(
+                {"user_id": user_id},
+                update,
+                projection=self._projection(fields),
+                return_document=ReturnDocument.AFTER,
+                session=session
+            )
+
+    async def create_session(self, session: Dict):
+        async with self.data_access.causal_write(session["session_id"], session["user_id"]) as client_session:
+            await self.db.chat_sessions.insert_one(dict(session), session=client_session)
+
+    async def get_session_bot_id(self, session_id: str) -> Optional[str]:
+        # On the turn's hot path: always the primary
+        session = await self.db.chat_sessions.find_one({"session_id": session_id}, {"_id": 0, "bot_id": 1})
+        return session["bot_id"] if session else None
+
+    async def append_message(self, session_id: str, user_id: str, message: Dict,
+                             preview: Optional[str] = None) -> bool:
+        summary = {"last_active_at": message["timestamp"], "is_active": True}
+        if preview is not None:
+            summary["last_message_preview"] = preview
+        async with self.data_access.causal_write(session_id, user_id) as session:
+            result = await self.db.chat_sessions.update_one(
+                {"session_id": session_id},
+                {"$push": {"messages": message}, "$set": summary, "$inc": {"message_count": 1}},
+                session=session
+            )
+        return result.matched_count > 0
+
+    async def list_sessions(self, user_id: str, limit: int,
+                            after: Optional[Tuple[datetime, str]] = None) -> List[Dict]:
+        query: Dict = {"user_id": user_id}
+        if after:
+            last_active_at, last_session_id = after
+            if last_active_at is None:
+                # Past every backfilled session: only the ones without an activity time are left
+                query.update({"last_active_at": None, "session_id": {"$lt": last_session_id}})
+            else:
+                # Keyset pagination: continue strictly after the last session of the previous page
+                query["$or"] = [
+                    {"last_active_at": {"$lt": last_active_at}},
+                    {"last_active_at": last_active_at, "session_id": {"$lt": last_session_id}},
+                    {"last_active_at": None}
+                ]
+        # History browsing may be served by a secondary, after the user's own latest writes
+        async with self.data_access.causal_read(user_id) as session:
+            return await self.data_access.reader("history").chat_sessions.find(
+                query, self._projection(SESSION_SUMMARY_FIELDS), session=session
+            ).sort(
+                [("last_active_at", -1), ("session_id", -1)]
+            ).limit(limit).to_list(length=limit)
+
+    async def get_messages(self, session_id: str) -> Optional[List[Dict]]:
+        from session_lifecycle import load_session_messages
+
+        async with self.data_access.causal_read(session_id) as session:
+            history = self.data_access.reader("history")
+            return await load_session_messages(history.chat_sessions, history.chat_archives, session_id,
+                                               session=session)
+
+    @staticmethod
+    def _projection(fields: Optional[Iterable[str]]) -> Dict:
+        projection = {"_id": 0}
+        if fields is not None:
+            projection.update({field: 1 for field in fields})
+        return projection
+
+    def get_stats(self) -> Dict:
+        return {"backend": self.name, "data_access": self.data_access.get_stats()}
+
+
+class MemoryStorage(ChatStorage):
+    """
+    Process-local dicts: no I/O at all, for benchmarks and development without MongoDB.
+    Nothing survives a restart and nothing is shared between workers.
+    """
+
+    name = "memory"
+
+    def __init__(self):
+        self.users: Dict[str, Dict] = {}
+        self.sessions: Dict[str, Dict] = {}
+        # user_id -> session ids, for listings
+        self.user_sessions: Dict[str, List[str]] = {}
+
+    async def create_user(self, user: Dict):
+        self.users[user["user_id"]] = self._stored(user)
+
+    async def get_user(self, user_id: str, fields: Optional[Iterable[str]] = None) -> Optional[Dict]:
+        user = self.users.get(user_id)
+        return copy.deepcopy(pick_fields(user, fields)) if user else None
+
+    async def record_violation(self, user_id: str, points: int,
+                               muted_until: Optional[datetime] = None,
+                               fields: Optional[Iterable[str]] = None) -> Optional[Dict]:
+        user = self.users.get(user_id)
+        if user is None:
+            return None
+        user["violation_score"] = user.get("violation_score", 0) + points
+        if muted_until is not None:
+            user["muted_until"] = truncate_to_millis(muted_until)
+        return copy.deepcopy(pick_fields(user, fields))
+
+    async def create_session(self, session: Dict):
+        stored = self._stored(session)
+        stored["messages"] = list(stored.get("messages", []))
+        self.sessions[session["session_id"]] = stored
+        self.user_sessions.setdefault(session["user_id"], []).append(session["session_id"])
+
+    async def get_session_bot_id(self, session_id: str) -> Optional[str]:
+        session = self.sessions.get(session_id)
+        return session["bot_id"] if session else None
+
+    async def append_message(self, session_id: str, user_id: str, message: Dict,
+                             preview: Optional[str] = None) -> bool:
+        session = self.sessions.get(session_id)
+        if session is None:
+            return False
+        message = self._stored(message)
+        session["messages"].append(message)
+        session["message_count"] = session.get("message_count", 0) + 1
+        session["last_active_at"] = message["timestamp"]
+        session["is_active"] = True
+        if preview is not None:
+            session["last_message_preview"] = preview
+        return True
+
+    async def list_sessions(self, user_id: str, limit: int,
+                            after: Optional[Tuple[datetime, str]] = None) -> List[Dict]:
+        sessions = [self.sessions[session_id] for session_id in self.user_sessions.get(user_id, ())]
+        keys = sorted(((session["last_active_at"], session["session_id"]) for session in sessions), reverse=True)
+        if after:
+            if after[0] is None:
+                return []  # every session here has an activity time, so none sorts after
+            keys = [key for key in keys if key < after]
+        return [pick_fields(self.sessions[session_id], SESSION_SUMMARY_FIELDS) for _, session_id in keys[:limit]]
+
+    async def get_messages(self, session_id: str) -> Optional[List[Dict]]:
+        session = self.sessions.get(session_id)
+        if session is None:
+            return None
+        return [dict(message) for message in session["messages"]]
+
+    @staticmethod
+    def _stored(document: Dict) -> Dict:
+        """Private copy of a document, datetimes truncated the way MongoDB would"""
+        stored = copy.deepcopy({key: value for key, value in document.items() if key != "_id"})
+        for key, value in stored.items():
+            if isinstance(value, datetime):
+                stored[key] = truncate_to_millis(value)
+        return stored
+
+    def get_stats(self) -> Dict:
+        return {
+            "backend": self.name,
+            "users": len(self.users),
+            "sessions": len(self.sessions),
+            "messages": sum(len(session["messages"]) for session in self.sessions.values()),
+        }
+
+
+def make_storage(backend: str, data_access=None) -> ChatStorage:
+    """Storage backend by name: ``mongodb`` (needs a ``DataAccess``), ``memory`` or ``sqlite``"""
+    if backend == "mongodb":
+        return MotorStorage(data_access)
+    if backend == "memory":
+        return MemoryStorage()
+    if backend == "sqlite":
+        from sqlite_storage import SQLiteStorage
+        return SQLiteStorage(
+            os.getenv("SQLITE_PATH", "chatapp.sqlite3"),
+            commit_batch_size=int(os.getenv("SQLITE_COMMIT_BATCH_SIZE", "256")),
+            commit_wait_ms=float(os.getenv("SQLITE_COMMIT_WAIT_MS", "2")),
+            read_threads=int(os.getenv("SQLITE_READ_THREADS", "4"))
+        )
+    raise ValueError(f"Unknown storage backend {backend!r}")
@@ -0,0 +1,216 @@
+import asyncio
+import random
+import time
+import uuid
+from datetime import datetime, timedelta
+from typing import Dict, List
+
+from storage import ChatStorage, truncate_to_millis
+from transcript_replay import percentile
+
+USER_FIELDS = ("user_id", "interests", "premium", "is_banned", "muted_until", "violation_score")
+
+
+def make_user(user_id: str, created_at: datetime) -> Dict:
+    return {
+        "user_id": user_id,
+        "username": f"user-{user_id[:8]}",
+        "age": 30,
+        "interests": ["travel", "music"],
+        "language": "en",
+        "created_at": created_at,
+        "violation_score": 0,
+        "is_banned": False,
+        "premium": False,
+    }
+
+
+def make_session(session_id: str, user_id: str, started_at: datetime) -> Dict:
+    return {
+        "session_id": session_id,
+        "user_id": user_id,
+        "bot_id": "alex_traveler",
+        "bot_name": "Alex Johnson",
+        "started_at": started_at,
+        "messages": [],
+        "is_active": True,
+        "last_active_at": started_at,
+        "message_count": 0,
+        "last_message_preview": "",
+    }
+
+
+def make_message(timestamp: datetime, index: int) -> Dict:
+    return {"timestamp": timestamp, "user_message": f"message {index}", "bot_response": f"reply {index}"}
+
+
+async def check_conformance(storage: ChatStorage) -> List[str]:
+    """
+    Run the behaviour every ``ChatStorage`` backend must share against ``storage``;
+    returns the failed expectations (empty when it conforms)
+    """
+    failures: List[str] = []
+
+    def expect(condition: bool, description: str):
+        if not condition:
+            failures.append(description)
+
+    now = truncate_to_millis(datetime.now())
+    user_id = str(uuid.uuid4())
+
+    # Users and violation counters
+    await storage.create_user(make_user(user_id, now))
+    user = await storage.get_user(user_id)
+    expect(user is not None and user["username"] == f"user-{user_id[:8]}", "get_user returns the created user")
+    expect(user is not None and user.get("created_at") == now, "datetimes round-trip at millisecond precision")
+    expect(user is not None and "_id" not in user, "documents come back without _id")
+    projected = await storage.get_user(user_id, USER_FIELDS)
+    expect(projected is not None and set(projected) == set(USER_FIELDS) - {"muted_until"},
+           f"get_user(fields) returns only the stored requested fields, got {projected and sorted(projected)}")
+    expect(await storage.get_user("missing-user") is None, "get_user of an unknown id is None")
+
+    if user is not None:
+        user["interests"].append("mutated")
+        again = await storage.get_user(user_id)
+        expect("mutated" not in again["interests"], "returned documents are copies")
+
+    updated = await storage.record_violation(user_id, 2, fields=USER_FIELDS)
+    expect(updated is not None and updated["violation_score"] == 2, "record_violation adds to the score")
+    muted_until = truncate_to_millis(now + timedelta(minutes=10))
+    updated = await storage.record_violation(user_id, 3, muted_until=muted_until, fields=USER_FIELDS)
+    expect(updated is not None and updated["violation_score"] == 5 and updated.get("muted_until") == muted_until,
+           "record_violation can mute and returns the updated user")
+    expect(await storage.record_violation("missing-user", 1) is None, "record_violation of an unknown id is None")
+
+    await asyncio.gather(*[storage.record_violation(user_id, 1) for _ in range(20)])
+    user = await storage.get_user(user_id, ("violation_score",))
+    expect(user == {"violation_score": 25}, f"concurrent violations are not lost, got {user}")
+
+    # Sessions and messages
+    session_ids = [str(uuid.uuid4()) for _ in range(5)]
+    for index, session_id in enumerate(session_ids):
+        await storage.create_session(make_session(session_id, user_id, now + timedelta(seconds=index)))
+    expect(await storage.get_session_bot_id(session_ids[0]) == "alex_traveler", "get_session_bot_id")
+    expect(await storage.get_session_bot_id("missing-session") is None, "get_session_bot_id of an unknown id is None")
+    expect(await storage.get_messages(session_ids[0]) == [], "a new session has no messages")
+    expect(await storage.get_messages("missing-session") is None, "get_messages of an unknown id is None")
+
+    turn_at = now + timedelta(minutes=1)
+    for index in range(3):
+        appended = await storage.append_message(session_ids[0], user_id, make_message(turn_at, index),
+                                                preview=f"reply {index}")
+        expect(appended, "append_message to an existing session returns True")
+    # An interrupted turn leaves the preview alone
+    await storage.append_message(session_ids[0], user_id,
+                                 {"timestamp": turn_at, "user_message": "gone", "bot_response": None,
+                                  "interrupted": True})
+    expect(not await storage.append_message("missing-session", user_id, make_message(turn_at, 0)),
+           "append_message to an unknown session returns False")
+
+    messages = await storage.get_messages(session_ids[0]) or []
+    expect([message["user_message"] for message in messages] == ["message 0", "message 1", "message 2", "gone"],
+           f"messages come back in order, got {[message['user_message'] for message in messages]}")
+    expect(bool(messages) and messages[0]["timestamp"] == turn_at and messages[-1].get("interrupted") is True,
+           "message fields round-trip")
+
+    listing = await storage.list_sessions(user_id, limit=10)
+    expect([session["session_id"] for session in listing] == [session_ids[0]] + session_ids[:0:-1],
+           "list_sessions orders by last activity, newest first")
+    if listing:
+        first = listing[0]
+        expect(first["message_count"] == 4 and first["last_message_preview"] == "reply 2"
+               and first["last_active_at"] == turn_at,
+               f"appending updates the session summary, got {first}")
+        expect("messages" not in first, "list_sessions leaves message bodies out")
+
+    # Keyset pagination, including a tie on last_active_at broken by session id
+    tied_ids = sorted(str(uuid.uuid4()) for _ in range(4))
+    for session_id in tied_ids:
+        await storage.create_session(make_session(session_id, user_id, now - timedelta(hours=1)))
+    expected_order = [session["session_id"] for session in await storage.list_sessions(user_id, limit=100)]
+    expect(expected_order[-4:] == tied_ids[::-1], "ties on last_active_at are ordered by session id, descending")
+    paged, after = [], None
+    while True:
+        page = await storage.list_sessions(user_id, limit=3, after=after)
+        paged.extend(session["session_id"] for session in page)
+        if len(page) < 3:
+            break
+        after = (page[-1]["last_active_at"], page[-1]["session_id"])
+    expect(paged == expected_order, "paging with the keyset cursor visits every session once, in order")
+    expect(await storage.list_sessions("missing-user", limit=10) == [], "list_sessions of an unknown user is empty")
+
+    # Concurrent turns on one session keep every message and the count
+    burst_session = str(uuid.uuid4())
+    await storage.create_session(make_session(burst_session, user_id, now))
+    await asyncio.gather(*[
+        storage.append_message(burst_session, user_id, make_message(turn_at, index), preview=str(index))
+        for index in range(50)
+    ])
+    burst = await storage.get_messages(burst_session) or []
+    summary = [session for session in await storage.list_sessions(user_id, limit=100)
+               if session["session_id"] == burst_session]
+    expect(len(burst) == 50 and sorted(message["user_message"] for message in burst)
+           == sorted(f"message {index}" for index in range(50)), "concurrent appends are all kept")
+    expect(bool(summary) and summary[0]["message_count"] == 50, "concurrent appends are all counted")
+
+    return failures
+
+
+async def run_storage_workload(storage: ChatStorage, users: int = 200, sessions_per_user: int = 2,
+                               turns: int = 5000, concurrency: int = 100, seed: int = 11) -> Dict:
+    """
+    Chat-shaped load: users and sessions created up front, then ``turns`` turns from
+    ``concurrency`` clients, each reading the user, the session's bot, appending the turn and
+    every fifth turn reloading the history and listing sessions, as the UI does
+    """
+    rng = random.Random(seed)
+    now = datetime.now()
+    user_ids = [str(uuid.uuid4()) for _ in range(users)]
+    started = time.perf_counter()
+    await asyncio.gather(*[storage.create_user(make_user(user_id, now)) for user_id in user_ids])
+    sessions = []
+    for user_id in user_ids:
+        for _ in range(sessions_per_user):
+            sessions.append((str(uuid.uuid4()), user_id))
+    await asyncio.gather(*[storage.create_session(make_session(session_id, user_id, now))
+                           for session_id, user_id in sessions])
+    setup_seconds = time.perf_counter() - started
+
+    write_latencies: List[float] = []
+    read_latencies: List[float] = []
+    plan = [rng.choice(sessions) for _ in range(turns)]
+
+    async def client(offset: int):
+        for index in range(offset, turns, concurrency):
+            session_id, user_id = plan[index]
+            read_started = time.perf_counter()
+            await storage.get_user(user_id, USER_FIELDS)
+            await storage.get_session_bot_id(session_id)
+            read_latencies.append(time.perf_counter() - read_started)
+
+            write_started = time.perf_counter()
+            await storage.append_message(session_id, user_id, make_message(datetime.now(), index),
+                                         preview=f"reply {index}")
+            write_latencies.append(time.perf_counter() - write_started)
+
+            if index % 5 == 0:
+                read_started = time.perf_counter()
+                await storage.get_messages(session_id)
+                await storage.list_sessions(user_id, limit=20)
+                read_latencies.append(time.perf_counter() - read_started)
+
+    started = time.perf_counter()
+    await asyncio.gather(*[client(offset) for offset in range(concurrency)])
+    wall_seconds = time.perf_counter() - started
+
+    write_latencies.sort()
+    read_latencies.sort()
+    return {
+        "setup_seconds": round(setup_seconds, 3),
+        "turns": turns,
+        "turns_per_sec": round(turns / wall_seconds, 1),
+        "append_p50_ms": round(percentile(write_latencies, 0.50) * 1000, 3),
+        "append_p99_ms": round(percentile(write_latencies, 0.99) * 1000, 3),
+        "read_p50_ms": round(percentile(read_latencies, 0.50) * 1000, 3),
+        "read_p99_ms": round(percentile(read_latencies, 0.99) * 1000, 3),
+    }
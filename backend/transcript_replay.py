@@ -0,0 +1,243 @@
+import asyncio
+import logging
+import random
+import time
+from collections import OrderedDict
+from datetime import datetime
+from typing import Any, Dict, List, Optional
+
+from deadlines import Deadline
+from serialization import loads
+from session_lifecycle import load_session_messages
+
+logger = logging.getLogger(__name__)
+
+SYNTHETIC_OPENERS = [
+    "hey! how's your day going?", "what are you up to today?", "I just got back from a long walk",
+    "do you have any weekend plans?", "what's the best thing you ate this week?",
+]
+SYNTHETIC_FOLLOW_UPS = [
+    "haha that's amazing", "tell me more about that", "no way, really?", "I've always wanted to try that",
+    "what got you into it?", "that sounds exhausting honestly", "same here!", "ok but what happened next",
+    "lol", "I'm not sure I agree", "what would you recommend?", "how long have you been doing that?",
+]
+
+
+def _epoch_seconds(value: Any) -> Optional[float]:
+    """Timestamp from a session document (datetime) or an export line (ISO string)"""
+    if isinstance(value, datetime):
+        return value.timestamp()
+    if isinstance(value, str):
+        try:
+            return datetime.fromisoformat(value).timestamp()
+        except ValueError:
+            return None
+    if isinstance(value, (int, float)):
+        return float(value)
+    return None
+
+
+def make_transcript(session_id: str, bot_id: str, messages: List[Dict]) -> Dict:
+    """A replayable conversation: the user's side of each turn and when it was sent"""
+    turns = []
+    for message in messages:
+        user_message = message.get("user_message")
+        if not user_message:
+            continue
+        turns.append((_epoch_seconds(message.get("timestamp")), user_message))
+    return {"session_id": session_id, "bot_id": bot_id, "turns": turns}
+
+
+def parse_transcripts(data: bytes) -> List[Dict]:
+    """
+    Transcripts from a fixture: a JSON list of chat_sessions documents (or ``{"sessions": [...]}``),
+    or the NDJSON produced by /api/admin/export/messages.
+    """
+    try:
+        documents = loads(data)
+    except ValueError:
+        documents = None
+
+    if documents is not None:
+        if isinstance(documents, dict):
+            documents = documents.get("sessions", [])
+        return [
+            make_transcript(document.get("session_id", ""), document.get("bot_id", ""), document.get("messages", []))
+            for document in documents
+        ]
+
+    # NDJSON export: message lines grouped back into sessions, checkpoints skipped
+    sessions: "OrderedDict[str, Dict]" = OrderedDict()
+    for line in data.splitlines():
+        if not line.strip():
+            continue
+        record = loads(line)
+        if record.get("type") != "message":
+            continue
+        session = sessions.setdefault(record["session_id"], {"bot_id": record.get("bot_id", ""), "messages": []})
+        session["messages"].append(record)
+    return [make_transcript(session_id, session["bot_id"], session["messages"])
+            for session_id, session in sessions.items()]
+
+
+def load_fixture(path: str) -> List[Dict]:
+    with open(path, "rb") as fixture:
+        return parse_transcripts(fixture.read())
+
+
+async def load_from_collection(sessions, archives=None, limit: int = 1000,
+                               bot_id: Optional[str] = None) -> List[Dict]:
+    """Most recently active recorded sessions, archived history included"""
+    query: Dict = {"message_count": {"$gt": 0}}
+    if bot_id:
+        query["bot_id"] = bot_id
+    headers = await sessions.find(query, {"_id": 0, "session_id": 1, "bot_id": 1}).sort(
+        "last_active_at", -1
+    ).limit(limit).to_list(length=limit)
+
+    transcripts = []
+    for header in headers:
+        messages = await load_session_messages(sessions, archives, header["session_id"]) or []
+        transcripts.append(make_transcript(header["session_id"], header["bot_id"], messages))
+    return transcripts
+
+
+def synthetic_transcripts(bot_ids: List[str], sessions: int = 200, turns_per_session: int = 12,
+                          seed: int = 7) -> List[Dict]:
+    """
+    Chat-shaped traffic when no recordings are at hand: staggered session starts over ten
+    minutes, bursty replies a few seconds apart, and the occasional long pause
+    """
+    rng = random.Random(seed)
+    started = time.time()
+    transcripts = []
+    for index in range(sessions):
+        clock = started + rng.uniform(0, 600)
+        turns = []
+        for turn in range(max(1, int(rng.gauss(turns_per_session, turns_per_session / 3)))):
+            text = rng.choice(SYNTHETIC_OPENERS if turn == 0 else SYNTHETIC_FOLLOW_UPS)
+            turns.append((clock, text))
+            clock += rng.expovariate(1 / 8.0) if rng.random() > 0.1 else rng.uniform(60, 180)
+        transcripts.append({"session_id": f"synthetic-{index}", "bot_id": rng.choice(bot_ids), "turns": turns})
+    return transcripts
+
+
+def percentile(sorted_values: List[float], fraction: float) -> float:
+    if not sorted_values:
+        return 0.0
+    return sorted_values[min(len(sorted_values) - 1, int(round(fraction * (len(sorted_values) - 1))))]
+
+
+class TranscriptReplayer:
+    """
+    Drives recorded conversations through ``AIServiceManager.generate_response``, keeping
+    their original pacing (compressed by ``speedup``), and reports what the pipeline did with them
+    """
+
+    def __init__(self,
+                 service_manager,
+                 bot_profiles: Dict[str, Dict],
+                 concurrency: int = 50,
+                 speedup: float = 60.0,
+                 context_window: int = 10,
+                 deadline_seconds: Optional[float] = None):
+        self.service_manager = service_manager
+        self.bot_profiles = bot_profiles
+        # Turns in flight at once (a session only holds a slot while its turn is generating);
+        # speedup <= 0 replays every turn back to back
+        self.concurrency = max(1, concurrency)
+        self.speedup = speedup
+        self.context_window = context_window
+        self.deadline_seconds = deadline_seconds
+
+    async def _replay_session(self, transcript: Dict, replay_started: float, origin: float,
+                              slots: asyncio.Semaphore, latencies: List[float], counters: Dict):
+        bot_profile = self.bot_profiles.get(transcript["bot_id"])
+        if bot_profile is None:
+            counters["unknown_bots"] += 1
+            bot_profile = next(iter(self.bot_profiles.values()))
+
+        context: List[Dict] = []
+        # A turn that can't go out on time (the previous reply took longer than the recorded gap)
+        # shifts the rest of its session, so later gaps keep their shape instead of bunching up
+        drift = 0.0
+        for sent_at, user_message in transcript["turns"]:
+            if self.speedup > 0 and sent_at is not None:
+                delay = replay_started + (sent_at - origin) / self.speedup + drift - time.perf_counter()
+                if delay > 0:
+                    await asyncio.sleep(delay)
+                else:
+                    counters["late_turns"] += 1
+                    counters["drift_seconds"] -= delay
+                    drift -= delay
+
+            # Latency includes any wait for a slot, as a user would see it
+            started = time.perf_counter()
+            async with slots:
+                deadline = Deadline.after(self.deadline_seconds) if self.deadline_seconds else None
+                response = await self.service_manager.generate_response(
+                    user_message, bot_profile, context[-self.context_window:] if self.context_window else None,
+                    deadline=deadline
+                )
+            latencies.append(time.perf_counter() - started)
+
+            if self.context_window:
+                context.append({"type": "user", "content": user_message})
+                context.append({"type": "bot", "content": response})
+
+    async def run(self, transcripts: List[Dict]) -> Dict:
+        """Replay every transcript and return the report"""
+        transcripts = [transcript for transcript in transcripts if transcript["turns"]]
+        timestamps = [sent_at for transcript in transcripts for sent_at, _ in transcript["turns"] if sent_at is not None]
+        origin = min(timestamps) if timestamps else 0.0
+
+        manager = self.service_manager
+        transport_stats = getattr(manager.transport, "stats", {})
+        before = {
+            "upstream_requests": transport_stats.get("requests", 0),
+            "quota_rejections": transport_stats.get("quota_rejections", 0),
+            "fallbacks": manager.fallback_responses,
+            "deadline_fallbacks": manager.deadline_fallbacks,
+            "coalesced": manager.coalescer.stats["coalesced_requests"],
+        }
+
+        latencies: List[float] = []
+        counters = {"unknown_bots": 0, "late_turns": 0, "drift_seconds": 0.0}
+        slots = asyncio.Semaphore(self.concurrency)
+
+        replay_started = time.perf_counter()
+        await asyncio.gather(*[
+            self._replay_session(transcript, replay_started, origin, slots, latencies, counters)
+            for transcript in transcripts
+        ])
+        wall_seconds = time.perf_counter() - replay_started
+
+        turns = len(latencies)
+        latencies.sort()
+        delta = {
+            "upstream_requests": transport_stats.get("requests", 0) - before["upstream_requests"],
+            "quota_rejections": transport_stats.get("quota_rejections", 0) - before["quota_rejections"],
+            "fallbacks": manager.fallback_responses - before["fallbacks"],
+            "deadline_fallbacks": manager.deadline_fallbacks - before["deadline_fallbacks"],
+            "coalesced": manager.coalescer.stats["coalesced_requests"] - before["coalesced"],
+        }
+        return {
+            "sessions": len(transcripts),
+            "turns": turns,
+            "wall_seconds": round(wall_seconds, 3),
+            "turns_per_sec": round(turns / wall_seconds, 1) if wall_seconds else 0.0,
+            "latency_p50_ms": round(percentile(latencies, 0.50) * 1000, 2),
+            "latency_p90_ms": round(percentile(latencies, 0.90) * 1000, 2),
+            "latency_p99_ms": round(percentile(latencies, 0.99) * 1000, 2),
+            "latency_max_ms": round(latencies[-1] * 1000, 2) if latencies else 0.0,
+            "fallback_rate": round(delta["fallbacks"] / turns, 4) if turns else 0.0,
+            "deadline_fallbacks": delta["deadline_fallbacks"],
+            "upstream_calls_per_turn": round(delta["upstream_requests"] / turns, 3) if turns else 0.0,
+            "quota_rejections": delta["quota_rejections"],
+            "coalesced_turns": delta["coalesced"],
+            "late_turns": counters["late_turns"],
+            # Average by which a late turn went out after its (shifted) recorded time
+            "avg_late_ms": round(counters["drift_seconds"] / counters["late_turns"] * 1000, 2)
+            if counters["late_turns"] else 0.0,
+            "unknown_bots": counters["unknown_bots"],
+        }
@@ -0,0 +1,54 @@
+import time
+from typing import Awaitable, Dict
+
+
+class TurnMetrics:
+    """
+    Per-stage timings for chat turns, and the time saved by running stages concurrently
+    """
+
+    def __init__(self):
+        self.turns = 0
+        self.stage_totals: Dict[str, float] = {}
+        self.wall_clock_total = 0.0
+        self.sequential_total = 0.0
+        self.speculative_started = 0
+        self.speculative_cancelled = 0
+        # Turns abandoned because the client disconnected before the answer was ready
+        self.turns_cancelled = 0
+
+    @staticmethod
+    async def timed(stage: str, awaitable: Awaitable, timings: Dict[str, float]):
+        """Await ``awaitable`` and record its duration under ``stage``"""
+        started = time.perf_counter()
+        try:
+            return await awaitable
+        finally:
+            timings[stage] = time.perf_counter() - started
+
+    def record(self, timings: Dict[str, float], wall_clock: float):
+        """Record one turn: stage durations and the actual elapsed time"""
+        self.turns += 1
+        for stage, duration in timings.items():
+            self.stage_totals[stage] = self.stage_totals.get(stage, 0.0) + duration
+
+        # Running the same stages one after another would have taken their sum
+        self.sequential_total += sum(timings.values())
+        self.wall_clock_total += wall_clock
+
+    def get_stats(self) -> Dict:
+        """Get turn pipeline statistics (milliseconds)"""
+        turns = self.turns or 1
+        saved = max(0.0, self.sequential_total - self.wall_clock_total)
+        return {
+            "turns": self.turns,
+            "avg_wall_clock_ms": round(self.wall_clock_total / turns * 1000, 3),
+            "avg_sequential_ms": round(self.sequential_total / turns * 1000, 3),
+            "avg_saved_ms": round(saved / turns * 1000, 3),
+            "avg_stage_ms": {
+                stage: round(total / turns * 1000, 3) for stage, total in self.stage_totals.items()
+            },
+            "speculative_started": self.speculative_started,
+            "speculative_cancelled": self.speculative_cancelled,
+            "turns_cancelled": self.turns_cancelled,
+        }
@@ -0,0 +1,85 @@
+import logging
+import time
+from collections import OrderedDict
+from typing import Awaitable, Callable, Dict, Optional
+
+logger = logging.getLogger(__name__)
+
+# Fields of a user document that the hot path needs; everything else stays in MongoDB
+USER_CACHE_PROJECTION = {
+    "_id": 0,
+    "user_id": 1,
+    "interests": 1,
+    "premium": 1,
+    "is_banned": 1,
+    "muted_until": 1,
+    "violation_score": 1
+}
+USER_CACHE_FIELDS = tuple(field for field, included in USER_CACHE_PROJECTION.items() if included)
+
+
+class UserCache:
+    """
+    Bounded LRU cache of user profile and moderation state with TTL and write-through updates
+    """
+
+    def __init__(self, max_entries: int = 10000, ttl_seconds: float = 300.0):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+
+        # user_id -> (expires_at, record), least recently used first
+        self.entries: "OrderedDict[str, tuple]" = OrderedDict()
+
+        # Metrics
+        self.stats = {
+            "hits": 0,
+            "misses": 0,
+            "evictions": 0,
+            "expirations": 0,
+            "invalidations": 0,
+        }
+
+    async def get(self, user_id: str, loader: Callable[[str], Awaitable[Optional[Dict]]]) -> Optional[Dict]:
+        """Return the cached user, loading it through ``loader`` on a miss"""
+        entry = self.entries.get(user_id)
+        if entry is not None:
+            expires_at, record = entry
+            if expires_at > time.monotonic():
+                self.entries.move_to_end(user_id)
+                self.stats["hits"] += 1
+                return record
+
+            del self.entries[user_id]
+            self.stats["expirations"] += 1
+
+        self.stats["misses"] += 1
+        record = await loader(user_id)
+        if record is not None:
+            self.put(user_id, record)
+        return record
+
+    def put(self, user_id: str, record: Dict):
+        """Store a fresh copy of the user's hot fields"""
+        fields = {key: record.get(key) for key in USER_CACHE_PROJECTION if key != "_id"}
+        self.entries[user_id] = (time.monotonic() + self.ttl_seconds, fields)
+        self.entries.move_to_end(user_id)
+
+        while len(self.entries) > self.max_entries:
+            self.entries.popitem(last=False)
+            self.stats["evictions"] += 1
+
+    def invalidate(self, user_id: str):
+        """Drop a user so the next read goes back to the database"""
+        if self.entries.pop(user_id, None) is not None:
+            self.stats["invalidations"] += 1
+
+    def get_stats(self) -> Dict:
+        """Get cache statistics"""
+        lookups = self.stats["hits"] + self.stats["misses"]
+        return {
+            **self.stats,
+            "entries": len(self.entries),
+            "max_entries": self.max_entries,
+            "ttl_seconds": self.ttl_seconds,
+            "hit_rate": round(self.stats["hits"] / lookups, 4) if lookups else 0.0,
+        }
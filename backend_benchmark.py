@@ -0,0 +1,1205 @@
+#!/usr/bin/env python3
+import argparse
+import asyncio
+import logging
+import os
+import sys
+import time
+
+# Benchmarks drive the backend modules in-process against the local mock provider
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "backend"))
+
+# Keep provider failover chatter out of the benchmark output
+logging.basicConfig(level=logging.ERROR)
+
+# Benchmark results tracking
+benchmark_results = {}
+
+def log_benchmark_result(benchmark_name, metrics):
+    """Log benchmark metrics and keep them for the summary"""
+    formatted = ", ".join(f"{key}={value}" for key, value in metrics.items())
+    print(f"[BENCH] {benchmark_name}: {formatted}")
+    benchmark_results[benchmark_name] = metrics
+
+def make_mock_service_manager(service="huggingface", **mock_options):
+    """Build an AIServiceManager wired to a single mock-backed provider"""
+    from ai_service_manager import AIServiceManager
+    from mock_provider import MockProvider
+
+    manager = AIServiceManager()
+    manager.api_keys = {service: ["mock-key-1"]}
+    manager.service_priority = [service]
+    manager.key_rotation_index = {service: 0}
+    manager.coalescing_enabled = False
+    manager.transport = MockProvider(**mock_options)
+    return manager
+
+def load_bot_profiles():
+    """The shipped persona catalog as plain dicts"""
+    from persona_catalog import persona_catalog
+    records, _ = persona_catalog.load_file()
+    return [record.to_dict() for record in records]
+
+def benchmark_micro_batching(turns=200, max_batch_size=8, max_wait_ms=15.0):
+    """Compare one-prompt-per-request against micro-batched Hugging Face calls"""
+    bot_profile = {"bot_id": "bench_bot", "name": "Bench Bot", "conversation_style": "enthusiastic"}
+
+    async def drive(batching, quotas):
+        manager = make_mock_service_manager("huggingface", request_latency=0.05,
+                                            per_item_latency=0.002, quotas=quotas,
+                                            max_concurrent_requests=4)
+        if batching:
+            manager.enable_micro_batching(max_batch_size=max_batch_size, max_wait_ms=max_wait_ms)
+
+        started = time.perf_counter()
+        responses = await asyncio.gather(*[
+            manager.generate_response(f"message number {i}", bot_profile) for i in range(turns)
+        ])
+        elapsed = time.perf_counter() - started
+
+        answered = sum(1 for response in responses if response.startswith("Mock reply"))
+        return {
+            "upstream_requests": manager.transport.stats["requests"],
+            "quota_rejections": manager.transport.stats["quota_rejections"],
+            "answered_upstream": answered,
+            "fallback_rate": round(1 - answered / turns, 3),
+            "turns_per_sec": round(turns / elapsed, 1),
+        }
+
+    for label, quotas in (("quota-bound", None), ("unlimited", {})):
+        for batching in (False, True):
+            mode = "batched" if batching else "unbatched"
+            log_benchmark_result(f"Micro-batching [{label}, {mode}]", asyncio.run(drive(batching, quotas)))
+
+def benchmark_offline_responder(iterations=20000):
+    """Measure CPU time per reply of the compiled offline persona engine"""
+    from persona_responder import PersonaResponseEngine
+    REALISTIC_BOT_PROFILES = load_bot_profiles()
+
+    messages = [
+        "hey!",
+        "I just got back from a trip and took so many photos",
+        "what should I cook for dinner tonight?",
+        "honestly my day was pretty long and boring",
+        "do you like cats or dogs more?",
+        "I've been trying to run more and eat better lately",
+    ]
+
+    engine = PersonaResponseEngine()
+    started = time.perf_counter()
+    engine.compile(REALISTIC_BOT_PROFILES)
+    compile_ms = (time.perf_counter() - started) * 1000
+
+    timings = []
+    for i in range(iterations):
+        profile = REALISTIC_BOT_PROFILES[i % len(REALISTIC_BOT_PROFILES)]
+        message = messages[i % len(messages)]
+        started = time.perf_counter()
+        engine.respond(message, profile)
+        timings.append(time.perf_counter() - started)
+
+    timings.sort()
+    log_benchmark_result("Offline persona responder", {
+        "personas": len(REALISTIC_BOT_PROFILES),
+        "compile_ms": round(compile_ms, 3),
+        "mean_us": round(sum(timings) / len(timings) * 1e6, 2),
+        "p99_us": round(timings[int(len(timings) * 0.99)] * 1e6, 2),
+    })
+
+def benchmark_serialization(sessions=500, messages=2000, rounds=50):
+    """Compare the central orjson serializer against the previous encoding paths"""
+    import json
+    from datetime import datetime
+    from bson import ObjectId
+    from fastapi.encoders import jsonable_encoder
+    from fastapi.responses import JSONResponse
+    from serialization import CachedJSONPayload, FastJSONResponse, dumps
+    REALISTIC_BOT_PROFILES = load_bot_profiles()
+
+    def session_docs():
+        return [{
+            "_id": ObjectId(),
+            "session_id": f"session-{i}",
+            "user_id": "bench-user",
+            "bot_id": "maya_artist",
+            "bot_name": "Maya Chen",
+            "started_at": datetime.now(),
+            "last_active_at": datetime.now(),
+            "message_count": i,
+            "last_message_preview": "That's a fascinating perspective, tell me more about it!",
+            "is_active": True,
+        } for i in range(sessions)]
+
+    message_docs = [{
+        "timestamp": datetime.now(),
+        "user_message": f"user message number {i} with a little bit of text",
+        "bot_response": "That's a fascinating perspective. I've been thinking about something similar... ✨",
+    } for i in range(messages)]
+
+    def legacy_sessions():
+        docs = session_docs()
+        for session in docs:
+            session["_id"] = str(session["_id"])
+            session["started_at"] = session["started_at"].isoformat()
+            session["last_active_at"] = session["last_active_at"].isoformat()
+        return JSONResponse(jsonable_encoder({"sessions": docs})).body
+
+    def fast_sessions():
+        return FastJSONResponse({"sessions": session_docs()}).body
+
+    def legacy_messages():
+        return JSONResponse(jsonable_encoder({"messages": message_docs})).body
+
+    def fast_messages():
+        return FastJSONResponse({"messages": message_docs}).body
+
+    frame = {"type": "message", "bot_name": "Maya Chen",
+             "content": "That's a fascinating perspective! ✨", "timestamp": datetime.now().isoformat()}
+
+    catalog = CachedJSONPayload(lambda: {"bot_profiles": REALISTIC_BOT_PROFILES})
+
+    cases = [
+        ("Session list", legacy_sessions, fast_sessions, rounds),
+        ("Chat messages", legacy_messages, fast_messages, rounds),
+        ("WebSocket frame", lambda: json.dumps(frame), lambda: dumps(frame), rounds * 1000),
+        ("Bot catalog", lambda: JSONResponse(jsonable_encoder({"bot_profiles": REALISTIC_BOT_PROFILES})).body,
+         lambda: catalog.response().body, rounds * 100),
+    ]
+
+    for name, legacy, fast, iterations in cases:
+        timings = {}
+        for label, encode in (("legacy", legacy), ("fast", fast)):
+            started = time.perf_counter()
+            for _ in range(iterations):
+                encode()
+            timings[label] = (time.perf_counter() - started) / iterations * 1e6
+
+        log_benchmark_result(f"Serialization [{name}]", {
+            "legacy_us": round(timings["legacy"], 2),
+            "fast_us": round(timings["fast"], 2),
+            "speedup": round(timings["legacy"] / timings["fast"], 1),
+        })
+
+def benchmark_wire_compression(turns=200):
+    """Bytes on the wire and CPU per chat turn for each frame format and REST encoding"""
+    import gzip
+    import zlib
+    from datetime import datetime
+    from serialization import MSGPACK_SUBPROTOCOL, MSGPACK_AVAILABLE, dumps_bytes, encode_frame
+    from compression import BROTLI_AVAILABLE
+    from persona_responder import PersonaResponseEngine
+    REALISTIC_BOT_PROFILES = load_bot_profiles()
+
+    engine = PersonaResponseEngine()
+    engine.compile(REALISTIC_BOT_PROFILES)
+    profile = REALISTIC_BOT_PROFILES[0]
+    user_messages = ["hey!", "I love food and photography", "what should I do this weekend?",
+                     "I just graduated college", "my day was pretty long honestly"]
+
+    frames = []
+    for i in range(turns):
+        message = user_messages[i % len(user_messages)]
+        frames.append({"content": message})
+        frames.append({"type": "message", "bot_name": profile["name"],
+                       "content": engine.respond(message, profile), "timestamp": datetime.now().isoformat()})
+
+    def run_mode(protocol, deflate):
+        # permessage-deflate keeps one raw-deflate context per direction for the whole connection
+        compressor = zlib.compressobj(zlib.Z_DEFAULT_COMPRESSION, zlib.DEFLATED, -15) if deflate else None
+        total_bytes = 0
+        started = time.process_time()
+        for frame in frames:
+            data = encode_frame(frame, protocol)
+            if isinstance(data, str):
+                data = data.encode("utf-8")
+            if compressor:
+                data = compressor.compress(data) + compressor.flush(zlib.Z_SYNC_FLUSH)
+                data = data[:-4]  # the trailing 00 00 ff ff is implied on the wire
+            total_bytes += len(data)
+        cpu = time.process_time() - started
+        return {"bytes_per_turn": round(total_bytes / turns, 1), "cpu_us_per_turn": round(cpu / turns * 1e6, 2)}
+
+    modes = [("json", None, False), ("json+deflate", None, True)]
+    if MSGPACK_AVAILABLE:
+        modes += [("msgpack", MSGPACK_SUBPROTOCOL, False), ("msgpack+deflate", MSGPACK_SUBPROTOCOL, True)]
+    for label, protocol, deflate in modes:
+        log_benchmark_result(f"WebSocket wire [{label}]", run_mode(protocol, deflate))
+
+    body = dumps_bytes({"bot_profiles": REALISTIC_BOT_PROFILES})
+    encoders = [("identity", lambda data: data), ("gzip-6", lambda data: gzip.compress(data, 6))]
+    if BROTLI_AVAILABLE:
+        import brotli
+        encoders.append(("brotli-4", lambda data: brotli.compress(data, quality=4)))
+    for label, encode in encoders:
+        started = time.process_time()
+        for _ in range(100):
+            encoded = encode(body)
+        cpu = (time.process_time() - started) / 100
+        log_benchmark_result(f"REST bot catalog [{label}]", {"bytes": len(encoded), "cpu_us": round(cpu * 1e6, 1)})
+
+def benchmark_persona_matching(catalog_sizes=(10000, 100000), batch_sizes=(1, 16, 64), rounds=20):
+    """Latency of batched cosine top-k over large synthetic persona catalogs"""
+    import random
+    from persona_matcher import PersonaMatcher
+    REALISTIC_BOT_PROFILES = load_bot_profiles()
+
+    rng = random.Random(7)
+    vocabulary = sorted({interest for bot in REALISTIC_BOT_PROFILES for interest in bot["interests"]})
+    vocabulary += ["cooking", "hiking", "books", "gaming", "yoga", "dance", "wine", "science"]
+
+    for size in catalog_sizes:
+        catalog = [
+            dict(REALISTIC_BOT_PROFILES[i % len(REALISTIC_BOT_PROFILES)],
+                 bot_id=f"bench_bot_{i}", interests=rng.sample(vocabulary, 5))
+            for i in range(size)
+        ]
+        matcher = PersonaMatcher(seed=7)
+        started = time.perf_counter()
+        matcher.build(catalog)
+        log_benchmark_result(f"Persona index [{size} personas]", {
+            "build_ms": round((time.perf_counter() - started) * 1000, 1),
+            "vector_mb": round(matcher.index[2].nbytes / 1e6, 1),
+        })
+
+        for batch_size in batch_sizes:
+            timings = []
+            for _ in range(rounds):
+                users = [rng.sample(vocabulary, 3) for _ in range(batch_size)]
+                started = time.perf_counter()
+                matcher.top_k(users, k=5)
+                timings.append(time.perf_counter() - started)
+            timings.sort()
+            log_benchmark_result(f"Persona top-5 [{size} personas, {batch_size} users/call]", {
+                "p50_ms": round(timings[len(timings) // 2] * 1000, 3),
+                "max_ms": round(timings[-1] * 1000, 3),
+                "per_user_ms": round(timings[len(timings) // 2] * 1000 / batch_size, 3),
+            })
+
+def benchmark_persona_catalog_memory(catalog_sizes=(10000, 100000)):
+    """Heap used by the persona catalog as plain dicts vs. slotted, interned records"""
+    import gc
+    import json
+    import random
+    import tracemalloc
+    from persona_catalog import parse_personas
+
+    profiles = load_bot_profiles()
+    rng = random.Random(11)
+    vocabulary = sorted({interest for bot in profiles for interest in bot["interests"]})
+
+    def raw_catalog(size):
+        # Decoded fresh from JSON, as a file load would, so no strings are shared up front
+        return json.dumps([
+            dict(profiles[i % len(profiles)], bot_id=f"bench_bot_{i}", name=f"Bench Bot {i}",
+                 bio=f"{profiles[i % len(profiles)]['bio']} #{i}", interests=rng.sample(vocabulary, 5))
+            for i in range(size)
+        ])
+
+    def measure(build, data):
+        gc.collect()
+        tracemalloc.start()
+        catalog = build(data)
+        used, _ = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        del catalog
+        return used
+
+    for size in catalog_sizes:
+        data = raw_catalog(size)
+        as_dicts = measure(json.loads, data)
+        as_records = measure(lambda raw: parse_personas(json.loads(raw)), data)
+        log_benchmark_result(f"Persona catalog memory [{size} personas]", {
+            "dicts_mb": round(as_dicts / 1e6, 1),
+            "records_mb": round(as_records / 1e6, 1),
+            "dict_bytes_per_persona": as_dicts // size,
+            "record_bytes_per_persona": as_records // size,
+        })
+
+def benchmark_export_streaming(sizes=(10000, 100000, 500000)):
+    """Peak heap while streaming exports of growing size (should stay flat)"""
+    import tracemalloc
+    from datetime import datetime
+    from bson import ObjectId
+    from chat_export import ChatExporter
+
+    class UnwoundSessions:
+        """Stands in for a Motor aggregation cursor: one unwound message document at a time"""
+
+        def __init__(self, messages):
+            self.messages = messages
+
+        def aggregate(self, pipeline, **kwargs):
+            return self._documents()
+
+        async def _documents(self):
+            session_object_id = ObjectId()
+            for i in range(self.messages):
+                if i % 50 == 0:
+                    session_object_id = ObjectId()
+                yield {
+                    "_id": session_object_id, "session_id": str(session_object_id), "user_id": "bench-user",
+                    "bot_id": "maya_artist", "message_index": i % 50,
+                    "messages": {"timestamp": datetime.now(), "user_message": f"message number {i}",
+                                 "bot_response": "That's so interesting! I'd love to hear more about that! ✨"},
+                }
+
+    async def drain(exporter, collection, compress):
+        total = 0
+        async for chunk in exporter.stream(collection, compress=compress):
+            total += len(chunk)
+        return total
+
+    for compress in (False, True):
+        for size in sizes:
+            exporter = ChatExporter()
+            tracemalloc.start()
+            started = time.perf_counter()
+            total = asyncio.run(drain(exporter, UnwoundSessions(size), compress))
+            elapsed = time.perf_counter() - started
+            _, peak = tracemalloc.get_traced_memory()
+            tracemalloc.stop()
+            log_benchmark_result(f"NDJSON export [{size} messages, {'gzip' if compress else 'plain'}]", {
+                "output_mb": round(total / 1e6, 1),
+                "peak_heap_kb": round(peak / 1024, 1),
+                "messages_per_sec": round(size / elapsed),
+            })
+
+def benchmark_session_archiving(sessions=2000, messages_per_session=200, hot_tail=20):
+    """Inline session size and hot-read decode cost before and after archiving cold history"""
+    import bson
+    from datetime import datetime, timedelta
+    from session_lifecycle import compress_messages, decompress_messages
+
+    started_at = datetime.now() - timedelta(days=30)
+    documents = [{
+        "session_id": f"session-{i}", "user_id": f"user-{i % 100}", "bot_id": "maya_artist",
+        "started_at": started_at, "last_active_at": started_at, "is_active": False,
+        "message_count": messages_per_session,
+        "messages": [{
+            "timestamp": started_at + timedelta(minutes=m),
+            "user_message": f"message {m} about my day and the things I have been up to",
+            "bot_response": "That's so interesting! I'd love to hear more about that! ✨ What happened next?",
+        } for m in range(messages_per_session)],
+    } for i in range(sessions)]
+
+    def hot_read_us(encoded):
+        timings = []
+        for raw in encoded[:200]:
+            began = time.perf_counter()
+            bson.decode(raw)
+            timings.append(time.perf_counter() - began)
+        timings.sort()
+        return round(timings[len(timings) // 2] * 1e6, 1)
+
+    before = [bson.encode(document) for document in documents]
+
+    archive_bytes = 0
+    for document in documents:
+        cold = document["messages"][:-hot_tail]
+        archive_bytes += len(compress_messages(cold))
+        document["messages"] = document["messages"][-hot_tail:]
+        document["archived_message_count"] = len(cold)
+    after = [bson.encode(document) for document in documents]
+
+    # Rehydrating one archived session on read
+    archived_chunk = compress_messages([{"timestamp": started_at, "user_message": "x" * 60, "bot_response": "y" * 80}] * (messages_per_session - hot_tail))
+    began = time.perf_counter()
+    for _ in range(200):
+        decompress_messages(archived_chunk)
+    rehydrate_us = (time.perf_counter() - began) / 200 * 1e6
+
+    log_benchmark_result(f"Session archiving [{sessions} sessions x {messages_per_session} messages]", {
+        "working_set_before_mb": round(sum(map(len, before)) / 1e6, 1),
+        "working_set_after_mb": round(sum(map(len, after)) / 1e6, 1),
+        "archive_mb": round(archive_bytes / 1e6, 1),
+        "hot_read_before_us": hot_read_us(before),
+        "hot_read_after_us": hot_read_us(after),
+        "rehydrate_us": round(rehydrate_us, 1),
+    })
+
+def benchmark_turn_deadlines(turns=50, upstream_latency=2.0, budget=0.5):
+    """Turn latency against a slow upstream, with and without a per-turn deadline"""
+    from deadlines import Deadline
+
+    bot_profile = {"bot_id": "bench_bot", "name": "Bench Bot", "conversation_style": "enthusiastic"}
+
+    async def drive(with_deadline):
+        manager = make_mock_service_manager("openai", request_latency=upstream_latency)
+
+        async def turn(i):
+            deadline = Deadline.after(budget) if with_deadline else None
+            started = time.perf_counter()
+            response = await manager.generate_response(f"message number {i}", bot_profile, deadline=deadline)
+            return time.perf_counter() - started, response.startswith("Mock reply")
+
+        results = await asyncio.gather(*[turn(i) for i in range(turns)])
+        latencies = sorted(latency for latency, _ in results)
+        return {
+            "p50_s": round(latencies[len(latencies) // 2], 3),
+            "max_s": round(latencies[-1], 3),
+            "answered_upstream": sum(1 for _, upstream in results if upstream),
+            "deadline_fallbacks": manager.deadline_fallbacks,
+        }
+
+    log_benchmark_result(f"Turn latency [no deadline, upstream {upstream_latency}s]", asyncio.run(drive(False)))
+    log_benchmark_result(f"Turn latency [{budget}s deadline, upstream {upstream_latency}s]", asyncio.run(drive(True)))
+
+def benchmark_websocket_fanout(sockets=(10000, 20000), write_latency=0.001):
+    """Broadcast throughput from one worker to many sockets, one at a time vs batched concurrent sends"""
+    from connection_manager import ConnectionManager
+    from serialization import encode_frame
+
+    class FakeWebSocket:
+        """Accepted socket whose writes take ``latency`` (a slow client or a full send buffer)"""
+
+        def __init__(self, latency):
+            self.latency = latency
+            self.frames = 0
+
+        async def send_text(self, frame):
+            if self.latency:
+                await asyncio.sleep(self.latency)
+            self.frames += 1
+
+        send_bytes = send_text
+
+    message = {"type": "message", "bot_name": "Maya", "content": "Good morning everyone! ☀️", "timestamp": "now"}
+
+    async def drive(count, latency, batch_size):
+        manager = ConnectionManager(fanout_batch_size=batch_size or 1)
+        for i in range(count):
+            manager.register(FakeWebSocket(latency), "bench-user", f"session-{i % 100}")
+        connections = list(manager.connections_for_user("bench-user"))
+
+        started = time.perf_counter()
+        if batch_size:
+            delivered = await manager.fanout(connections, message)
+        else:
+            # What a per-socket loop costs: encode and await every send in turn
+            for connection in connections:
+                await connection.websocket.send_text(encode_frame(message, connection.protocol))
+            delivered = len(connections)
+        elapsed = time.perf_counter() - started
+        return {
+            "delivered": delivered,
+            "seconds": round(elapsed, 3),
+            "frames_per_sec": round(delivered / elapsed),
+        }
+
+    for count in sockets:
+        for latency in (0.0, write_latency):
+            # The sequential loop against slow sockets takes count x latency; skip it past 10k
+            modes = [0, 100, 500, 2000] if latency == 0.0 or count <= 10000 else [100, 500, 2000]
+            for batch_size in modes:
+                label = f"batch {batch_size}" if batch_size else "sequential"
+                log_benchmark_result(
+                    f"WebSocket fan-out [{count} sockets, {latency * 1000:g}ms writes, {label}]",
+                    asyncio.run(drive(count, latency, batch_size))
+                )
+
+def benchmark_connection_reaper(sockets=20000, dead_fraction=0.5):
+    """Cost of one heartbeat pass over many sockets, and what evicting the dead ones reclaims"""
+    import gc
+    import tracemalloc
+    from connection_manager import ConnectionManager, Inbox
+
+    class FakeWebSocket:
+        async def send_text(self, frame):
+            pass
+
+        send_bytes = send_text
+
+        async def close(self, code=1000):
+            pass
+
+    async def drive(traced):
+        manager = ConnectionManager(heartbeat_interval=0.0, pong_timeout=0.0, idle_timeout=0.0)
+        if traced:
+            tracemalloc.start()
+        for i in range(sockets):
+            websocket = FakeWebSocket()
+            # Per-connection turn state the handler would hold (a queued frame), freed with the socket
+            websocket.inbox = Inbox()
+            websocket.inbox.put_nowait({"content": "still typing..."})
+            manager.register(websocket, f"user-{i}", f"session-{i}")
+        before = tracemalloc.get_traced_memory()[0] if traced else 0
+
+        # First pass pings everybody; then the dead fraction stays silent past the pong timeout
+        first = await manager.reap()
+        for index, connections in enumerate(list(manager.session_connections.values())):
+            if index >= sockets * dead_fraction:
+                for connection in connections:
+                    connection.ping_sent_at = None
+        second = await manager.reap()
+
+        if not traced:
+            return {
+                "ping_pass_ms": first["duration_ms"],
+                "reap_pass_ms": second["duration_ms"],
+                "reaped": manager.stats["reaped_dead"],
+                "remaining": manager.get_stats()["active_connections"],
+            }
+        gc.collect()
+        after = tracemalloc.get_traced_memory()[0]
+        tracemalloc.stop()
+        return {
+            "reclaimed_kb": round((before - after) / 1024, 1),
+            "reclaimed_bytes_per_connection": round((before - after) / max(1, manager.stats["reaped_dead"])),
+        }
+
+    label = f"{sockets} sockets, {dead_fraction:.0%} dead"
+    log_benchmark_result(f"Connection reaper [{label}, timing]", asyncio.run(drive(False)))
+    log_benchmark_result(f"Connection reaper [{label}, memory]", asyncio.run(drive(True)))
+
+def benchmark_transcript_replay(sessions=300, speedup=120.0):
+    """Synthetic chat traffic replayed through the AI pipeline under different routing settings"""
+    from transcript_replay import TranscriptReplayer, synthetic_transcripts
+
+    bot_profiles = {profile["bot_id"]: profile for profile in load_bot_profiles()}
+    transcripts = synthetic_transcripts(list(bot_profiles), sessions=sessions)
+
+    def replay(label, configure):
+        # Per-minute quotas tick as fast as the replayed traffic
+        manager = make_mock_service_manager("huggingface", quota_window_seconds=60.0 / speedup)
+        configure(manager)
+        replayer = TranscriptReplayer(manager, bot_profiles, concurrency=sessions, speedup=speedup)
+        log_benchmark_result(f"Transcript replay [{sessions} sessions, x{speedup:g}, {label}]",
+                             asyncio.run(replayer.run(transcripts)))
+
+    replay("baseline", lambda manager: None)
+    replay("micro-batching", lambda manager: manager.enable_micro_batching())
+    replay("micro-batching + coalescing", lambda manager: (
+        manager.enable_micro_batching(), setattr(manager, "coalescing_enabled", True)
+    ))
+
+# Child process for benchmark_connection_memory: the chat WebSocket path (connection manager,
+# reader task, inbox, in-flight turn) served by uvicorn, without a database behind it
+CONNECTION_MEMORY_SERVER = """
+import asyncio, gc, sys, tracemalloc
+port, deflate, turn_seconds, traced = int(sys.argv[1]), sys.argv[2] == "deflate", float(sys.argv[3]), sys.argv[4] == "traced"
+if traced:
+    tracemalloc.start()
+import uvicorn
+from fastapi import FastAPI, WebSocket
+from connection_manager import ConnectionManager, Inbox, current_rss_bytes
+
+app = FastAPI()
+manager = ConnectionManager(heartbeat_interval=0.0)
+
+@app.websocket("/ws/{session_id}/{user_id}")
+async def chat(websocket: WebSocket, session_id: str, user_id: str):
+    connection = await manager.connect(websocket, user_id, session_id)
+    inbox = Inbox(maxsize=16)
+    reader = manager.start_reader(connection, inbox)
+    try:
+        while True:
+            frame = await inbox.get()
+            if frame is None:
+                return
+            turn = asyncio.create_task(asyncio.sleep(turn_seconds))
+            await asyncio.wait({turn, reader}, return_when=asyncio.FIRST_COMPLETED)
+            if not turn.done():
+                turn.cancel()
+                return
+            await manager.send(connection, {"type": "message", "content": frame.get("content", "")})
+    finally:
+        reader.cancel()
+        manager.disconnect(connection)
+
+@app.get("/memory")
+async def memory():
+    gc.collect()
+    return {"rss_bytes": current_rss_bytes(), "traced_bytes": tracemalloc.get_traced_memory()[0],
+            "connections": manager.get_stats()["active_connections"]}
+
+uvicorn.run(app, host="127.0.0.1", port=port, log_level="error", ws="websockets",
+            ws_per_message_deflate=deflate, ws_ping_interval=None)
+"""
+
+def benchmark_connection_memory(connections=2000, port=8765):
+    """Server-side memory per idle and per active WebSocket (RSS and tracemalloc), and connections per GB"""
+    import json
+    import subprocess
+    import urllib.request
+    import websockets
+
+    backend_dir = os.path.join(os.path.dirname(os.path.abspath(__file__)), "backend")
+
+    def server_memory():
+        with urllib.request.urlopen(f"http://127.0.0.1:{port}/memory") as response:
+            return json.loads(response.read())
+
+    async def open_sockets(count, offset, compression):
+        return await asyncio.gather(*[
+            websockets.connect(f"ws://127.0.0.1:{port}/ws/session-{offset + i}/user-{offset + i}",
+                               compression=compression, ping_interval=None)
+            for i in range(count)
+        ])
+
+    async def measure(compression, key):
+        """Per-connection growth of ``key`` with idle sockets, then with a turn in flight on each"""
+        baseline = server_memory()
+
+        idle = await open_sockets(connections, 0, compression)
+        await asyncio.sleep(0.5)
+        with_idle = server_memory()
+
+        # Active sockets each have a turn in flight: a queued frame, a turn task and a reply pending
+        active = await open_sockets(connections, connections, compression)
+        await asyncio.gather(*[socket.send(json.dumps({"content": "Tell me about your day!"})) for socket in active])
+        await asyncio.sleep(0.5)
+        with_active = server_memory()
+
+        await asyncio.gather(*[socket.close() for socket in idle + active])
+        return (
+            round((with_idle[key] - baseline[key]) / connections),
+            round((with_active[key] - with_idle[key]) / connections),
+            with_active["connections"],
+        )
+
+    def run_server(deflate, traced, compression, key):
+        # tracemalloc inflates RSS, so the two figures come from separate server processes
+        server = subprocess.Popen(
+            [sys.executable, "-c", CONNECTION_MEMORY_SERVER, str(port),
+             "deflate" if deflate else "plain", "60", "traced" if traced else "untraced"],
+            cwd=backend_dir
+        )
+        try:
+            for _ in range(100):
+                try:
+                    server_memory()
+                    break
+                except OSError:
+                    time.sleep(0.1)
+            return asyncio.run(measure(compression, key))
+        finally:
+            server.terminate()
+            server.wait()
+
+    for deflate in (False, True):
+        compression = "deflate" if deflate else None
+        idle_rss, active_rss, opened = run_server(deflate, False, compression, "rss_bytes")
+        idle_traced, active_traced, _ = run_server(deflate, True, compression, "traced_bytes")
+        label = "permessage-deflate" if deflate else "no compression"
+        log_benchmark_result(f"Connection memory [{connections} idle + {connections} active, {label}]", {
+            "open": opened,
+            "idle_rss_bytes": idle_rss,
+            "idle_traced_bytes": idle_traced,
+            "active_rss_bytes": active_rss,
+            "active_traced_bytes": active_traced,
+            "idle_connections_per_gb": round(2 ** 30 / idle_rss) if idle_rss > 0 else None,
+            "active_connections_per_gb": round(2 ** 30 / active_rss) if active_rss > 0 else None,
+        })
+
+def benchmark_read_routing(sessions=200, clients=20, turns_per_client=50, replication_lag=0.02):
+    """Where history reads land, and read-your-writes after a turn, on a lagging replica-set stand-in"""
+    from data_access import DataAccess
+    from mock_replica_set import MockReplicaSet
+    from session_lifecycle import load_session_messages
+    from transcript_replay import percentile
+
+    async def run(history_preference, causal):
+        replica_set = MockReplicaSet(secondaries=2, replication_lag=replication_lag)
+        data_access = DataAccess(replica_set, "chatapp", read_preferences={"history": history_preference},
+                                 causal_consistency=causal)
+        db = data_access.writer
+        for index in range(sessions):
+            await db.chat_sessions.insert_one({"session_id": f"session-{index}", "messages": [], "message_count": 0})
+        await replica_set.wait_until_replicated()
+        before = dict(replica_set.stats)
+
+        latencies, stale = [], 0
+
+        async def turn_then_read(client, turn):
+            nonlocal stale
+            session_id = f"session-{(client * turns_per_client + turn) % sessions}"
+            index = f"{client}-{turn}"
+            async with data_access.causal_write(session_id) as session:
+                await db.chat_sessions.update_one(
+                    {"session_id": session_id},
+                    {"$push": {"messages": {"user_message": f"turn {index}"}}, "$inc": {"message_count": 1}},
+                    session=session
+                )
+            # The client reloads its history straight after the answer arrives
+            started = time.perf_counter()
+            async with data_access.causal_read(session_id) as session:
+                history = data_access.reader("history")
+                messages = await load_session_messages(history.chat_sessions, history.chat_archives, session_id,
+                                                       session=session)
+            latencies.append(time.perf_counter() - started)
+            if not any(message["user_message"] == f"turn {index}" for message in messages):
+                stale += 1
+
+        async def chat(client):
+            for turn in range(turns_per_client):
+                await turn_then_read(client, turn)
+
+        await asyncio.gather(*[chat(client) for client in range(clients)])
+        await replica_set.wait_until_replicated()
+        replica_set.close()
+
+        reads = (replica_set.stats["primary_reads"] - before["primary_reads"]
+                 + replica_set.stats["secondary_reads"] - before["secondary_reads"])
+        latencies.sort()
+        return {
+            "history_reads": len(latencies),
+            "primary_read_share": round((replica_set.stats["primary_reads"] - before["primary_reads"]) / reads, 3),
+            "stale_history_reads": stale,
+            "causal_waits": replica_set.stats["causal_waits"] - before["causal_waits"],
+            "read_p50_ms": round(percentile(latencies, 0.50) * 1000, 2),
+            "read_p99_ms": round(percentile(latencies, 0.99) * 1000, 2),
+        }
+
+    for label, preference, causal in (("all reads on primary", "primary", False),
+                                      ("secondaryPreferred, no causal reads", "secondaryPreferred", False),
+                                      ("secondaryPreferred, causal reads", "secondaryPreferred", True)):
+        log_benchmark_result(f"Read routing [{label}, {replication_lag * 1000:g}ms replication lag]",
+                             asyncio.run(run(preference, causal)))
+
+def benchmark_storage_backends(turns=5000, concurrency=100):
+    """The shared storage workload against each backend, and SQLite with and without batched commits"""
+    import tempfile
+    from data_access import DataAccess
+    from mock_replica_set import MockReplicaSet
+    from sqlite_storage import SQLiteStorage
+    from storage import MemoryStorage, MotorStorage
+    from storage_conformance import run_storage_workload
+
+    async def run(make_storage):
+        storage = make_storage()
+        try:
+            report = await run_storage_workload(storage, turns=turns, concurrency=concurrency)
+            stats = storage.get_stats()
+            if "writes_per_commit" in stats:
+                report["writes_per_commit"] = stats["writes_per_commit"]
+            return report
+        finally:
+            await storage.close()
+
+    def motor_on_stand_in():
+        # mongomock behind the stand-in: shows the interface overhead, not MongoDB's own speed
+        replica_set = MockReplicaSet(secondaries=2, replication_lag=0.005)
+        return MotorStorage(DataAccess(replica_set, "chatapp", read_preferences={"history": "secondaryPreferred"}))
+
+    with tempfile.TemporaryDirectory() as directory:
+        backends = (
+            ("memory", MemoryStorage),
+            ("sqlite, batched commits", lambda: SQLiteStorage(os.path.join(directory, "batched.sqlite3"))),
+            ("sqlite, commit per write", lambda: SQLiteStorage(os.path.join(directory, "single.sqlite3"),
+                                                               commit_batch_size=1, commit_wait_ms=0)),
+            ("mongodb (mongomock replica-set stand-in)", motor_on_stand_in),
+        )
+        for label, make_storage in backends:
+            log_benchmark_result(f"Storage [{label}, {turns} turns, {concurrency} clients]",
+                                 asyncio.run(run(make_storage)))
+
+def benchmark_adaptive_limits(clients=40, windows=30, window_seconds=1.0, think_seconds=0.1, port=8767):
+    """
+    Upstream throughput, 429s and timeouts with static per-key limits vs AIMD-learned ones,
+    against a local provider whose real quota and capacity differ from the static guess.
+    Time is compressed: one second stands for the providers' one-minute quota window.
+    """
+    import tempfile
+    from datetime import timedelta
+    from aiohttp import web
+    from adaptive_limits import AdaptiveLimiter
+    from api_protection import APIProtectionManager
+    from deadlines import Deadline
+
+    async def drive(quota, capacity, adaptive, state_path=None):
+        accepted = []
+        upstream = {"rate_limited": 0}
+        # The provider serves ``capacity`` requests at once; the rest queue and slow everyone down
+        serving = asyncio.Semaphore(capacity)
+
+        async def generate(request):
+            now = time.monotonic()
+            accepted[:] = [t for t in accepted if now - t < window_seconds]
+            if len(accepted) >= quota:
+                upstream["rate_limited"] += 1
+                retry_after = accepted[0] + window_seconds - now
+                return web.json_response({"error": "quota exceeded"}, status=429,
+                                         headers={"Retry-After": f"{retry_after:.3f}"})
+            accepted.append(now)
+            async with serving:
+                await asyncio.sleep(0.05)
+            return web.json_response({"choices": [{"message": {"content": "ok"}}]})
+
+        app = web.Application()
+        app.router.add_post("/v1/chat", generate)
+        runner = web.AppRunner(app, access_log=None)
+        await runner.setup()
+        await web.TCPSite(runner, "127.0.0.1", port).start()
+
+        manager = APIProtectionManager()
+        manager.adaptive_limits = AdaptiveLimiter(enabled=adaptive, state_path=state_path)
+        manager.adaptive_limits.load()
+        # Windows, pacing, back-off and attempt timeouts scaled to the compressed minute
+        manager.rate_window = timedelta(seconds=window_seconds)
+        manager.base_delay = window_seconds / 60
+        manager.total_timeout = 0.3 * window_seconds
+        manager.api_limits["openai"]["delay_between_calls"] = 0.0
+        # Only the per-minute quota is under test
+        manager.api_limits["openai"]["calls_per_hour"] = 10 ** 6
+
+        async def no_pacing(api_type):
+            return 0.0
+        manager.get_recommended_delay = no_pacing
+
+        outcomes = {"answered": 0, "failed": 0}
+        latencies = []
+        stop_at = time.monotonic() + windows * window_seconds
+
+        async def client():
+            while time.monotonic() < stop_at:
+                started = time.perf_counter()
+                result = await manager.make_protected_request(
+                    "POST", f"http://127.0.0.1:{port}/v1/chat", "openai", "bench-key-1",
+                    deadline=Deadline.after(2 * window_seconds), json={}
+                )
+                if result is None:
+                    outcomes["failed"] += 1
+                else:
+                    outcomes["answered"] += 1
+                    latencies.append(time.perf_counter() - started)
+                # The user reads the reply before sending the next message
+                await asyncio.sleep(think_seconds)
+
+        try:
+            await asyncio.gather(*[client() for _ in range(clients)])
+        finally:
+            await runner.cleanup()
+        manager.adaptive_limits.save()
+
+        latencies.sort()
+        report = {
+            "answered_per_window": round(outcomes["answered"] / windows, 1),
+            "failed_calls": outcomes["failed"],
+            "upstream_429s": upstream["rate_limited"],
+            "attempt_timeouts": manager.stats["timeouts"],
+            "p50_ms": round(latencies[len(latencies) // 2] * 1000, 1) if latencies else None,
+        }
+        if adaptive:
+            limits = manager.adaptive_limits.get_stats()["limits"]["openai_bench-ke"]
+            report["learned_calls_per_window"] = limits["calls_per_minute"]
+            report["learned_concurrency"] = limits["concurrency_limit"]
+        return report
+
+    # The static guess for openai is 40 calls per window, with no concurrency limit
+    scenarios = (("provider stricter than the guess", 25, 3), ("provider looser than the guess", 120, 12))
+    with tempfile.TemporaryDirectory() as directory:
+        for label, quota, capacity in scenarios:
+            state_path = os.path.join(directory, f"{quota}.json")
+            name = f"[{label}: {quota}/window, serves {capacity} at once]"
+            log_benchmark_result(f"Upstream limits, static {name}", asyncio.run(drive(quota, capacity, False)))
+            log_benchmark_result(f"Upstream limits, AIMD {name}", asyncio.run(drive(quota, capacity, True, state_path)))
+            log_benchmark_result(f"Upstream limits, AIMD restored after restart {name}",
+                                 asyncio.run(drive(quota, capacity, True, state_path)))
+
+SMALL_TALK_INTENTS = [
+    ["what do you do", "what is your job", "what do you do for a living"],
+    ["where are you from", "where did you grow up"],
+    ["where do you live", "which city do you live in"],
+    ["what is your favorite movie", "what movie do you like best"],
+    ["what is your favorite book", "what are you reading right now"],
+    ["what kind of music do you like", "who is your favorite band"],
+    ["what do you do for fun", "what are your hobbies"],
+    ["how are you", "how is your day going"],
+    ["how old are you", "what is your age"],
+    ["do you have any pets", "do you have a dog"],
+    ["have you been to paris", "have you ever visited france"],
+    ["what is your favorite food", "what do you like to eat"],
+    ["do you like sports", "do you watch football"],
+    ["what did you do this weekend", "any plans for the weekend"],
+    ["do you have siblings", "do you have brothers or sisters"],
+    ["what languages do you speak", "do you speak spanish"],
+    ["tell me about yourself", "tell me something about you"],
+    ["what is your dream job", "what would you do if money was no object"],
+    ["are you a morning person", "do you wake up early"],
+    ["what is the best trip you have taken", "where was your favorite vacation"],
+]
+
+def paraphrase(rng, text):
+    """A user-typed variant: shorthand, case, fillers and punctuation"""
+    words = text.split()
+    shorthand = {"you": "u", "your": "ur", "are": "r", "favorite": "fav", "what": "wat"}
+    words = [shorthand[word] if word in shorthand and rng.random() < 0.4 else word for word in words]
+    sentence = " ".join(words)
+    if sentence.startswith("what is") and rng.random() < 0.5:
+        sentence = "whats" + sentence[len("what is"):]
+    sentence = rng.choice(["", "", "hey ", "so ", "hi! ", "ok "]) + sentence
+    sentence += rng.choice(["", "?", "??", "?!", " :)"])
+    return sentence.capitalize() if rng.random() < 0.5 else sentence
+
+def benchmark_semantic_cache(messages=20000, personas=20, long_tail=0.5,
+                             thresholds=(0.8, 0.85, 0.9, 0.95), max_entries=20000):
+    """
+    Hit rate, wrong-intent hits and lookup cost of the per-persona near-duplicate reply cache
+    on chat-shaped traffic: common small-talk questions typed many ways, plus one-off messages
+    """
+    import random
+    from request_coalescer import RequestCoalescer
+    from semantic_cache import SemanticCache
+
+    rng = random.Random(5)
+    topics = ["my sister", "the train", "work", "this song", "my exam", "the weather", "dinner", "my cat",
+              "a podcast", "the gym", "my boss", "a museum", "the beach", "coffee", "my garden", "a concert"]
+    vocabulary = sorted({word for phrases in SMALL_TALK_INTENTS for phrase in phrases for word in phrase.split()}
+                        | {word for topic in topics for word in topic.split()}
+                        | set("yesterday today honestly really pretty tired excited late early new old "
+                              "bought lost found cooked watched missed called visited finished started".split()))
+    traffic = []
+    for index in range(messages):
+        persona = f"bench_bot_{rng.randrange(personas)}"
+        if rng.random() < long_tail:
+            # One-off messages: any hit on them is a wrong answer
+            text = " ".join(rng.choice(vocabulary) for _ in range(rng.randint(4, 12)))
+            traffic.append((persona, text, f"one-off {index}"))
+        else:
+            intent = rng.randrange(len(SMALL_TALK_INTENTS))
+            traffic.append((persona, paraphrase(rng, rng.choice(SMALL_TALK_INTENTS[intent])), intent))
+
+    # Baseline: exact match on the normalised message, as request coalescing keys it
+    exact = {}
+    exact_hits = 0
+    for persona, text, intent in traffic:
+        key = (persona, RequestCoalescer.normalize_prompt(text))
+        if key in exact:
+            exact_hits += 1
+        else:
+            exact[key] = intent
+    log_benchmark_result(f"Exact-match cache [{messages} messages, {personas} personas]", {
+        "hit_rate": round(exact_hits / messages, 4),
+        "entries": len(exact),
+    })
+
+    for threshold in thresholds:
+        cache = SemanticCache(enabled=True, threshold=threshold, max_entries=max_entries)
+        wrong, lookup_times = 0, []
+        for persona, text, intent in traffic:
+            started = time.perf_counter()
+            reply = cache.lookup(persona, text)
+            lookup_times.append(time.perf_counter() - started)
+            if reply is None:
+                cache.store(persona, text, f"{intent}|{text}")
+            elif reply.split("|")[0] != str(intent):
+                wrong += 1
+        stats = cache.get_stats()
+        lookup_times.sort()
+        log_benchmark_result(f"Semantic cache [threshold {threshold}, {messages} messages, {personas} personas]", {
+            "hit_rate": stats["hit_rate"],
+            "wrong_intent_hits": wrong,
+            "upstream_calls_saved": stats["hits"] - wrong,
+            "lookup_p50_us": round(lookup_times[len(lookup_times) // 2] * 1e6, 1),
+            "lookup_p99_us": round(lookup_times[int(len(lookup_times) * 0.99)] * 1e6, 1),
+            "hit_similarity_p50": (stats["hit_similarity"] or {}).get("p50"),
+            "miss_similarity_p90": (stats["miss_similarity"] or {}).get("p90"),
+            "entries": stats["entries"],
+            "memory_mb": round(stats["memory_bytes"] / 1e6, 1),
+        })
+
+    # Cost of the exact scan as one persona's shard fills up, and LRU eviction holding the bound
+    for entries in (1000, 10000):
+        cache = SemanticCache(enabled=True, max_entries=entries // 2)
+        for index in range(entries):
+            cache.store("bench_bot_0", " ".join(rng.choice(vocabulary) for _ in range(8)), "reply")
+        lookup_times = []
+        for index in range(500):
+            started = time.perf_counter()
+            cache.lookup("bench_bot_0", " ".join(rng.choice(vocabulary) for _ in range(8)))
+            lookup_times.append(time.perf_counter() - started)
+        lookup_times.sort()
+        stats = cache.get_stats()
+        log_benchmark_result(f"Semantic cache shard [{entries} stores, max_entries {entries // 2}]", {
+            "entries": stats["entries"],
+            "evictions": stats["evictions"],
+            "lookup_p50_us": round(lookup_times[len(lookup_times) // 2] * 1e6, 1),
+            "memory_mb": round(stats["memory_bytes"] / 1e6, 2),
+        })
+
+CHAT_TRANSPORT_SERVER = """
+import asyncio, sys
+from datetime import datetime
+import uvicorn
+from fastapi import FastAPI, WebSocket
+from fastapi.responses import StreamingResponse
+from pydantic import BaseModel
+from connection_manager import ConnectionManager, Inbox
+from event_stream import stream_turn_events, SSE_HEADERS
+port, turn_seconds = int(sys.argv[1]), float(sys.argv[2])
+
+app = FastAPI()
+manager = ConnectionManager(heartbeat_interval=0.0)
+
+async def run_turn(content):
+    await asyncio.sleep(turn_seconds)
+    return {"type": "message", "bot_name": "Bench", "content": content, "timestamp": datetime.now().isoformat()}
+
+class ChatMessage(BaseModel):
+    content: str
+    session_id: str
+
+@app.websocket("/ws/{session_id}/{user_id}")
+async def chat(websocket: WebSocket, session_id: str, user_id: str):
+    connection = await manager.connect(websocket, user_id, session_id)
+    inbox = Inbox(maxsize=16)
+    reader = manager.start_reader(connection, inbox)
+    try:
+        while True:
+            frame = await inbox.get()
+            if frame is None:
+                return
+            turn = asyncio.create_task(run_turn(frame.get("content", "")))
+            await asyncio.wait({turn, reader}, return_when=asyncio.FIRST_COMPLETED)
+            if not turn.done():
+                turn.cancel()
+                return
+            await manager.send_personal_message(turn.result(), session_id)
+    finally:
+        reader.cancel()
+        manager.disconnect(connection)
+
+@app.post("/api/chat/stream")
+async def chat_stream(message: ChatMessage, user_id: str):
+    turn = asyncio.create_task(run_turn(message.content))
+    return StreamingResponse(stream_turn_events(turn), media_type="text/event-stream", headers=SSE_HEADERS)
+
+@app.get("/ready")
+async def ready():
+    return {}
+
+uvicorn.run(app, host="127.0.0.1", port=port, log_level="error", ws="websockets",
+            ws_per_message_deflate=False, ws_ping_interval=None, timeout_keep_alive=75)
+"""
+
+def benchmark_chat_transports(clients=50, turns_per_client=40, turn_seconds=0.02, port=8766):
+    """Turn latency over the WebSocket vs. /api/chat/stream (SSE) with and without connection reuse"""
+    import json
+    import subprocess
+    import urllib.request
+    import aiohttp
+    import websockets
+    from transcript_replay import percentile
+
+    backend_dir = os.path.join(os.path.dirname(os.path.abspath(__file__)), "backend")
+    base_url = f"http://127.0.0.1:{port}"
+
+    async def websocket_client(index, latencies):
+        async with websockets.connect(f"ws://127.0.0.1:{port}/ws/session-{index}/user-{index}",
+                                      compression=None, ping_interval=None) as websocket:
+            for turn in range(turns_per_client):
+                started = time.perf_counter()
+                await websocket.send(json.dumps({"content": f"turn {turn}"}))
+                await websocket.recv()
+                latencies.append(time.perf_counter() - started)
+
+    async def sse_client(index, latencies, session):
+        for turn in range(turns_per_client):
+            started = time.perf_counter()
+            async with session.post(f"{base_url}/api/chat/stream?user_id=user-{index}",
+                                    json={"content": f"turn {turn}", "session_id": f"session-{index}"}) as response:
+                async for line in response.content:
+                    if line.startswith(b"data: "):
+                        latencies.append(time.perf_counter() - started)
+                await response.read()
+
+    async def run_websockets():
+        latencies = []
+        await asyncio.gather(*[websocket_client(i, latencies) for i in range(clients)])
+        return latencies, clients
+
+    async def run_sse(reuse):
+        latencies = []
+        connections = []
+
+        async def count_connection(session, context, params):
+            connections.append(1)
+
+        trace = aiohttp.TraceConfig()
+        trace.on_connection_create_end.append(count_connection)
+        # A pooled keep-alive connector against one that opens a fresh connection per request
+        connector = aiohttp.TCPConnector(limit=clients, force_close=not reuse)
+        async with aiohttp.ClientSession(connector=connector, trace_configs=[trace]) as session:
+            await asyncio.gather(*[sse_client(i, latencies, session) for i in range(clients)])
+        return latencies, len(connections)
+
+    server = subprocess.Popen([sys.executable, "-c", CHAT_TRANSPORT_SERVER, str(port), str(turn_seconds)],
+                              cwd=backend_dir)
+    try:
+        for _ in range(100):
+            try:
+                urllib.request.urlopen(f"{base_url}/ready").close()
+                break
+            except OSError:
+                time.sleep(0.1)
+
+        results = {}
+        for label, run in (("WebSocket", run_websockets),
+                           ("SSE, keep-alive", lambda: run_sse(True)),
+                           ("SSE, new connection per turn", lambda: run_sse(False))):
+            started = time.perf_counter()
+            latencies, connections = asyncio.run(run())
+            wall_seconds = time.perf_counter() - started
+            latencies.sort()
+            results[label] = latencies
+            log_benchmark_result(f"Chat transport [{label}, {clients} clients x {turns_per_client} turns]", {
+                "turns": len(latencies),
+                "connections_opened": connections,
+                "turns_per_sec": round(len(latencies) / wall_seconds, 1),
+                "p50_ms": round(percentile(latencies, 0.50) * 1000, 2),
+                "p99_ms": round(percentile(latencies, 0.99) * 1000, 2),
+                # Latency on top of the simulated turn itself
+                "p50_overhead_ms": round((percentile(latencies, 0.50) - turn_seconds) * 1000, 2),
+            })
+
+        websocket_p50 = percentile(results["WebSocket"], 0.50)
+        log_benchmark_result("Chat transport parity (SSE keep-alive p50 / WebSocket p50)", {
+            "ratio": round(percentile(results["SSE, keep-alive"], 0.50) / websocket_p50, 3) if websocket_p50 else None,
+        })
+    finally:
+        server.terminate()
+        server.wait()
+
+BENCHMARKS = {
+    "micro_batching": benchmark_micro_batching,
+    "offline_responder": benchmark_offline_responder,
+    "serialization": benchmark_serialization,
+    "wire_compression": benchmark_wire_compression,
+    "persona_matching": benchmark_persona_matching,
+    "persona_catalog_memory": benchmark_persona_catalog_memory,
+    "export_streaming": benchmark_export_streaming,
+    "session_archiving": benchmark_session_archiving,
+    "turn_deadlines": benchmark_turn_deadlines,
+    "websocket_fanout": benchmark_websocket_fanout,
+    "connection_reaper": benchmark_connection_reaper,
+    "connection_memory": benchmark_connection_memory,
+    "transcript_replay": benchmark_transcript_replay,
+    "chat_transports": benchmark_chat_transports,
+    "read_routing": benchmark_read_routing,
+    "storage_backends": benchmark_storage_backends,
+    "adaptive_limits": benchmark_adaptive_limits,
+    "semantic_cache": benchmark_semantic_cache,
+}
+
+def run_all_benchmarks(selected=None):
+    """Run the selected benchmarks (all by default)"""
+    print("\n===== STARTING BACKEND BENCHMARKS =====\n")
+
+    for name, benchmark in BENCHMARKS.items():
+        if selected and name not in selected:
+            continue
+        print(f"\n----- {name} -----\n")
+        benchmark()
+
+    print("\n===== BENCHMARKS COMPLETE =====\n")
+    return benchmark_results
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Run backend performance benchmarks")
+    parser.add_argument("benchmarks", nargs="*", metavar="benchmark",
+                        help=f"Benchmarks to run (default: all): {', '.join(BENCHMARKS)}")
+    args = parser.parse_args()
+    unknown = [name for name in args.benchmarks if name not in BENCHMARKS]
+    if unknown:
+        parser.error(f"unknown benchmark(s): {', '.join(unknown)}")
+    run_all_benchmarks(args.benchmarks)
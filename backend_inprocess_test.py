@@ -0,0 +1,315 @@
+#!/usr/bin/env python3
+import json
+import os
+import subprocess
+import sys
+
+from backend_test import log_test_result, test_results
+
+BACKEND_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "backend")
+
+# The server on its mock provider and in-memory storage, with no learned limits carried over
+MOCK_SERVER_ENV = {"AI_MOCK_PROVIDER": "true", "STORAGE_BACKEND": "memory", "ADAPTIVE_LIMITS_PATH": ""}
+
+def run_check(name, env=None, timeout=60):
+    """Run a check from backend/inprocess_checks.py in a fresh interpreter and return its report"""
+    code = f"import asyncio, json, inprocess_checks; print(json.dumps(asyncio.run(inprocess_checks.{name}())))"
+    result = subprocess.run(
+        [sys.executable, "-c", code],
+        cwd=BACKEND_DIR, env={**os.environ, **(env or {})}, capture_output=True, text=True, timeout=timeout
+    )
+    if result.returncode != 0:
+        raise RuntimeError(f"{name} check failed: {result.stderr[-500:]}")
+    return json.loads(result.stdout.strip().splitlines()[-1])
+
+def test_admission_control():
+    """Standard turns stay out of the premium reserve, spent quotas shed both tiers until the window refills, fallbacks don't skew the wait estimate"""
+    try:
+        report = run_check("admission_control")
+        estimates = report["estimates"]
+        if report["reserve"] != {"standard": False, "premium": True}:
+            log_test_result("Admission Control", False, f"Premium reserve not honoured: {report['reserve']}")
+        elif report["exhausted"] != {"standard": False, "premium": False} or report["shed_reply"] != "offline":
+            log_test_result("Admission Control", False, f"Turns admitted past their SLO: {report}")
+        elif report["refilling"] != {"standard": True, "premium": True}:
+            log_test_result("Admission Control", False, f"Turns shed while the window refills: {report['refilling']}")
+        elif report["unconfigured_reply"] != "offline" or report["unconfigured_counted"]:
+            log_test_result("Admission Control", False, f"Turn without a provider counted as shed: {report}")
+        elif not estimates[1] < estimates[0]:
+            log_test_result("Admission Control", False, f"Provider answer did not update the estimate: {estimates}")
+        elif not report["fallback_is_offline"] or estimates[3] != estimates[1] or estimates[2] != estimates[1]:
+            log_test_result("Admission Control", False, f"Fallback or cancelled turns moved the estimate: {estimates}")
+        elif report["in_flight"] != 0:
+            log_test_result("Admission Control", False, f"In-flight count leaked: {report['in_flight']}")
+        else:
+            log_test_result("Admission Control", True,
+                           f"shed {report['stats']['shed_total']} turns, estimate {estimates[0]}s -> "
+                           f"{round(estimates[1], 3)}s, unchanged by fallback and cancelled turns")
+        return report
+    except Exception as e:
+        log_test_result("Admission Control", False, f"Exception occurred: {str(e)}")
+
+    return None
+
+def test_cold_start_budget():
+    """Fail when importing the server or getting it ready regresses past its budget"""
+    try:
+        metrics = run_check("cold_start")
+        message = (f"import {metrics['import_seconds']}s (budget {metrics['import_budget_seconds']}s), "
+                   f"ready {metrics['time_to_ready_seconds']}s (budget {metrics['time_to_ready_budget_seconds']}s)")
+
+        log_test_result("Cold Start Budget", metrics["within_budget"], message)
+        return metrics
+    except Exception as e:
+        log_test_result("Cold Start Budget", False, f"Exception occurred: {str(e)}")
+
+    return None
+
+def test_turn_pipeline():
+    """Moderation overlaps generation, and a rejected message cancels its speculative generation"""
+    try:
+        report = run_check("turn_pipeline", env=MOCK_SERVER_ENV)
+        metrics = report["metrics"]
+        if report["reply"] != "message" or report["rejected"] != "moderation_warning":
+            log_test_result("Turn Pipeline", False, f"Unexpected replies: {report}")
+        elif metrics["avg_saved_ms"] < 50:
+            log_test_result("Turn Pipeline", False, f"Stages ran back to back: {metrics}")
+        elif metrics["speculative_cancelled"] != 1 or report["cancelled_calls"] != 1:
+            log_test_result("Turn Pipeline", False, f"Rejected turn's generation was not cancelled: {report}")
+        elif report["stored_messages"] != 1:
+            log_test_result("Turn Pipeline", False, f"Rejected turn was stored: {report['stored_messages']} messages")
+        else:
+            log_test_result("Turn Pipeline", True,
+                           f"{metrics['avg_wall_clock_ms']}ms per turn instead of {metrics['avg_sequential_ms']}ms, "
+                           f"rejected turn's upstream call cancelled")
+        return report
+    except Exception as e:
+        log_test_result("Turn Pipeline", False, f"Exception occurred: {str(e)}")
+
+    return None
+
+def test_user_cache():
+    """Mutes are written through the user cache, and a ban written elsewhere is enforced once the entry expires"""
+    try:
+        report = run_check("user_cache", env=MOCK_SERVER_ENV)
+        if report["flagged"] != "moderation_warning" or "muted" not in report["muted"]:
+            log_test_result("User Cache", False, f"Mute was not enforced on the next turn: {report}")
+        elif report["mute_misses"] != 0:
+            log_test_result("User Cache", False, f"Mute enforcement read the database: {report['stats']}")
+        elif report["banned"] != "banned":
+            log_test_result("User Cache", False, f"Ban was not enforced after the entry expired: {report}")
+        else:
+            log_test_result("User Cache", True,
+                           f"mute enforced from the cache, ban enforced after expiry, hit rate {report['stats']['hit_rate']}")
+        return report
+    except Exception as e:
+        log_test_result("User Cache", False, f"Exception occurred: {str(e)}")
+
+    return None
+
+def test_read_write_routing():
+    """History reads go to a secondary of a lagging replica-set stand-in and still see the turn just written"""
+    try:
+        report = run_check("read_routing", env={"AI_MOCK_PROVIDER": "true"})
+        replica_set = report["replica_set"]
+        if report["messages"] != 1 or report["listed_message_count"] != 1:
+            log_test_result("Read/Write Routing", False, f"History read missed the turn just written: {report}")
+        elif replica_set["secondary_reads"] == 0 or replica_set["causal_waits"] == 0:
+            log_test_result("Read/Write Routing", False, f"History reads were not served by a secondary: {replica_set}")
+        else:
+            log_test_result("Read/Write Routing", True,
+                           f"{replica_set['secondary_reads']} secondary reads, {replica_set['causal_waits']} waited "
+                           f"{replica_set['causal_wait_seconds']}s for replication")
+        return report
+    except Exception as e:
+        log_test_result("Read/Write Routing", False, f"Exception occurred: {str(e)}")
+
+    return None
+
+def test_storage_conformance():
+    """Every storage backend (in-memory, SQLite, MongoDB on the replica-set stand-in) behaves the same"""
+    try:
+        failures = run_check("storage_conformance", timeout=120)
+        for backend, backend_failures in failures.items():
+            if backend_failures:
+                log_test_result(f"Storage Conformance [{backend}]", False, "; ".join(backend_failures))
+            else:
+                log_test_result(f"Storage Conformance [{backend}]", True, "All conformance checks passed")
+        return failures
+    except Exception as e:
+        log_test_result("Storage Conformance", False, f"Exception occurred: {str(e)}")
+
+    return None
+
+def test_adaptive_limits():
+    """Per-key upstream limits grow on success, are cut once per burst of 429s and survive a restart"""
+    try:
+        report = run_check("adaptive_limits")
+        cut = report["cut"]
+        if report["fifth_slot"]:
+            log_test_result("Adaptive Limits", False, "A call got past the concurrency limit")
+        elif report["grown_concurrency"] <= 4 or report["grown"]["calls_per_minute"] <= 40:
+            log_test_result("Adaptive Limits", False, f"Limits did not grow on success: {report['grown']}")
+        elif report["decreases"] != 1 or report["ignored_overloads"] != 2:
+            log_test_result("Adaptive Limits", False, f"A burst of 429s should cut once: {report}")
+        elif cut["calls_per_minute"] >= report["grown"]["calls_per_minute"] or cut["concurrency_limit"] >= 4:
+            log_test_result("Adaptive Limits", False, f"Limits were not cut on 429: {cut}")
+        elif abs(report["restored_calls_per_minute"] - cut["calls_per_minute"]) > 0.1:
+            log_test_result("Adaptive Limits", False, f"Learned limits lost on restart: {report}")
+        elif report["timeout_decreases"] != {"after_deadline": 0, "after_first_byte": 1, "after_connect_deadline": 1,
+                                             "after_connect": 2, "deadline_timeouts": 2}:
+            log_test_result("Adaptive Limits", False,
+                           f"Only the provider's own timeouts should cut limits: {report['timeout_decreases']}")
+        else:
+            log_test_result("Adaptive Limits", True,
+                           f"grew to {report['grown']['calls_per_minute']}/min, cut to {cut['calls_per_minute']}/min "
+                           f"and {cut['concurrency_limit']} concurrent, restored after restart")
+        return report
+    except Exception as e:
+        log_test_result("Adaptive Limits", False, f"Exception occurred: {str(e)}")
+
+    return None
+
+def test_semantic_cache():
+    """A paraphrase of a message the persona already answered reuses the reply without an upstream call"""
+    try:
+        report = run_check("semantic_cache", env={**MOCK_SERVER_ENV, "SEMANTIC_CACHE_ENABLED": "true"})
+        stats = report["stats"]
+        replies = report["replies"]
+        if replies[0] is None or replies[1] != replies[0]:
+            log_test_result("Semantic Cache", False, f"Paraphrase did not reuse the cached reply: {replies}")
+        elif report["upstream_requests"] != 2 or stats["hits"] != 1 or stats["misses"] != 2:
+            log_test_result("Semantic Cache", False,
+                           f"Expected 1 hit and 2 upstream calls, got {report['upstream_requests']} calls: {stats}")
+        elif report["rejected"] != "moderation_warning" or report["rejected_entries"] != 0:
+            log_test_result("Semantic Cache", False, f"Reply to a rejected message was cached: {report}")
+        elif sum(stats["similarity_histogram"].values()) != stats["lookups"]:
+            log_test_result("Semantic Cache", False, f"Similarity histogram does not cover every lookup: {stats}")
+        elif report["bounded_entries"] != 2 or report["survivor"] != "a" or report["evicted"] is not None:
+            log_test_result("Semantic Cache", False, f"LRU eviction did not keep the bound: {report}")
+        else:
+            log_test_result("Semantic Cache", True,
+                           f"hit rate {stats['hit_rate']}, {stats['entries']} entries, "
+                           f"lookup {stats['avg_lookup_ms']}ms")
+        return report
+    except Exception as e:
+        log_test_result("Semantic Cache", False, f"Exception occurred: {str(e)}")
+
+    return None
+
+def test_sse_events():
+    """A turn that fails still ends its event stream with an error event, and only replies are fanned out"""
+    try:
+        report = run_check("sse_events")
+        if not report["failed"].startswith("event: error\n"):
+            log_test_result("SSE Events", False, f"Failed turn did not end with an error event: {report['failed']!r}")
+        elif not report["answered"].startswith("event: message\n") or report["fanned_out"] != ["message"]:
+            log_test_result("SSE Events", False, f"Reply was not streamed and fanned out once: {report}")
+        elif report["keepalives"] == 0:
+            log_test_result("SSE Events", False, "No keep-alive comments while the turn ran")
+        else:
+            log_test_result("SSE Events", True,
+                           f"failed turn ended with an error event after {report['keepalives']} keep-alives")
+        return report
+    except Exception as e:
+        log_test_result("SSE Events", False, f"Exception occurred: {str(e)}")
+
+    return None
+
+def test_session_cursor():
+    """Session listing pages past sessions the summary backfill has not reached yet"""
+    try:
+        report = run_check("session_cursor", env={"AI_MOCK_PROVIDER": "true"})
+        if report["listed"] != report["expected"]:
+            log_test_result("Session Cursor", False,
+                           f"Listed {len(report['listed'])} of {len(report['expected'])} sessions: {report}")
+        else:
+            log_test_result("Session Cursor", True,
+                           f"{len(report['listed'])} sessions over {report['pages']} pages, 3 without an activity time")
+        return report
+    except Exception as e:
+        log_test_result("Session Cursor", False, f"Exception occurred: {str(e)}")
+
+    return None
+
+def test_persona_pictures():
+    """Bot profiles link to their pictures instead of inlining them, and retired personas' pictures stay served"""
+    try:
+        report = run_check("persona_pictures", env=MOCK_SERVER_ENV)
+        if report["inline_pictures"] or not all(report["urls"]):
+            log_test_result("Persona Pictures", False, f"Profiles still inline their pictures: {report}")
+        elif not report["jpeg"] or "immutable" not in report["cache_control"]:
+            log_test_result("Persona Pictures", False, f"Picture not served as a cacheable JPEG: {report}")
+        elif not report["retired_jpeg"] or report["catalog"]["retired_personas"] != 1:
+            log_test_result("Persona Pictures", False, f"Retired persona's picture went away: {report}")
+        elif report["missing_status"] != 404:
+            log_test_result("Persona Pictures", False, f"Unknown picture answered {report['missing_status']}")
+        else:
+            log_test_result("Persona Pictures", True,
+                           f"{report['catalog']['pictures']} pictures served by digest, retired persona's kept")
+        return report
+    except Exception as e:
+        log_test_result("Persona Pictures", False, f"Exception occurred: {str(e)}")
+
+    return None
+
+def run_all_tests():
+    """Run the in-process backend checks in sequence (no live server or network needed)"""
+    print("\n===== STARTING IN-PROCESS BACKEND TESTS =====\n")
+
+    # Test SLO admission control and the premium reserve
+    print("\n----- Testing Admission Control -----\n")
+    test_admission_control()
+
+    # Test cold start budget
+    print("\n----- Testing Cold Start -----\n")
+    test_cold_start_budget()
+
+    # Test the concurrent chat turn stages
+    print("\n----- Testing Turn Pipeline -----\n")
+    test_turn_pipeline()
+
+    # Test the user cache's write-through moderation state
+    print("\n----- Testing User Cache -----\n")
+    test_user_cache()
+
+    # Test session listing pagination over sessions without summary fields
+    print("\n----- Testing Session Cursor -----\n")
+    test_session_cursor()
+
+    # Test read/write routing against a replica-set stand-in (no MongoDB needed)
+    print("\n----- Testing Read/Write Routing -----\n")
+    test_read_write_routing()
+
+    # Test the storage backends against the shared conformance suite
+    print("\n----- Testing Storage Backends -----\n")
+    test_storage_conformance()
+
+    # Test adaptive upstream limits
+    print("\n----- Testing Adaptive Upstream Limits -----\n")
+    test_adaptive_limits()
+
+    # Test the near-duplicate reply cache
+    print("\n----- Testing Semantic Reply Cache -----\n")
+    test_semantic_cache()
+
+    # Test serving persona pictures apart from the catalog records
+    print("\n----- Testing Persona Pictures -----\n")
+    test_persona_pictures()
+
+    # Test the Server-Sent Events framing of a chat turn
+    print("\n----- Testing SSE Events -----\n")
+    test_sse_events()
+
+    # Print summary
+    print("\n===== TEST SUMMARY =====")
+    print(f"Total tests: {test_results['passed'] + test_results['failed']}")
+    print(f"Passed: {test_results['passed']}")
+    print(f"Failed: {test_results['failed']}")
+    print("========================\n")
+
+    # Return overall success/failure
+    return test_results["failed"] == 0
+
+if __name__ == "__main__":
+    run_all_tests()
@@ -124,6 +124,31 @@ def test_bot_matching(user_id):
     
     return None
 
+def test_bot_recommendations(user_id):
+    """Test batched bot recommendations"""
+    if not user_id:
+        log_test_result("Bot Recommendations", False, "Cannot test recommendations without valid user ID")
+        return
+    
+    try:
+        payload = {"user_ids": [user_id, "unknown-user"], "limit": 3}
+        response = requests.post(f"{BACKEND_URL}/bots/recommendations", json=payload)
+        
+        if response.status_code == 200:
+            data = response.json()
+            matches = data.get("recommendations", {}).get(user_id, [])
+            scores = [match["score"] for match in matches]
+            if (len(matches) == 3 and scores == sorted(scores, reverse=True)
+                    and data.get("unknown_user_ids") == ["unknown-user"]):
+                log_test_result("Bot Recommendations", True,
+                               f"Top matches: {', '.join(match['bot_id'] for match in matches)}")
+            else:
+                log_test_result("Bot Recommendations", False, f"Unexpected recommendations response: {data}")
+        else:
+            log_test_result("Bot Recommendations", False, f"Recommendations failed with status code {response.status_code}")
+    except Exception as e:
+        log_test_result("Bot Recommendations", False, f"Exception occurred: {str(e)}")
+
 def test_start_chat_session(user_id, bot_id):
     """Test starting a new chat session"""
     if not user_id or not bot_id:
@@ -159,7 +184,15 @@ def test_get_user_sessions(user_id):
         
         if response.status_code == 200:
             data = response.json()
-            if "sessions" in data:
+            if "sessions" in data and "next_cursor" in data:
+                summary_fields = ["last_active_at", "message_count", "last_message_preview"]
+                missing = [field for session in data["sessions"] for field in summary_fields if field not in session]
+                if missing:
+                    log_test_result("Get User Sessions", False, f"Sessions missing summary fields: {sorted(set(missing))}")
+                    return None
+                if any("messages" in session for session in data["sessions"]):
+                    log_test_result("Get User Sessions", False, "Session listing should not include message bodies")
+                    return None
                 log_test_result("Get User Sessions", True, 
                                f"Retrieved {len(data['sessions'])} chat sessions for user")
                 return data["sessions"]
@@ -204,6 +237,33 @@ def test_get_chat_messages(session_id):
     
     return None
 
+def test_export_messages(user_id):
+    """Test streaming NDJSON export of a user's chat history"""
+    if not user_id:
+        log_test_result("Export Messages", False, "Cannot test export without valid user ID")
+        return
+    
+    try:
+        response = requests.get(f"{BACKEND_URL}/admin/export/messages", params={"user_id": user_id}, stream=True)
+        
+        if response.status_code == 200:
+            records = [json.loads(line) for line in response.iter_lines() if line]
+            messages = [record for record in records if record["type"] == "message"]
+            if messages and records[-1]["type"] == "checkpoint" and all(m["user_id"] == user_id for m in messages):
+                # Resuming from the final checkpoint must not return anything new
+                resumed = requests.get(f"{BACKEND_URL}/admin/export/messages",
+                                       params={"user_id": user_id, "cursor": records[-1]["cursor"]})
+                if resumed.status_code == 200 and not resumed.content.strip():
+                    log_test_result("Export Messages", True, f"Exported {len(messages)} messages with a final checkpoint")
+                else:
+                    log_test_result("Export Messages", False, "Resuming from the final checkpoint returned data")
+            else:
+                log_test_result("Export Messages", False, f"Unexpected export body: {records[:3]}")
+        else:
+            log_test_result("Export Messages", False, f"Export failed with status code {response.status_code}")
+    except Exception as e:
+        log_test_result("Export Messages", False, f"Exception occurred: {str(e)}")
+
 def get_websocket_url(session_id, user_id):
     """Get WebSocket URL from backend URL"""
     # Extract the host and port from BACKEND_URL
@@ -362,6 +422,83 @@ def test_content_moderation(session_id, user_id):
         log_test_result("Content Moderation", False, "Content moderation system failed to detect violation keywords")
         return False
 
+def test_sse_chat(session_id, user_id):
+    """Test sending a message over /api/chat/stream and reading the reply as Server-Sent Events"""
+    try:
+        # One session, so both turns can reuse the same keep-alive connection
+        with requests.Session() as http:
+            events = []
+            for content in ("Hi! What are you up to today?", "And what about tomorrow?"):
+                response = http.post(f"{BACKEND_URL}/chat/stream", params={"user_id": user_id},
+                                     json={"content": content, "session_id": session_id}, stream=True, timeout=30)
+                if response.status_code != 200:
+                    log_test_result("SSE Chat", False, f"SSE chat failed with status code {response.status_code}")
+                    return False
+                if not response.headers.get("content-type", "").startswith("text/event-stream"):
+                    log_test_result("SSE Chat", False, f"Unexpected content type {response.headers.get('content-type')}")
+                    return False
+                event = None
+                for line in response.iter_lines(decode_unicode=True):
+                    if line.startswith("event: "):
+                        event = line[len("event: "):]
+                    elif line.startswith("data: "):
+                        events.append((event, json.loads(line[len("data: "):])))
+        
+        if len(events) == 2 and all(name == "message" and data.get("content") for name, data in events):
+            log_test_result("SSE Chat", True, f"Received {len(events)} replies, last from {events[-1][1].get('bot_name')}")
+            return True
+        log_test_result("SSE Chat", False, f"Unexpected SSE events: {events}")
+        return False
+    except Exception as e:
+        log_test_result("SSE Chat", False, f"Exception occurred: {str(e)}")
+        return False
+
+def test_disconnect_mid_turn(session_id, user_id):
+    """Test that a client leaving mid-turn keeps its message and the cancellation is counted"""
+    try:
+        before = requests.get(f"{BACKEND_URL}/chat/messages/{session_id}").json().get("messages", [])
+        
+        ws = websocket.create_connection(get_websocket_url(session_id, user_id), timeout=10)
+        ws.send(json.dumps({"content": "Tell me about your favourite place, I have to run though"}))
+        ws.close()
+        time.sleep(2)
+        
+        metrics = requests.get(f"{BACKEND_URL}/admin/turn-metrics").json()
+        after = requests.get(f"{BACKEND_URL}/chat/messages/{session_id}").json().get("messages", [])
+        
+        if "turns_cancelled" not in metrics:
+            log_test_result("Disconnect Mid-Turn", False, "Turn metrics missing turns_cancelled")
+        elif len(after) != len(before) + 1:
+            log_test_result("Disconnect Mid-Turn", False,
+                           f"Expected one more message after disconnect, got {len(after) - len(before)}")
+        else:
+            last = after[-1]
+            outcome = "interrupted" if last.get("interrupted") else "answered"
+            log_test_result("Disconnect Mid-Turn", True,
+                           f"Message persisted ({outcome}), turns cancelled so far: {metrics['turns_cancelled']}, "
+                           f"cancellation stats: {metrics.get('cancellation')}")
+    except Exception as e:
+        log_test_result("Disconnect Mid-Turn", False, f"Exception occurred: {str(e)}")
+
+def test_connection_stats():
+    """Test the live WebSocket connection statistics endpoint"""
+    try:
+        response = requests.get(f"{BACKEND_URL}/admin/connections")
+        
+        if response.status_code == 200:
+            data = response.json()
+            expected = ("active_connections", "active_sessions", "active_users", "frames_sent")
+            if all(key in data for key in expected):
+                log_test_result("Connection Stats", True,
+                               f"{data['active_connections']} sockets across {data['active_users']} users, "
+                               f"{data['frames_sent']} frames sent")
+            else:
+                log_test_result("Connection Stats", False, f"Connection stats missing fields: {data}")
+        else:
+            log_test_result("Connection Stats", False, f"Connection stats failed with status code {response.status_code}")
+    except Exception as e:
+        log_test_result("Connection Stats", False, f"Exception occurred: {str(e)}")
+
 def test_protection_status():
     """Test the protection status endpoint"""
     try:
@@ -378,6 +515,16 @@ def test_protection_status():
                     service_status = data["ai_service_status"]
                     message += f", {stats.get('proxies_available', 0)} proxies available"
                     
+                    if "coalescing_stats" not in data:
+                        log_test_result("Protection Status", False, "Protection status response missing coalescing stats")
+                        return None
+                    message += f", {data['coalescing_stats'].get('upstream_calls_saved', 0)} upstream calls saved by coalescing"
+                    
+                    if "adaptive_limits" not in stats:
+                        log_test_result("Protection Status", False, "Protection status response missing adaptive limits")
+                        return None
+                    message += f", adaptive limits on {len(stats['adaptive_limits']['limits'])} API keys"
+                    
                 log_test_result("Protection Status", True, message)
                 return data
             else:
@@ -505,6 +652,7 @@ def run_all_tests():
     if user_id and bot_profiles:
         # Test bot matching
         matched_bot = test_bot_matching(user_id)
+        test_bot_recommendations(user_id)
         
         if matched_bot:
             # Test starting chat session
@@ -520,8 +668,18 @@ def run_all_tests():
                 # Test WebSocket chat
                 test_websocket_chat(session_id, user_id)
                 
+                # Test the Server-Sent Events alternative to the WebSocket
+                test_sse_chat(session_id, user_id)
+                
+                # Test leaving while the bot is still answering
+                test_disconnect_mid_turn(session_id, user_id)
+                test_connection_stats()
+                
                 # Test content moderation
                 test_content_moderation(session_id, user_id)
+                
+                # Test streaming export of the conversation
+                test_export_messages(user_id)
     
     # Print summary
     print("\n===== TEST SUMMARY =====")
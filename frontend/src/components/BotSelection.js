@@ -4,6 +4,10 @@ import { ArrowLeft, MessageCircle, Sparkles, LogOut, Users, RefreshCw } from 'lu
 import toast from 'react-hot-toast';
 import axios from 'axios';
 
+// Profile pictures are served by the backend at the URL each bot profile carries
+const profilePictureSrc = (bot) =>
+  `${process.env.REACT_APP_BACKEND_URL || 'http://localhost:8001'}${bot.profile_picture_url}`;
+
 const BotSelection = ({ user, onSessionStarted, onLogout }) => {
   const navigate = useNavigate();
   const [botProfiles, setBotProfiles] = useState([]);
@@ -75,7 +79,7 @@ const BotSelection = ({ user, onSessionStarted, onLogout }) => {
       <div className="flex items-start space-x-4">
         <div className="relative">
           <img
-            src={`data:image/jpeg;base64,${bot.profile_picture}`}
+            src={profilePictureSrc(bot)}
             alt={bot.name}
             className="bot-profile-pic profile-picture"
             onError={(e) => {
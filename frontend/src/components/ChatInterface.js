@@ -4,6 +4,10 @@ import { ArrowLeft, Send, MoreVertical, Phone, Video } from 'lucide-react';
 import toast from 'react-hot-toast';
 import { v4 as uuidv4 } from 'uuid';
 
+// Profile pictures are served by the backend at the URL each bot profile carries
+const profilePictureSrc = (bot) =>
+  `${process.env.REACT_APP_BACKEND_URL || 'http://localhost:8001'}${bot.profile_picture_url}`;
+
 const ChatInterface = ({ user, session, onBackToSelection }) => {
   const navigate = useNavigate();
   const { sessionId } = useParams();
@@ -55,6 +59,9 @@ const ChatInterface = ({ user, session, onBackToSelection }) => {
           }]);
         } else if (data.type === 'moderation_warning') {
           toast.error(data.message);
+        } else if (data.type === 'ping') {
+          // Server heartbeat: answer so the connection isn't reaped as dead
+          ws.send(JSON.stringify({ type: 'pong' }));
         }
       };
       
@@ -163,7 +170,7 @@ const ChatInterface = ({ user, session, onBackToSelection }) => {
   const TypingIndicator = () => (
     <div className="flex items-center space-x-2 p-4">
       <img
-        src={`data:image/jpeg;base64,${session.bot_profile.profile_picture}`}
+        src={profilePictureSrc(session.bot_profile)}
         alt={session.bot_profile.name}
         className="w-8 h-8 rounded-full"
         onError={(e) => {
@@ -196,7 +203,7 @@ const ChatInterface = ({ user, session, onBackToSelection }) => {
           </button>
           
           <img
-            src={`data:image/jpeg;base64,${session.bot_profile.profile_picture}`}
+            src={profilePictureSrc(session.bot_profile)}
             alt={session.bot_profile.name}
             className="w-10 h-10 rounded-full border-2 border-white/20"
             onError={(e) => {
@@ -245,7 +252,7 @@ const ChatInterface = ({ user, session, onBackToSelection }) => {
           >
             {message.type === 'bot' && (
               <img
-                src={`data:image/jpeg;base64,${session.bot_profile.profile_picture}`}
+                src={profilePictureSrc(session.bot_profile)}
                 alt={session.bot_profile.name}
                 className="w-8 h-8 rounded-full mr-2 mt-1"
                 onError={(e) => {
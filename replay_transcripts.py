@@ -0,0 +1,95 @@
+#!/usr/bin/env python3
+import argparse
+import asyncio
+import json
+import os
+
+# Importing the benchmark helpers also puts backend/ on the path
+from backend_benchmark import load_bot_profiles, log_benchmark_result, make_mock_service_manager
+
+
+def build_service_manager(args):
+    """An AIServiceManager on the mock provider, configured like the deployment under test"""
+    mock_options = {"request_latency": args.latency, "per_item_latency": args.per_item_latency}
+    # Per-minute quotas tick as fast as the replayed traffic
+    if args.speedup > 0:
+        mock_options["quota_window_seconds"] = 60.0 / args.speedup
+    if args.no_quotas:
+        mock_options["quotas"] = {}
+    if args.max_concurrent_requests:
+        mock_options["max_concurrent_requests"] = args.max_concurrent_requests
+
+    manager = make_mock_service_manager(args.provider, **mock_options)
+    manager.coalescing_enabled = args.coalescing
+    if args.micro_batching:
+        manager.enable_micro_batching(max_batch_size=args.batch_size, max_wait_ms=args.batch_wait_ms)
+    return manager
+
+
+async def load_transcripts(args, bot_ids):
+    from transcript_replay import load_fixture, load_from_collection, synthetic_transcripts
+
+    if args.fixture:
+        return load_fixture(args.fixture)
+    if args.mongo:
+        from motor.motor_asyncio import AsyncIOMotorClient
+        client = AsyncIOMotorClient(os.environ.get("MONGO_URL", "mongodb://localhost:27017"))
+        try:
+            db = client.chatapp
+            return await load_from_collection(db.chat_sessions, db.chat_archives, limit=args.limit, bot_id=args.bot_id)
+        finally:
+            client.close()
+    return synthetic_transcripts(bot_ids, sessions=args.limit)
+
+
+async def main(args):
+    from transcript_replay import TranscriptReplayer
+
+    bot_profiles = {profile["bot_id"]: profile for profile in load_bot_profiles()}
+    transcripts = await load_transcripts(args, list(bot_profiles))
+
+    replayer = TranscriptReplayer(
+        build_service_manager(args),
+        bot_profiles,
+        concurrency=args.concurrency,
+        speedup=args.speedup,
+        context_window=args.context_window,
+        deadline_seconds=args.deadline
+    )
+    report = await replayer.run(transcripts)
+
+    if args.json:
+        print(json.dumps(report))
+    else:
+        source = args.fixture or ("chat_sessions" if args.mongo else "synthetic")
+        log_benchmark_result(f"Transcript replay [{source}, {args.provider}, x{args.speedup:g}]", report)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Replay recorded conversations through the AI service pipeline against the mock providers"
+    )
+    source = parser.add_mutually_exclusive_group()
+    source.add_argument("--fixture", help="JSON list of chat_sessions documents, or an NDJSON message export")
+    source.add_argument("--mongo", action="store_true", help="Read recorded sessions from MONGO_URL's chat_sessions")
+    parser.add_argument("--limit", type=int, default=200, help="Sessions to read from MongoDB or to synthesize")
+    parser.add_argument("--bot-id", help="Only replay sessions with this bot (MongoDB source)")
+
+    parser.add_argument("--concurrency", type=int, default=50, help="Turns generating at once")
+    parser.add_argument("--speedup", type=float, default=60.0,
+                        help="Compress recorded gaps by this factor; 0 replays turns back to back")
+    parser.add_argument("--context-window", type=int, default=10, help="Previous messages passed as context")
+    parser.add_argument("--deadline", type=float, help="Per-turn deadline in seconds")
+
+    parser.add_argument("--provider", default="huggingface", choices=["gemini", "deepinfra", "huggingface", "openai"])
+    parser.add_argument("--latency", type=float, default=0.05, help="Mock upstream latency per request (s)")
+    parser.add_argument("--per-item-latency", type=float, default=0.005, help="Extra mock latency per batched input (s)")
+    parser.add_argument("--max-concurrent-requests", type=int, help="Mock upstream concurrent request limit")
+    parser.add_argument("--no-quotas", action="store_true", help="Disable the mock per-minute quotas")
+    parser.add_argument("--coalescing", action="store_true", help="Enable single-flight request coalescing")
+    parser.add_argument("--micro-batching", action="store_true", help="Enable Hugging Face / DeepInfra micro-batching")
+    parser.add_argument("--batch-size", type=int, default=8)
+    parser.add_argument("--batch-wait-ms", type=float, default=15.0)
+
+    parser.add_argument("--json", action="store_true", help="Print the report as one JSON object")
+    asyncio.run(main(parser.parse_args()))